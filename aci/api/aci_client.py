@@ -1,105 +1,951 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 import requests
+from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.exceptions import InsecureRequestWarning  # type: ignore
 from rich.console import Console
+from aci.api.governor import AdaptiveLimiter, parse_retry_after
+from aci.api.stream import iter_imdata
+from aci.api.planner import ClassQuery, Filter, active_planner
+from aci.api.shards import ShardPlan, run_shards
+from aci.api.cache import CACHE_TTLS, cached_query
 console = Console()
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)  # type: ignore
 
+DEFAULT_POOL_SIZE = 16
+DEFAULT_PAGE_SIZE = 5000
+STREAM_CHUNK_SIZE = 64 * 1024
+# Refresh the APIC token with aaaRefresh this many seconds before it expires.
+TOKEN_REFRESH_MARGIN = 60
+# A cluster member that timed out or refused a connection is skipped for this long.
+MEMBER_COOLDOWN = 60
+# Weight of the newest sample in each member's latency average.
+LATENCY_EWMA_WEIGHT = 0.3
+# How often a throttled (429/503) query is retried after its Retry-After.
+THROTTLE_RETRIES = 3
+# Per-query (connect, read) timeouts; the read timeout is capped by what is
+# left of the run's deadline budget.
+CONNECT_TIMEOUT = 10
+QUERY_TIMEOUT = 60
+# Retries of a GET that failed on every member or returned a transient
+# server error, with exponential backoff (plus jitter) between attempts.
+QUERY_RETRIES = 2
+RETRYABLE_STATUS = (500, 502, 504)
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+# Hedging: a query still unanswered after the p95 latency of its kind is
+# duplicated to another cluster member and the first answer wins.
+HEDGE_QUERIES = True
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+
+class DeadlineExceeded(TimeoutError):
+    """The run's deadline budget ran out before a query could finish."""
+
+# Attributes the snapshot/compare pipeline actually reads, per class.
+# The APIC cannot return an arbitrary property list, so classes whose
+# consumers only need naming properties are requested with
+# rsp-prop-include=naming-only, and every MO is trimmed to this table
+# as it is received, before it reaches the snapshot file.
+SNAPSHOT_PROPERTIES = {
+    "fabricHealthTotal": ("dn", "cur"),
+    "faultInst": ("dn", "code", "created", "severity", "descr"),
+    "l1PhysIf": ("dn", "id", "descr", "switchingSt"),
+    # rn is what identifies these when they come back as l1PhysIf children
+    "ethpmPhysIf": ("dn", "rn", "operSt", "operStQual"),
+    "rmonEtherStats": ("dn", "rn", "cRCAlignErrors"),
+    "rmonEgrCounters": ("dn", "rn", "bufferdroppkts"),
+    "rmonIfOut": ("dn", "rn", "errors"),
+    "fvCEp": ("dn", "mac", "encap", "fabricPathDn"),
+    "fvIp": ("dn", "addr"),
+    "fvAEPg": ("dn", "descr"),
+    "uribv4Route": ("dn",),
+    "fabricPathEp": ("dn", "name"),
+    "fabricRsPathToIf": ("tDn",),
+    "pcAggrIf": ("dn", "id", "name"),
+    "pcRsMbrIfs": ("tDn",),
+}
+NAMING_ONLY_CLASSES = {"uribv4Route", "fabricPathEp"}
+
+
+class APICClient:
+    """Pooled keep-alive HTTPS session to a single APIC.
+
+    `scheme` is "https" for a real APIC; "http" reaches a local stand-in
+    (and its ws:// event channel) in tests.
+    """
+
+    def __init__(
+        self, apic_ip, cookies=None, pool_size=DEFAULT_POOL_SIZE, verify=False, scheme="https"
+    ):
+        self.apic_ip = apic_ip
+        self.scheme = scheme
+        self.base_url = f"{scheme}://{apic_ip}"
+        self.pool_size = pool_size
+
+        self.session = requests.Session()
+        self.session.verify = verify
+        # One connection pool per cluster member.
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size)
+        self.session.mount(f"{scheme}://", adapter)
+        if cookies:
+            self.attach_cookies(cookies)
+
+        # Token state, shared by every tool that uses this client.
+        self.auth_lock = threading.RLock()
+        self.username = None
+        self.token_expires = 0.0
+
+        # Read queries are spread over the healthy cluster members; the
+        # inventory APIC is always the first one and handles auth.
+        self.members = [self.base_url]
+        self.members_discovered = False
+        self._member_lock = threading.Lock()
+        self._member_stats = {}
+        self._limiters = {}
+
+        # Deadline of the current run (monotonic time), per thread since
+        # tools share the client, and the recent time-to-response of each
+        # kind of query, for hedging.
+        self._deadline = threading.local()
+        self.hedge = HEDGE_QUERIES
+        self.hedged = 0
+        self._latencies = {}
+        self._hedge_pool = None
+
+    def attach_cookies(self, cookies):
+        """Attach the APIC session cookies to the pooled session."""
+        self.session.cookies.update(cookies)
+
+    def token(self):
+        """Current APIC-cookie value, whichever member set it."""
+        value = None
+        for cookie in self.session.cookies:
+            if cookie.name == "APIC-cookie":
+                value = cookie.value
+        return value
+
+    def url(self, path):
+        return path if path.startswith("http") else f"{self.base_url}{path}"
+
+    def login(self, username, password, timeout=30):
+        """Run aaaLogin over the pooled session and return the response."""
+        payload = {"aaaUser": {"attributes": {"name": username, "pwd": password}}}
+        response = self.session.post(
+            self.url("/api/aaaLogin.json"), json=payload, timeout=timeout
+        )
+        if response.status_code == 200 and self._record_token(response):
+            self.username = username
+        else:
+            self.token_expires = 0.0
+        return response
+
+    def _record_token(self, response):
+        """Note the token lifetime from an aaaLogin/aaaRefresh response."""
+        try:
+            attrs = response.json()["imdata"][0]["aaaLogin"]["attributes"]
+        except (ValueError, KeyError, IndexError, TypeError):
+            return False
+        ttl = int(attrs.get("refreshTimeoutSeconds") or 600)
+        self.token_expires = time.monotonic() + ttl
+        return True
+
+    def refresh(self, timeout=30):
+        """Extend the current token with aaaRefresh."""
+        response = self.session.get(self.url("/api/aaaRefresh.json"), timeout=timeout)
+        if response.status_code != 200 or not self._record_token(response):
+            self.token_expires = 0.0
+        return response
+
+    def refresh_if_due(self):
+        """Refresh the token when it is about to expire."""
+        if not self.token_expires:
+            return
+        if time.monotonic() < self.token_expires - TOKEN_REFRESH_MARGIN:
+            return
+        with self.auth_lock:
+            now = time.monotonic()
+            if self.token_expires and now < self.token_expires:
+                if now >= self.token_expires - TOKEN_REFRESH_MARGIN:
+                    self.refresh()
+            else:
+                self.token_expires = 0.0
+
+    def cached_cookies(self, username):
+        """Return the session cookies if a token for username is still valid.
+
+        A refresh that fails drops the token, so the caller logs in again.
+        """
+        if self.username != username or not self.token_expires:
+            return None
+        try:
+            self.refresh_if_due()
+        except requests.exceptions.RequestException as e:
+            console.print(
+                f"[yellow]⚠ Token refresh on {self.apic_ip} failed ({e}); logging in again[/yellow]"
+            )
+            self.token_expires = 0.0
+            return None
+        if time.monotonic() >= self.token_expires:
+            return None
+        return self.session.cookies
+
+    # -------------------- Cluster members -------------------- #
+
+    def discover_members(self):
+        """Find the healthy APIC cluster members to spread read queries over.
+
+        Uses the infraWiNode cluster view for health and the controller
+        topSystem objects for their out-of-band addresses.
+        """
+        if self.members_discovered:
+            return self.members
+        self.members_discovered = True
+        try:
+            wi = self.get_json(
+                "/api/node/mo/topology/pod-1/node-1.json",
+                params={"query-target": "subtree", "target-subtree-class": "infraWiNode"},
+                spread=False,
+            )
+            top = self.get_json(
+                "/api/node/class/topSystem.json",
+                params={"query-target-filter": 'eq(topSystem.role,"controller")'},
+                spread=False,
+            )
+        except Exception as e:
+            console.print(f"[yellow]⚠ APIC cluster discovery failed on {self.apic_ip}: {e}[/yellow]")
+            return self.members
+
+        healthy = set()
+        for item in wi.get("imdata", []):
+            attrs = item.get("infraWiNode", {}).get("attributes", {})
+            if attrs.get("health") == "fully-fit" and attrs.get("operSt") == "available":
+                healthy.add(str(attrs.get("id", "")))
+
+        members = [self.base_url]
+        for item in top.get("imdata", []):
+            attrs = item.get("topSystem", {}).get("attributes", {})
+            addr = (attrs.get("oobMgmtAddr") or "").split("/")[0]
+            if str(attrs.get("id", "")) not in healthy or addr in ("", "0.0.0.0"):
+                continue
+            url = f"{self.scheme}://{addr}"
+            if addr != self.apic_ip and url not in members:
+                members.append(url)
+
+        with self._member_lock:
+            self.members = members
+        if len(members) > 1:
+            console.print(
+                f"[green]✓ Spreading queries over {len(members)} APIC cluster members of {self.apic_ip}.[/green]"
+            )
+        return members
+
+    def _stats(self, member):
+        return self._member_stats.setdefault(
+            member, {"in_flight": 0, "latency": 0.0, "down_until": 0.0}
+        )
+
+    def limiter(self, member):
+        """Concurrency governor of one controller, created on first use."""
+        with self._member_lock:
+            limiter = self._limiters.get(member)
+            if limiter is None:
+                limiter = AdaptiveLimiter(max_limit=self.pool_size)
+                self._limiters[member] = limiter
+            return limiter
+
+    def metrics(self):
+        """Current concurrency limit, queue depth and latency per controller."""
+        with self._member_lock:
+            limiters = dict(self._limiters)
+            latency = {m: stats["latency"] for m, stats in self._member_stats.items()}
+        return {
+            member: dict(limiter.metrics(), latency=round(latency.get(member, 0.0), 3))
+            for member, limiter in limiters.items()
+        }
+
+    @property
+    def deadline(self):
+        """Deadline (monotonic time) of the calling thread's budget, None when unbounded."""
+        return getattr(self._deadline, "value", None)
+
+    @deadline.setter
+    def deadline(self, value):
+        self._deadline.value = value
+
+    def with_deadline(self, fn):
+        """Wrap `fn` to run under the calling thread's deadline on any thread.
+
+        Used for work handed to thread pools, which would otherwise run
+        without the budget of the thread that submitted it.
+        """
+        deadline = self.deadline
+
+        def run(*args, **kwargs):
+            previous = self.deadline
+            self.deadline = deadline
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.deadline = previous
+
+        return run
+
+    @contextmanager
+    def deadline_budget(self, seconds):
+        """Bound every query made in this block, on this thread, by a shared deadline.
+
+        An enclosing budget that ends sooner still applies. Work handed to
+        other threads keeps the budget when wrapped with with_deadline.
+        """
+        previous = self.deadline
+        deadline = time.monotonic() + seconds if seconds else None
+        if previous is not None and (deadline is None or previous < deadline):
+            deadline = previous
+        self.deadline = deadline
+        try:
+            yield
+        finally:
+            self.deadline = previous
+
+    def remaining(self):
+        """Seconds left in the current deadline budget, None when unbounded."""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def check_deadline(self):
+        left = self.remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded(f"Deadline budget for {self.apic_ip} exhausted")
+
+    def _timeout(self, timeout):
+        """Per-request timeout, capped by the remaining budget."""
+        if timeout is None:
+            timeout = (CONNECT_TIMEOUT, QUERY_TIMEOUT)
+        left = self.remaining()
+        if left is None:
+            return timeout
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        return (min(connect, left), min(read, left))
+
+    def _backoff(self, attempt):
+        """Sleep before retry `attempt`, never past the deadline."""
+        pause = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+        pause *= 0.5 + random.random() / 2
+        left = self.remaining()
+        if left is not None and left <= pause:
+            raise DeadlineExceeded(f"Deadline budget for {self.apic_ip} exhausted")
+        time.sleep(pause)
+
+    @staticmethod
+    def _is_probe(params):
+        # Count pre-flights and one-MO probes answer far faster than a data
+        # page of the same path; they would make every real page look slow.
+        params = params or {}
+        return params.get("rsp-subtree-include") == "count" or str(params.get("page-size")) == "1"
+
+    @staticmethod
+    def _latency_key(path, params):
+        # Pages of a query share a kind; a count pre-flight is its own kind.
+        return (path, tuple(sorted(k for k in (params or {}) if k != "page")))
+
+    def _record_latency(self, key, elapsed):
+        with self._member_lock:
+            samples = self._latencies.get(key)
+            if samples is None:
+                samples = self._latencies[key] = deque(maxlen=LATENCY_WINDOW)
+            samples.append(elapsed)
+
+    def hedge_delay(self, path, params):
+        """p95 time-to-response of this kind of query, None until known."""
+        with self._member_lock:
+            samples = sorted(self._latencies.get(self._latency_key(path, params), ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[int(len(samples) * 0.95) - 1]
+
+    def _pick_member(self, exclude=(), spread=True):
+        """Least-outstanding member, weighted by its recent latency."""
+        now = time.monotonic()
+        with self._member_lock:
+            if not spread or len(self.members) == 1:
+                member = self.base_url
+            else:
+                candidates = [m for m in self.members if m not in exclude]
+                up = [m for m in candidates if self._stats(m)["down_until"] <= now]
+                member = min(
+                    up or candidates,
+                    key=lambda m: (self._stats(m)["in_flight"] + 1)
+                    * (self._stats(m)["latency"] or 0.001),
+                )
+            self._stats(member)["in_flight"] += 1
+            return member
+
+    def _release_member(self, member, elapsed=None, failed=False):
+        with self._member_lock:
+            stats = self._stats(member)
+            stats["in_flight"] -= 1
+            if failed:
+                stats["down_until"] = time.monotonic() + MEMBER_COOLDOWN
+            elif elapsed is not None:
+                stats["latency"] = (
+                    elapsed
+                    if not stats["latency"]
+                    else LATENCY_EWMA_WEIGHT * elapsed
+                    + (1 - LATENCY_EWMA_WEIGHT) * stats["latency"]
+                )
+
+    def _send_to(self, member, path, params, timeout, **kwargs):
+        if member != self.base_url:
+            # The APIC-cookie is scoped to the host that set it; the token
+            # itself is valid on every cluster member.
+            kwargs["cookies"] = {"APIC-cookie": self.token() or ""}
+        limiter = self.limiter(member)
+        if not limiter.acquire(timeout=self.remaining()):
+            self._release_member(member)
+            raise DeadlineExceeded(f"Deadline budget for {self.apic_ip} exhausted")
+        started = time.monotonic()
+        try:
+            response = self.session.get(
+                f"{member}{path}", params=params, timeout=timeout, **kwargs
+            )
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            limiter.release()
+            self._release_member(member, failed=True)
+            raise
+        except Exception:
+            limiter.release()
+            self._release_member(member)
+            raise
+
+        elapsed = time.monotonic() - started
+        if response.status_code in (429, 503):
+            limiter.release(
+                throttled=True,
+                retry_after=parse_retry_after(response.headers.get("Retry-After")),
+            )
+            self._release_member(member)
+        else:
+            if self._is_probe(params):
+                limiter.release()
+            else:
+                limiter.release(elapsed, key=self._latency_key(path, params))
+            self._release_member(member, elapsed)
+            self._record_latency(self._latency_key(path, params), elapsed)
+        return response
+
+    def get(self, path, params=None, timeout=None, spread=True, **kwargs):
+        """Issue a GET over the pooled session and return the raw response.
+
+        Read queries go to the least busy healthy cluster member; a member
+        that times out or refuses the connection is failed over.
+        ``spread=False`` pins the query to the inventory APIC. Every query
+        passes through the controller's concurrency governor, and throttled
+        ones are retried once its Retry-After pause is over. Queries that
+        fail outright or hit a transient server error are retried with
+        backoff, all within the run's deadline budget (see deadline_budget).
+        """
+        self.refresh_if_due()
+        if path.startswith("http"):
+            return self.session.get(path, params=params, timeout=self._timeout(timeout), **kwargs)
+
+        throttled = 0
+        failed = 0
+        while True:
+            self.check_deadline()
+            try:
+                response = self._get_hedged(path, params, self._timeout(timeout), spread, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if failed >= QUERY_RETRIES:
+                    raise
+                failed += 1
+                self._backoff(failed)
+                continue
+
+            if response.status_code in (429, 503) and throttled < THROTTLE_RETRIES:
+                throttled += 1
+                response.close()
+                continue
+            if response.status_code in RETRYABLE_STATUS and failed < QUERY_RETRIES:
+                failed += 1
+                response.close()
+                self._backoff(failed)
+                continue
+            return response
+
+    def _get_hedged(self, path, params, timeout, spread, **kwargs):
+        """Send a query, duplicating it to another member if it runs past its p95."""
+        delay = self.hedge_delay(path, params) if self.hedge and spread else None
+        if delay is None or len(self.members) < 2:
+            return self._get_with_failover(path, params, timeout, spread, **kwargs)
+
+        with self._member_lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(max_workers=self.pool_size)
+            pool = self._hedge_pool
+        member = self._pick_member()
+        pending = {
+            pool.submit(self.with_deadline(self._send_to), member, path, params, timeout, **kwargs)
+        }
+        done, _ = wait(pending, timeout=delay)
+        if done and next(iter(done)).exception() is None:
+            return next(iter(done)).result()
+
+        pending.add(
+            pool.submit(
+                self.with_deadline(self._get_with_failover),
+                path,
+                params,
+                timeout,
+                spread,
+                exclude=(member,),
+                **kwargs,
+            )
+        )
+        if not done:
+            self.hedged += 1
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                # The slower copy is discarded whenever it comes back.
+                for loser in pending:
+                    loser.add_done_callback(_close_response)
+                return future.result()
+        raise error
+
+    def _get_with_failover(self, path, params, timeout, spread, exclude=(), **kwargs):
+        tried = list(exclude)
+        while True:
+            member = self._pick_member(tried, spread)
+            tried.append(member)
+            try:
+                return self._send_to(member, path, params, timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if not spread or len(tried) >= len(self.members):
+                    raise
+                console.print(
+                    f"[yellow]⚠ APIC member {member} did not answer, retrying on another member[/yellow]"
+                )
+
+    def get_json(self, path, params=None, timeout=None, **kwargs):
+        """GET a REST path and return the decoded JSON body."""
+        r = self.get(path, params=params, timeout=timeout, **kwargs)
+        r.raise_for_status()
+        return r.json()
+
+    def count_class(self, class_name, params=None):
+        """Return how many MOs a class query would return, without fetching them."""
+        query = dict(params or {})
+        query["rsp-subtree-include"] = "count"
+        data = self.get_json(f"/api/node/class/{class_name}.json", params=query)
+        imdata = data.get("imdata", [])
+        if not imdata:
+            return 0
+        return int(imdata[0]["moCount"]["attributes"]["count"])
+
+    def iter_imdata(self, path, params=None, timeout=None, **kwargs):
+        """Stream a query's imdata, decoding and yielding one MO at a time."""
+        r = self.get(path, params=params, timeout=timeout, stream=True, **kwargs)
+        try:
+            r.raise_for_status()
+            yield from iter_imdata(self._within_deadline(r.iter_content(chunk_size=STREAM_CHUNK_SIZE)))
+        finally:
+            r.close()
+
+    def _within_deadline(self, chunks):
+        # The read timeout only bounds the gap between chunks; the budget
+        # bounds the whole body.
+        for chunk in chunks:
+            self.check_deadline()
+            yield chunk
+
+    def iter_class(self, class_name, params=None, page_size=DEFAULT_PAGE_SIZE):
+        """Yield every MO of a class query, one at a time.
+
+        A count pre-flight sizes the query; classes that fit in one page are
+        fetched with a single plain request, larger ones page by page. Each
+        response is decoded incrementally.
+        """
+        path = f"/api/node/class/{class_name}.json"
+        filter_params = {
+            k: v for k, v in (params or {}).items() if k == "query-target-filter"
+        }
+        total = self.count_class(class_name, filter_params)
+        if total <= page_size:
+            yield from self.iter_imdata(path, params=params)
+            return
+
+        query = dict(params or {})
+        query["order-by"] = f"{class_name}.dn"
+        query["page-size"] = page_size
+        page = 0
+        while True:
+            query["page"] = page
+            received = 0
+            for mo in self.iter_imdata(path, params=query):
+                received += 1
+                yield mo
+            # Keep going past the pre-flight estimate while pages come back
+            # full, so MOs created during the walk are not cut off.
+            if received < page_size:
+                break
+            page += 1
+
+    def close(self):
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False)
+        self.session.close()
+
+
+def _close_response(future):
+    if future.exception() is None:
+        future.result().close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(apic_ip, cookies=None, pool_size=DEFAULT_POOL_SIZE, scheme="https"):
+    """Return the process-wide pooled client for an APIC, creating it once."""
+    with _clients_lock:
+        client = _clients.get(apic_ip)
+        if client is None:
+            client = APICClient(apic_ip, pool_size=pool_size, scheme=scheme)
+            _clients[apic_ip] = client
+    if cookies:
+        client.attach_cookies(cookies)
+    return client
+
+
+def client_metrics():
+    """Per-controller metrics (see APICClient.metrics) of every pooled client, by APIC."""
+    with _clients_lock:
+        clients = dict(_clients)
+    return {apic_ip: client.metrics() for apic_ip, client in clients.items()}
+
+
+def close_clients():
+    """Close every pooled APIC session opened in this process."""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
 
 def login(apic_ip, username, password):
-    url = f"https://{apic_ip}/api/aaaLogin.json"
-    payload = {"aaaUser": {"attributes": {"name": username, "pwd": password}}}
-    response = requests.post(url, json=payload, verify=False)
+    response = get_client(apic_ip).login(username, password)
     response.raise_for_status()
     return response.cookies, apic_ip
 
 
-def get_fabric_health(cookies, apic_ip):
-    url = f"https://{apic_ip}/api/node/class/fabricHealthTotal.json"
-    r = requests.get(url, cookies=cookies, verify=False)
-    console.print(f"[green]✓ Fabric health data retrieved from {apic_ip}.[/green]")
-    return int(r.json()["imdata"][0]["fabricHealthTotal"]["attributes"]["cur"])
+def project_mo(mo, properties=None):
+    """Trim an MO and its children to the attributes listed for their class."""
+    properties = SNAPSHOT_PROPERTIES if properties is None else properties
+    class_name, body = next(iter(mo.items()))
+    attrs = body.get("attributes", {})
+    keep = properties.get(class_name)
+    out = {
+        "attributes": attrs
+        if keep is None
+        else {k: attrs[k] for k in keep if k in attrs}
+    }
+    children = body.get("children")
+    if children:
+        out["children"] = [project_mo(child, properties) for child in children]
+    return {class_name: out}
+
+
+def _snapshot_params(class_name, params=None):
+    query = dict(params or {})
+    if class_name in NAMING_ONLY_CLASSES:
+        query["rsp-prop-include"] = "naming-only"
+    return query
+
+
+def iter_snapshot_mos(client, class_name, params=None, page_size=DEFAULT_PAGE_SIZE):
+    """Yield the MOs of a snapshot class query one by one, projected to SNAPSHOT_PROPERTIES."""
+    for mo in client.iter_class(
+        class_name, _snapshot_params(class_name, params), page_size=page_size
+    ):
+        yield project_mo(mo)
+
+
+def get_snapshot_class(client, class_name, params=None):
+    """Fetch a snapshot class query in one request, projected to SNAPSHOT_PROPERTIES.
+
+    The response is decoded one MO at a time and each MO is projected
+    before the next is read, so the raw body is never held as a whole.
+    """
+    return [
+        project_mo(mo)
+        for mo in client.iter_imdata(
+            f"/api/node/class/{class_name}.json",
+            params=_snapshot_params(class_name, params),
+        )
+    ]
+
+
+# Class queries behind the snapshot getters. Declaring them lets a run-scoped
+# query planner merge them with other tools' needs (see aci.api.planner).
+FABRIC_HEALTH_QUERY = ClassQuery("fabricHealthTotal")
+FAULTS_QUERY = ClassQuery("faultInst", where=Filter("eq", "severity", "critical"))
+INTERFACES_QUERY = ClassQuery("l1PhysIf")
+INTERFACE_ERRORS_QUERY = ClassQuery("ethpmPhysIf")
+CRC_ERRORS_QUERY = ClassQuery("rmonEtherStats")
+DROP_ERRORS_QUERY = ClassQuery("rmonEgrCounters")
+OUTPUT_ERRORS_QUERY = ClassQuery("rmonIfOut")
+# Interface state and counters in one l1PhysIf subtree query
+INTERFACE_COUNTERS_QUERY = ClassQuery(
+    "l1PhysIf",
+    children=("ethpmPhysIf", "rmonEtherStats", "rmonEgrCounters", "rmonIfOut"),
+)
+ENDPOINTS_QUERY = ClassQuery("fvCEp", children=("fvIp",))
+EPGS_QUERY = ClassQuery("fvAEPg")
+URIB_ROUTES_QUERY = ClassQuery("uribv4Route")
+PATH_EP_QUERY = ClassQuery("fabricPathEp", children=("fabricRsPathToIf",))
+PC_AGGR_QUERY = ClassQuery("pcAggrIf", children=("pcRsMbrIfs",))
+
+SNAPSHOT_CLASS_QUERIES = [
+    FABRIC_HEALTH_QUERY,
+    FAULTS_QUERY,
+    INTERFACE_COUNTERS_QUERY,
+    ENDPOINTS_QUERY,
+    EPGS_QUERY,
+    URIB_ROUTES_QUERY,
+    PATH_EP_QUERY,
+    PC_AGGR_QUERY,
+]
+
+
+def load_class_query(client, query):
+    """Fetch a ClassQuery from the APIC in one streamed request, projected."""
+    return get_snapshot_class(client, query.class_name, query.params())
+
 
+def load_class_query_paged(client, query):
+    """Fetch a ClassQuery from the APIC, paginated and projected."""
+    return iter_snapshot_mos(client, query.class_name, query.params())
 
-def get_faults(cookies, apic_ip):
-    url = f'https://{apic_ip}/api/node/class/faultInst.json?query-target-filter=eq(faultInst.severity,"critical")'
-    r = requests.get(url, cookies=cookies, verify=False)
-    console.print(f"[green]✓ Fault data retrieved from {apic_ip}.[/green]")
-    return r.json().get("imdata", [])
 
+# Scope kind each shardable class is read by: switch nodes for the
+# classes that live on the switches, tenants for endpoints.
+SHARD_SCOPES = {"l1PhysIf": "node", "uribv4Route": "node", "fvCEp": "tenant"}
 
-def get_interface_status(cookies, apic_ip):
-    url = f"https://{apic_ip}/api/node/class/l1PhysIf.json"
-    r = requests.get(url, cookies=cookies, verify=False)
-    console.print(f"[green]✓ Interface status data retrieved from {apic_ip}.[/green]")
-    return r.json().get("imdata", [])
 
+SWITCHES_QUERY = ClassQuery("topSystem", where=Filter("ne", "role", "controller"))
 
-def get_endpoints(cookies, apic_ip):
-    url = f"https://{apic_ip}/api/node/class/fvCEp.json"
-    r = requests.get(url, cookies=cookies, verify=False)
-    console.print(f"[green]✓ Endpoint data retrieved from {apic_ip}.[/green]")
-    return r.json().get("imdata", [])
 
+def node_scopes(client):
+    """DNs of the fabric's leaf and spine nodes, e.g. topology/pod-1/node-101."""
+    scopes = []
+    for mo in query_mos(client, SWITCHES_QUERY):
+        dn = mo.get("topSystem", {}).get("attributes", {}).get("dn", "")
+        if dn:
+            scopes.append(dn.rsplit("/sys", 1)[0])
+    return sorted(scopes)
 
-def get_epgs(cookies, apic_ip):
-    url = f"https://{apic_ip}/api/node/class/fvAEPg.json"
-    r = requests.get(url, cookies=cookies, verify=False)
-    console.print(f"[green]✓ EPG data retrieved from {apic_ip}.[/green]")
-    return r.json().get("imdata", [])
 
+def tenant_scopes(client):
+    """DNs of the fabric's tenants, e.g. uni/tn-common."""
+    return sorted(
+        mo["fvTenant"]["attributes"]["dn"]
+        for mo in client.iter_imdata(
+            "/api/node/class/fvTenant.json", params={"rsp-prop-include": "naming-only"}
+        )
+    )
 
-def get_endpoints_with_ip(cookies, apic_ip):
-    url = f"https://{apic_ip}/api/node/class/fvCEp.json?rsp-subtree=children&rsp-subtree-class=fvIp"
-    r = requests.get(url, cookies=cookies, verify=False)
-    console.print(f"[green]✓ Endpoints with IP data retrieved from {apic_ip}.[/green]")
-    return r.json().get("imdata", [])
 
+def shard_plan(client, policy):
+    """Scopes to shard this fabric's large classes by, or None when not worth it."""
+    if policy is None:
+        return None
+    nodes = node_scopes(client)
+    if len(nodes) < policy.min_nodes:
+        return None
+    console.print(
+        f"[cyan]{client.apic_ip}: {len(nodes)} switch nodes, collecting large classes sharded.[/cyan]"
+    )
+    return ShardPlan(policy, {"node": nodes, "tenant": tenant_scopes(client)})
 
-def get_urib_routes(cookies, apic_ip):
-    url = f"https://{apic_ip}/api/node/class/uribv4Route.json"
-    r = requests.get(url, cookies=cookies, verify=False)
-    console.print(f"[green]✓ URIB routes data retrieved from {apic_ip}.[/green]")
-    return r.json().get("imdata", [])
 
+def load_scope_query(client, scope, query):
+    """Fetch a ClassQuery below one scope DN in one streamed request, projected."""
+    params = {
+        "query-target": "subtree",
+        "target-subtree-class": query.class_name,
+        **query.params(),
+    }
+    return [
+        project_mo(mo)
+        for mo in client.iter_imdata(
+            f"/api/node/mo/{scope}.json",
+            params=_snapshot_params(query.class_name, params),
+        )
+    ]
 
-def get_interface_errors(cookies, apic_ip):
-    url = f"https://{apic_ip}/api/node/class/ethpmPhysIf.json"
-    r = requests.get(url, cookies=cookies, verify=False)
-    console.print(f"[green]✓ Interface errors data retrieved from {apic_ip}.[/green]")
-    return r.json().get("imdata", [])
 
+def load_sharded_query(client, query, shards):
+    """Fetch a ClassQuery scope by scope, with the shards run in parallel."""
+    return run_shards(
+        shards.scopes[SHARD_SCOPES[query.class_name]],
+        client.with_deadline(lambda scope: load_scope_query(client, scope, query)),
+        shards.policy,
+        label=f"{query.class_name} on {client.apic_ip}",
+    )
 
-def get_crc_errors(cookies, apic_ip):
+
+def query_mos(client, query, paged=False, shards=None):
+    """Projected MOs of a ClassQuery, served by the run's planner when one is active.
+
+    With a ShardPlan, classes listed in SHARD_SCOPES are read per scope;
+    classes listed in CACHE_TTLS go through the on-disk response cache.
+    """
+    if shards is not None and query.class_name in SHARD_SCOPES:
+        loader = lambda client, query: load_sharded_query(client, query, shards)
+    else:
+        loader = load_class_query_paged if paged else load_class_query
+    if query.class_name in CACHE_TTLS:
+        fetch = loader
+        loader = lambda client, query: cached_query(client, query, fetch)
+    planner = active_planner()
+    if planner is not None:
+        return iter(planner.fetch(client, query, loader))
+    return iter(loader(client, query))
+
+
+def get_fabric_health(client):
+    imdata = list(query_mos(client, FABRIC_HEALTH_QUERY))
+    console.print(f"[green]✓ Fabric health data retrieved from {client.apic_ip}.[/green]")
+    return int(imdata[0]["fabricHealthTotal"]["attributes"]["cur"])
+
+
+def get_faults(client):
+    imdata = list(query_mos(client, FAULTS_QUERY))
+    console.print(f"[green]✓ Fault data retrieved from {client.apic_ip}.[/green]")
+    return imdata
+
+
+def get_interface_status(client, shards=None):
+    imdata = list(query_mos(client, INTERFACES_QUERY, paged=True, shards=shards))
+    console.print(f"[green]✓ Interface status data retrieved from {client.apic_ip}.[/green]")
+    return imdata
+
+
+def get_endpoints(client):
+    imdata = list(query_mos(client, ClassQuery("fvCEp")))
+    console.print(f"[green]✓ Endpoint data retrieved from {client.apic_ip}.[/green]")
+    return imdata
+
+
+def get_epgs(client):
+    imdata = list(query_mos(client, EPGS_QUERY))
+    console.print(f"[green]✓ EPG data retrieved from {client.apic_ip}.[/green]")
+    return imdata
+
+
+def iter_endpoint_mos(client, shards=None):
+    yield from query_mos(client, ENDPOINTS_QUERY, paged=True, shards=shards)
+
+
+def get_endpoints_with_ip(client):
+    imdata = list(iter_endpoint_mos(client))
+    console.print(f"[green]✓ Endpoints with IP data retrieved from {client.apic_ip}.[/green]")
+    return imdata
+
+
+def get_urib_routes(client, shards=None):
+    imdata = list(query_mos(client, URIB_ROUTES_QUERY, paged=True, shards=shards))
+    console.print(f"[green]✓ URIB routes data retrieved from {client.apic_ip}.[/green]")
+    return imdata
+
+
+def get_interface_errors(client):
+    imdata = list(query_mos(client, INTERFACE_ERRORS_QUERY))
+    console.print(f"[green]✓ Interface errors data retrieved from {client.apic_ip}.[/green]")
+    return imdata
+
+
+def get_crc_errors(client):
     """Get CRC error statistics from rmonEtherStats"""
-    url = f"https://{apic_ip}/api/node/class/rmonEtherStats.json"
-    r = requests.get(url, cookies=cookies, verify=False)
-    console.print(f"[green]✓ CRC errors data retrieved from {apic_ip}.[/green]")
-    return r.json().get("imdata", [])
+    imdata = list(query_mos(client, CRC_ERRORS_QUERY))
+    console.print(f"[green]✓ CRC errors data retrieved from {client.apic_ip}.[/green]")
+    return imdata
+
+
+def get_drop_errors(client):
+    imdata = list(query_mos(client, DROP_ERRORS_QUERY))
+    console.print(f"[green]✓ Drop errors data retrieved from {client.apic_ip}.[/green]")
+    return imdata
+
+
+def get_output_errors(client):
+    imdata = list(query_mos(client, OUTPUT_ERRORS_QUERY))
+    console.print(f"[green]✓ Output errors data retrieved from {client.apic_ip}.[/green]")
+    return imdata
+
+
+# Snapshot key fed by each class of the interface counters subtree
+INTERFACE_COUNTER_KEYS = {
+    "l1PhysIf": "interfaces",
+    "ethpmPhysIf": "interface_errors",
+    "rmonEtherStats": "crc_errors",
+    "rmonEgrCounters": "drop_errors",
+    "rmonIfOut": "output_errors",
+}
+
 
+def split_interface_subtree(mos):
+    """Split l1PhysIf subtree MOs into the per-class snapshot keys.
 
-def get_drop_errors(cookies, apic_ip):
-    url = f"https://{apic_ip}/api/node/class/rmonEgrCounters.json"
-    r = requests.get(url, cookies=cookies, verify=False)
-    console.print(f"[green]✓ Drop errors data retrieved from {apic_ip}.[/green]")
-    return r.json().get("imdata", [])
+    Children only carry their rn, so each gets its full dn rebuilt from
+    the parent; the result matches what the separate class queries return.
+    """
+    split = {key: [] for key in INTERFACE_COUNTER_KEYS.values()}
+    for mo in mos:
+        body = mo["l1PhysIf"]
+        attrs = body.get("attributes", {})
+        split["interfaces"].append({"l1PhysIf": {"attributes": attrs}})
+        parent_dn = attrs.get("dn", "")
+        for child in body.get("children", []):
+            class_name, child_body = next(iter(child.items()))
+            key = INTERFACE_COUNTER_KEYS.get(class_name)
+            if key is None:
+                continue
+            child_attrs = dict(child_body.get("attributes", {}))
+            rn = child_attrs.pop("rn", None)
+            if not child_attrs.get("dn") and rn:
+                child_attrs = dict(child_attrs, dn=f"{parent_dn}/{rn}")
+            split[key].append({class_name: {"attributes": child_attrs}})
+    return split
 
 
-def get_output_errors(cookies, apic_ip):
-    url = f"https://{apic_ip}/api/node/class/rmonIfOut.json"
-    r = requests.get(url, cookies=cookies, verify=False)
-    console.print(f"[green]✓ Output errors data retrieved from {apic_ip}.[/green]")
-    return r.json().get("imdata", [])
+def get_interface_counters(client, shards=None):
+    """Interface state and error counters from a single l1PhysIf subtree query."""
+    split = split_interface_subtree(
+        query_mos(client, INTERFACE_COUNTERS_QUERY, paged=True, shards=shards)
+    )
+    console.print(f"[green]✓ Interface state and counters retrieved from {client.apic_ip}.[/green]")
+    return split
 
 
-def get_output_path_ep(cookies, apic_ip):
-    url = f"https://{apic_ip}/api/node/class/fabricPathEp.json?rsp-subtree=children&rsp-subtree-class=fabricRsPathToIf"
-    r = requests.get(url, cookies=cookies, verify=False)
-    console.print(f"[green]✓ Path endpoint data retrieved from {apic_ip}.[/green]")
-    return r.json().get("imdata", [])
+def get_output_path_ep(client):
+    imdata = list(query_mos(client, PATH_EP_QUERY))
+    console.print(f"[green]✓ Path endpoint data retrieved from {client.apic_ip}.[/green]")
+    return imdata
 
 
-def get_pc_aggr(cookies, apic_ip):
-    url = f"https://{apic_ip}/api/node/class/pcAggrIf.json?rsp-subtree=children&rsp-subtree-class=pcRsMbrIfs"
-    r = requests.get(url, cookies=cookies, verify=False)
-    console.print(f"[green]✓ Port-channel aggregation data retrieved from {apic_ip}.[/green]")
-    return r.json().get("imdata", [])
+def get_pc_aggr(client):
+    imdata = list(query_mos(client, PC_AGGR_QUERY))
+    console.print(f"[green]✓ Port-channel aggregation data retrieved from {client.apic_ip}.[/green]")
+    return imdata
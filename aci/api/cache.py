@@ -0,0 +1,120 @@
+# Persistent response cache for slow-changing APIC classes.
+#
+# Entries live under <data dir>/<customer>/aci/cache/<apic>/, one JSON file
+# per class query. An entry younger than its class TTL is served as is.
+# An older one is revalidated against the APIC with a cheap probe (object
+# count and newest modTs of the class and of each child class it
+# includes) and only re-downloaded when the probe shows a change.
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from inventory.lib.path import get_data_dir
+from legacy.customer_context import get_customer_name
+
+CACHE_VERSION = 1
+# Seconds an entry is trusted without asking the APIC, per class.
+CACHE_TTLS = {
+    "fvAEPg": 15 * 60,
+    "pcAggrIf": 30 * 60,
+    "fabricPathEp": 60 * 60,
+    "topSystem": 60 * 60,
+}
+# Set to False to always fetch from the APIC.
+RESPONSE_CACHE = True
+
+
+def cache_dir(apic_ip, base_dir=None):
+    base_dir = get_data_dir() if base_dir is None else base_dir
+    return os.path.join(base_dir, get_customer_name(), "aci", "cache", apic_ip)
+
+
+def cache_path(apic_ip, query, base_dir=None):
+    params = json.dumps(query.params(), sort_keys=True)
+    digest = hashlib.sha1(params.encode()).hexdigest()[:12]
+    return os.path.join(cache_dir(apic_ip, base_dir), f"{query.class_name}-{digest}.json")
+
+
+def load_entry(path):
+    try:
+        with open(path, "r") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if entry.get("version") != CACHE_VERSION:
+        return None
+    return entry
+
+
+def store_entry(path, entry):
+    """Write an entry atomically; a cache that cannot be written is skipped."""
+    entry = dict(entry, version=CACHE_VERSION)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        logging.warning(f"Could not write APIC response cache {path}: {e}")
+
+
+def probe_class(client, class_name, params=None):
+    """(object count, newest modTs) of a class query, from a one-MO page."""
+    query = {
+        k: v for k, v in (params or {}).items() if k == "query-target-filter"
+    }
+    query.update(
+        {"order-by": f"{class_name}.modTs|desc", "page": 0, "page-size": 1}
+    )
+    data = client.get_json(f"/api/node/class/{class_name}.json", params=query)
+    imdata = data.get("imdata", [])
+    newest = ""
+    if imdata:
+        newest = next(iter(imdata[0].values())).get("attributes", {}).get("modTs", "")
+    return [int(data.get("totalCount", len(imdata))), newest]
+
+
+def probe_query(client, query):
+    """Change stamp of a ClassQuery: the probe of its class and of each child class."""
+    stamp = [probe_class(client, query.class_name, query.params())]
+    stamp.extend(probe_class(client, child) for child in query.children)
+    return stamp
+
+
+def cached_query(client, query, loader, base_dir=None):
+    """MOs of `query`, from the on-disk cache when still valid, else via `loader`."""
+    ttl = CACHE_TTLS.get(query.class_name)
+    if not RESPONSE_CACHE or ttl is None:
+        return list(loader(client, query))
+
+    path = cache_path(client.apic_ip, query, base_dir)
+    entry = load_entry(path)
+    now = time.time()
+    if entry is not None and now - entry.get("fetched", 0) < ttl:
+        return entry["mos"]
+
+    # Probed before fetching, so a change made during the download shows
+    # up as a newer stamp on the next run.
+    stamp = probe_query(client, query)
+    if entry is not None and entry.get("stamp") == stamp:
+        store_entry(path, dict(entry, fetched=now))
+        return entry["mos"]
+
+    mos = list(loader(client, query))
+    store_entry(
+        path,
+        {
+            "apic": client.apic_ip,
+            "class": query.class_name,
+            "params": query.params(),
+            "fetched": now,
+            "stamp": stamp,
+            "mos": mos,
+        },
+    )
+    return mos
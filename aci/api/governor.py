@@ -0,0 +1,105 @@
+# Adaptive per-controller concurrency limit for APIC queries.
+#
+# AIMD: every response that comes back at its usual speed adds 1/limit to
+# the limit (about +1 per round of requests); a throttle (HTTP 429/503)
+# halves it and a response much slower than usual trims it.
+
+import threading
+import time
+
+DEFAULT_INITIAL_LIMIT = 4
+DEFAULT_MIN_LIMIT = 1
+DEFAULT_MAX_LIMIT = 16
+# Multiplicative decrease on throttling and on slow responses.
+THROTTLE_DECREASE = 0.5
+SLOW_DECREASE = 0.9
+# A response this many times slower than the fastest seen for the same
+# query counts as the controller being overloaded.
+SLOW_FACTOR = 3.0
+# Fallback pause when a throttle response carries no usable Retry-After.
+DEFAULT_RETRY_AFTER = 1.0
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (only the delta form is used)."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limiter for one APIC controller."""
+
+    def __init__(
+        self,
+        initial=DEFAULT_INITIAL_LIMIT,
+        min_limit=DEFAULT_MIN_LIMIT,
+        max_limit=DEFAULT_MAX_LIMIT,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.throttled = 0
+        self._paused_until = 0.0
+        self._baseline = {}
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=None):
+        """Block until a slot is free and any Retry-After pause has passed.
+
+        Returns False, without taking a slot, if `timeout` seconds pass first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+            try:
+                while True:
+                    now = time.monotonic()
+                    pause = self._paused_until - now
+                    if pause <= 0 and self.in_flight < int(self.limit):
+                        break
+                    wait = pause if pause > 0 else None
+                    if deadline is not None:
+                        left = deadline - now
+                        if left <= 0:
+                            return False
+                        wait = left if wait is None else min(wait, left)
+                    self._cond.wait(timeout=wait)
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+            return True
+
+    def release(self, latency=None, key=None, throttled=False, retry_after=None):
+        """Return a slot and adapt the limit from how the request went."""
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                self.limit = max(self.min_limit, self.limit * THROTTLE_DECREASE)
+                pause = DEFAULT_RETRY_AFTER if retry_after is None else retry_after
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            elif latency is not None:
+                baseline = self._baseline.get(key)
+                if baseline is None or latency < baseline:
+                    self._baseline[key] = latency
+                if baseline and latency > baseline * SLOW_FACTOR:
+                    self.limit = max(self.min_limit, self.limit * SLOW_DECREASE)
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def metrics(self):
+        with self._cond:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting,
+                "peak_queue_depth": self.peak_waiting,
+                "throttled": self.throttled,
+            }
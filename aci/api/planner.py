@@ -0,0 +1,219 @@
+# Run-scoped query planner for APIC class queries.
+#
+# Tools describe each class they read as a ClassQuery (class, children,
+# filter). While a planner is active (see query_plan), every such query
+# goes through it: overlapping needs for the same class on the same APIC
+# are merged into one fetch (union of children, filter dropped when the
+# needs disagree) and each consumer is served its own view of the result.
+# A query for a class that another need reads as a subtree child (e.g.
+# rmonEtherStats under l1PhysIf) is answered from that subtree, with the
+# filter applied client-side.
+# Only classes declared by two or more consumers are kept for the rest of
+# the run; any other query streams straight through to its loader, so
+# large classes are not held in memory for the whole block.
+
+import threading
+from collections import namedtuple
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+
+class Filter(namedtuple("Filter", "op attr value")):
+    """Single-attribute filter usable server-side and client-side."""
+
+    def query(self, class_name):
+        """APIC query-target-filter expression."""
+        return f'{self.op}({class_name}.{self.attr},"{self.value}")'
+
+    def matches(self, attrs):
+        actual = attrs.get(self.attr)
+        if actual is None:
+            return False
+        if self.op == "eq":
+            return str(actual) == str(self.value)
+        if self.op == "ne":
+            return str(actual) != str(self.value)
+        if self.op == "gt":
+            try:
+                return float(actual) > float(self.value)
+            except (TypeError, ValueError):
+                return str(actual) > str(self.value)
+        raise ValueError(f"Unsupported filter operator: {self.op}")
+
+
+class ClassQuery(namedtuple("ClassQuery", "class_name children where")):
+    """A class query: the class, the child classes it includes and an optional filter."""
+
+    def __new__(cls, class_name, children=(), where=None):
+        return super().__new__(cls, class_name, tuple(sorted(children)), where)
+
+    def params(self):
+        query = {}
+        if self.children:
+            query["rsp-subtree"] = "children"
+            query["rsp-subtree-class"] = ",".join(self.children)
+        if self.where is not None:
+            query["query-target-filter"] = self.where.query(self.class_name)
+        return query
+
+    def covers(self, other):
+        """True when this query's result contains everything `other` asks for."""
+        return (
+            self.class_name == other.class_name
+            and set(other.children) <= set(self.children)
+            and (self.where is None or self.where == other.where)
+        )
+
+
+def merge_queries(queries):
+    """Smallest single query whose result serves every query given."""
+    queries = list(queries)
+    children = {child for q in queries for child in q.children}
+    wheres = {q.where for q in queries}
+    where = wheres.pop() if len(wheres) == 1 else None
+    return ClassQuery(queries[0].class_name, children, where)
+
+
+def _view(mo, query):
+    """The part of a merged-result MO that `query` asked for."""
+    class_name, body = next(iter(mo.items()))
+    if query.where is not None and not query.where.matches(body.get("attributes", {})):
+        return None
+    out = {"attributes": body.get("attributes", {})}
+    children = [
+        child for child in body.get("children", []) if next(iter(child)) in query.children
+    ]
+    if children:
+        out["children"] = children
+    return {class_name: out}
+
+
+def _child_mos(mo, query):
+    """The children of a merged-result MO that `query` asks for, as class MOs.
+
+    Subtree children only carry their rn, so each gets its full dn rebuilt
+    from the parent.
+    """
+    body = next(iter(mo.values()))
+    parent_dn = body.get("attributes", {}).get("dn", "")
+    for child in body.get("children", []):
+        class_name, child_body = next(iter(child.items()))
+        if class_name != query.class_name:
+            continue
+        attrs = dict(child_body.get("attributes", {}))
+        if not attrs.get("dn") and attrs.get("rn"):
+            attrs["dn"] = f"{parent_dn}/{attrs['rn']}"
+        if query.where is None or query.where.matches(attrs):
+            yield {class_name: {"attributes": attrs}}
+
+
+class QueryPlanner:
+    """Run-scoped result cache that merges overlapping class queries."""
+
+    def __init__(self, needs=()):
+        self._needs = {}
+        self._results = {}
+        self._lock = threading.Lock()
+        self.fetches = 0
+        self.served_from_cache = 0
+        for query in needs:
+            self.declare(query)
+
+    def declare(self, query):
+        """Announce a query some tool in this run will make."""
+        with self._lock:
+            self._needs.setdefault(query.class_name, []).append(query)
+
+    def _covering_class(self, query):
+        """Declared class whose unfiltered subtree holds `query`'s class, if any."""
+        if query.children:
+            return None
+        for class_name, needs in self._needs.items():
+            if class_name != query.class_name and any(
+                need.where is None and query.class_name in need.children
+                for need in needs
+            ):
+                return class_name
+        return None
+
+    def _consumers(self, class_name):
+        """Declared needs a fetch of `class_name` serves, child-class needs included."""
+        count = 0
+        for needs in self._needs.values():
+            for need in needs:
+                if need.class_name == class_name or self._covering_class(need) == class_name:
+                    count += 1
+        return count
+
+    def fetch(self, client, query, loader):
+        """MOs for `query`, fetched at most once per merged query and APIC.
+
+        `loader(client, planned_query)` performs the actual fetch; its
+        result is returned as is for classes with fewer than two declared
+        consumers. Queries for a class covered by another need's subtree
+        are served from that subtree's result.
+        """
+        with self._lock:
+            parent = self._covering_class(query)
+        if parent is not None:
+            mos = self.fetch(client, ClassQuery(parent, children=(query.class_name,)), loader)
+            return [child for mo in mos for child in _child_mos(mo, query)]
+
+        key = (client.apic_ip, query.class_name)
+        with self._lock:
+            shared = self._consumers(query.class_name) >= 2
+            if not shared:
+                self.fetches += 1
+        if not shared:
+            return loader(client, query)
+
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None and entry[0].covers(query):
+                planned, future = entry
+                owner = False
+                self.served_from_cache += 1
+            else:
+                wanted = self._needs.get(query.class_name, []) + [query]
+                if entry is not None:
+                    wanted.append(entry[0])
+                planned = merge_queries(wanted)
+                future = Future()
+                self._results[key] = (planned, future)
+                owner = True
+                self.fetches += 1
+
+        if owner:
+            try:
+                future.set_result(list(loader(client, planned)))
+            except Exception as e:
+                future.set_exception(e)
+                with self._lock:
+                    if self._results.get(key, (None, None))[1] is future:
+                        del self._results[key]
+
+        mos = future.result()
+        if planned == query:
+            return mos
+        return [view for view in (_view(mo, query) for mo in mos) if view is not None]
+
+
+_active_planner = None
+
+
+def active_planner():
+    """The planner of the current run, or None outside query_plan()."""
+    return _active_planner
+
+
+@contextmanager
+def query_plan(needs=()):
+    """Serve every planned class query in this block from one shared planner."""
+    global _active_planner
+    previous = _active_planner
+    planner = QueryPlanner(needs)
+    _active_planner = planner
+    try:
+        yield planner
+    finally:
+        _active_planner = previous
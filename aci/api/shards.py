@@ -0,0 +1,57 @@
+# Sharded collection for classes too large for one fabric-wide query.
+#
+# Instead of one class query the APIC has to assemble in full, the class
+# is read scope by scope (a switch node, a tenant). Scopes are grouped
+# into shards of ShardPolicy.size; shards run in parallel and a shard
+# that fails is retried on its own before the whole read is given up.
+
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# Scopes per shard, shards fetched at once, retries of a failed shard, and
+# the number of switch nodes from which a fabric is collected sharded.
+ShardPolicy = namedtuple("ShardPolicy", "size workers retries min_nodes")
+DEFAULT_SHARD_POLICY = ShardPolicy(size=4, workers=8, retries=2, min_nodes=100)
+
+# The policy in force and the scopes of one fabric, by scope kind
+# ("node", "tenant").
+ShardPlan = namedtuple("ShardPlan", "policy scopes")
+
+
+def chunked(items, size):
+    """Split items into consecutive lists of at most `size`."""
+    size = max(1, size)
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def run_shards(scopes, fetch_scope, policy, label=""):
+    """Fetch every scope, shard by shard, and merge the MOs in scope order.
+
+    `fetch_scope(scope)` returns the MOs of one scope. A shard is retried
+    up to policy.retries times; if it still fails the error is raised.
+    """
+    shards = chunked(list(scopes), policy.size)
+
+    def fetch_shard(index, shard):
+        for attempt in range(policy.retries + 1):
+            try:
+                mos = []
+                for scope in shard:
+                    mos.extend(fetch_scope(scope))
+                return mos
+            except Exception as e:
+                if attempt == policy.retries:
+                    raise
+                logging.warning(
+                    f"Shard {index + 1}/{len(shards)} of {label} failed ({e}), retrying"
+                )
+
+    with ThreadPoolExecutor(max_workers=max(1, policy.workers)) as pool:
+        futures = [
+            pool.submit(fetch_shard, index, shard) for index, shard in enumerate(shards)
+        ]
+        merged = []
+        for future in futures:
+            merged.extend(future.result())
+    return merged
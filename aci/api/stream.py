@@ -0,0 +1,78 @@
+# Incremental decoding of APIC "imdata" responses.
+#
+# The response body is read chunk by chunk and each element of the
+# top-level imdata array is decoded and handed out on its own, so memory
+# stays proportional to one MO instead of the whole class.
+
+import codecs
+import json
+
+_WHITESPACE = " \t\r\n"
+# Drop already consumed text from the buffer once it grows past this.
+_COMPACT_AT = 1 << 16
+
+
+class _ChunkReader:
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def read(self):
+        """Next piece of decoded text, or None at the end of the stream."""
+        for chunk in self._chunks:
+            text = self._decoder.decode(chunk)
+            if text:
+                return text
+        tail = self._decoder.decode(b"", final=True)
+        return tail or None
+
+
+def iter_imdata(chunks):
+    """Yield each element of the top-level "imdata" array from byte chunks."""
+    reader = _ChunkReader(chunks)
+    decoder = json.JSONDecoder()
+
+    # Skip ahead to the opening bracket of the imdata array.
+    buf = ""
+    while True:
+        key = buf.find('"imdata"')
+        if key >= 0:
+            start = buf.find("[", key)
+            if start >= 0:
+                buf = buf[start + 1 :]
+                break
+            buf = buf[key:]
+        else:
+            buf = buf[-len('"imdata"') :]
+        text = reader.read()
+        if text is None:
+            return
+        buf += text
+
+    pos = 0
+    while True:
+        while pos < len(buf) and (buf[pos] in _WHITESPACE or buf[pos] == ","):
+            pos += 1
+        if pos >= len(buf):
+            text = reader.read()
+            if text is None:
+                raise ValueError("Truncated imdata array in APIC response")
+            buf, pos = text, 0
+            continue
+        if buf[pos] == "]":
+            return
+
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # The element is not complete yet; read more and retry.
+            text = reader.read()
+            if text is None:
+                raise
+            buf, pos = buf[pos:] + text, 0
+            continue
+
+        yield obj
+        pos = end
+        if pos > _COMPACT_AT:
+            buf, pos = buf[pos:], 0
@@ -1,14 +1,12 @@
-import json
-import glob
+import os
 from rich import print as rprint
-from aci.snapshot.snapshotter import choose_snapshots
+from aci.snapshot.snapshotter import choose_snapshots, validate_snapshot
+from aci.snapshot import catalog
+from aci.snapshot.reader import SnapshotReader
+from aci.snapshot.schema import route_dn
 from aci.lib.utils import (
     save_to_excel,
     print_colored_result,
-    normalize_faults,
-    summarize_interfaces,
-    summarize_interface_errors,
-    extract_interface_from_dn,
 )    
 from legacy.customer_context import get_customer_name
 from rich.console import Console
@@ -31,14 +29,87 @@ def debug(msg):
         console.print(f"[dim][DEBUG][/dim] {msg}")
 
 
-def compare_snapshots(file1, file2):
-    with open(file1) as f1, open(file2) as f2:
-        before_json = json.load(f1)
-        after_json = json.load(f2)
+def node_name(node):
+    return f"node-{node}" if node is not None else ""
 
-    # APICs that exist in BOTH snapshots
-    apics = sorted(set(before_json.keys()) & set(after_json.keys()))
-    print("DEBUG snapshot APICs:", apics)
+
+def interface_status(interfaces, oper_states):
+    """{port: {"node", "status"}} from interface and ethpmPhysIf records."""
+    oper = {}
+    for record in oper_states:
+        if record["oper"]:
+            oper[record["port"]] = (
+                f"{record['oper']} ({record['qual']})" if record["qual"] else record["oper"]
+            )
+    return {
+        record["port"]: {
+            "node": node_name(record["node"]),
+            "status": f"{record['switching']} / {oper.get(record['port'], 'unknown')}",
+        }
+        for record in interfaces
+    }
+
+
+def endpoint_index(endpoints):
+    """{mac: endpoint row} as the comparison reports endpoints."""
+    return {
+        ep["mac"]: {
+            "node": ep["node"],
+            "interface": ep["interface"],
+            "mac": ep["mac"],
+            "vlan": ep["vlan"],
+            "epg_descr": ep["epg_descr"],
+            "dn": ep["dn"],
+            "ip": (ep.get("ip") or ""),
+        }
+        for ep in endpoints
+    }
+
+
+def counter_increases(before, after, field):
+    """(node, port, before, after) of every port whose counter went up."""
+    before_counts = {(r["node"], r["port"]): r[field] for r in before}
+    after_counts = {(r["node"], r["port"]): r[field] for r in after}
+    for (node, port), a in after_counts.items():
+        b = before_counts.get((node, port), 0)
+        if a > b:
+            yield node, port, b, a
+
+
+def compare_snapshots(file1, file2, apics=None):
+    """Compare two snapshot files, one APIC at a time.
+
+    Each APIC's sections are loaded only when its comparison needs them
+    and dropped before the next APIC, so memory follows one fabric rather
+    than two whole snapshots. `apics` restricts the comparison.
+
+    Sections only one side holds (a counters-profile or compacted snapshot
+    against a full one, a class that failed to collect) are not compared
+    rather than reported as all missing or all new; they are listed under
+    "skipped_sections".
+    """
+    before_reader = SnapshotReader(file1)
+    after_reader = SnapshotReader(file2)
+
+    def unchanged(apic, *keys):
+        # Sections stored as blobs with the same digest in both snapshots
+        # are identical and need no diff (nor loading).
+        before_refs = before_reader.digests(apic)
+        after_refs = after_reader.digests(apic)
+        return all(
+            before_refs.get(key) is not None and before_refs.get(key) == after_refs.get(key)
+            for key in keys
+        )
+
+    # APICs that exist in BOTH snapshots, in the order the first file
+    # stores them so its sections are read front to back.
+    after_apics = set(after_reader.fabrics())
+    apics = [
+        apic
+        for apic in before_reader.fabrics()
+        if apic in after_apics and (apics is None or apic in apics)
+    ]
+    print("DEBUG snapshot APICs:", sorted(apics))
     result = {}
 
 
@@ -55,8 +126,8 @@ def compare_snapshots(file1, file2):
 
 
         for apic in apics:
-            before = before_json.get(apic, {})
-            after = after_json.get(apic, {})
+            before = before_reader.fabric(apic)
+            after = after_reader.fabric(apic)
 
             if not before or not after:
                 debug(f"{apic}: skipped (missing snapshot data)")
@@ -64,6 +135,12 @@ def compare_snapshots(file1, file2):
                 continue
 
             result[apic] = {}
+            skipped = []
+
+            def comparable(*keys):
+                missing = [key for key in keys if key not in before or key not in after]
+                skipped.extend(key for key in missing if key not in skipped)
+                return not missing
 
             # =====================
             # Fabric health
@@ -77,14 +154,18 @@ def compare_snapshots(file1, file2):
             # =====================
             # Faults
             # =====================
-            before_faults = normalize_faults(before.get("faults", []))
-            after_faults = normalize_faults(after.get("faults", []))
+            if not comparable("faults") or unchanged(apic, "faults"):
+                result[apic]["new_faults"] = []
+                result[apic]["cleared_faults"] = []
+            else:
+                before_faults = {f["dn"]: f for f in before.get("faults", [])}
+                after_faults = {f["dn"]: f for f in after.get("faults", [])}
 
-            new_dns = sorted(after_faults.keys() - before_faults.keys())
-            cleared_dns = sorted(before_faults.keys() - after_faults.keys())
+                new_dns = sorted(after_faults.keys() - before_faults.keys())
+                cleared_dns = sorted(before_faults.keys() - after_faults.keys())
 
-            result[apic]["new_faults"] = [after_faults[dn] for dn in new_dns]
-            result[apic]["cleared_faults"] = [before_faults[dn] for dn in cleared_dns]
+                result[apic]["new_faults"] = [after_faults[dn] for dn in new_dns]
+                result[apic]["cleared_faults"] = [before_faults[dn] for dn in cleared_dns]
 
             debug(
                 f"{apic}: faults new={len(result[apic]['new_faults'])}, "
@@ -93,44 +174,34 @@ def compare_snapshots(file1, file2):
             # =====================
             # Endpoints
             # =====================
-            before_eps = {
-                ep["mac"]: {
-                    "node": ep["node"],
-                    "interface": ep["interface"],
-                    "mac": ep["mac"],
-                    "vlan": ep["vlan"],
-                    "epg_descr": ep["epg_descr"],
-                    "dn": ep["dn"],
-                    "ip": (ep.get("ip") or ""),
-                }
-                for ep in before.get("endpoints", [])
-            }
-            after_eps = {
-                ep["mac"]: {
-                    "node": ep["node"],
-                    "interface": ep["interface"],
-                    "mac": ep["mac"],
-                    "vlan": ep["vlan"],
-                    "epg_descr": ep["epg_descr"],
-                    "dn": ep["dn"],
-                    "ip": (ep.get("ip") or ""),
-                }
-                for ep in after.get("endpoints", [])
-            }
-
-            before_dns = set(before_eps.keys())
-            after_dns = set(after_eps.keys())
-            new_endpoints = []
-            missing_endpoints = []
-            new_endpoints_mac = sorted(after_dns - before_dns)
-            missing_endpoints_mac = sorted(before_dns - after_dns)
-            for mac in new_endpoints_mac:
-                temp = after_eps.get(mac, {})
-                new_endpoints.append(temp)
-
-            for mac in missing_endpoints_mac:
-                temp = before_eps.get(mac)
-                missing_endpoints.append(temp)
+            # Built on first use: sections that are unchanged or only on
+            # one side are never loaded.
+            lookups = {}
+
+            def after_endpoints():
+                if "endpoints" not in lookups:
+                    lookups["endpoints"] = endpoint_index(after.get("endpoints", []))
+                return lookups["endpoints"]
+
+            if not comparable("endpoints") or unchanged(apic, "endpoints"):
+                new_endpoints = []
+                missing_endpoints = []
+            else:
+                before_eps = endpoint_index(before.get("endpoints", []))
+                after_eps = after_endpoints()
+                before_dns = set(before_eps.keys())
+                after_dns = set(after_eps.keys())
+                new_endpoints = []
+                missing_endpoints = []
+                new_endpoints_mac = sorted(after_dns - before_dns)
+                missing_endpoints_mac = sorted(before_dns - after_dns)
+                for mac in new_endpoints_mac:
+                    temp = after_eps.get(mac, {})
+                    new_endpoints.append(temp)
+
+                for mac in missing_endpoints_mac:
+                    temp = before_eps.get(mac)
+                    missing_endpoints.append(temp)
 
             result[apic]["new_endpoints"] = new_endpoints
             result[apic]["missing_endpoints"] = missing_endpoints
@@ -143,33 +214,38 @@ def compare_snapshots(file1, file2):
             # =====================    
             # Interface status
             # =====================
-            before_intfs = summarize_interfaces(
-                before.get("interfaces", []),
-                before.get("interface_errors", []),
-            )
-
-            after_intfs = summarize_interfaces(
-                after.get("interfaces", []),
-                after.get("interface_errors", []),
-            )
-
-            status_changed = []
-
-            for k in before_intfs.keys() & after_intfs.keys():
-                before_entry = before_intfs[k]
-                after_entry = after_intfs[k]
-
-                if before_entry["status"] != after_entry["status"]:
-                    status_changed.append(
-                        f"{k}|{before_entry['node']}|"
-                        f"{before_entry['status']} ➜ {after_entry['status']}"
-                    )
+            if not comparable("interfaces", "interface_errors") or unchanged(
+                apic, "interfaces", "interface_errors"
+            ):
+                intf_changes = {"status_changed": [], "missing": [], "new": []}
+            else:
+                before_intfs = interface_status(
+                    before.get("interfaces", []),
+                    before.get("interface_errors", []),
+                )
+
+                after_intfs = interface_status(
+                    after.get("interfaces", []),
+                    after.get("interface_errors", []),
+                )
+
+                status_changed = []
+
+                for k in before_intfs.keys() & after_intfs.keys():
+                    before_entry = before_intfs[k]
+                    after_entry = after_intfs[k]
+
+                    if before_entry["status"] != after_entry["status"]:
+                        status_changed.append(
+                            f"{k}|{before_entry['node']}|"
+                            f"{before_entry['status']} ➜ {after_entry['status']}"
+                        )
 
-            intf_changes = {
-                "status_changed": status_changed,
-                "missing": sorted(set(before_intfs) - set(after_intfs)),
-                "new": sorted(set(after_intfs) - set(before_intfs)),
-            }
+                intf_changes = {
+                    "status_changed": status_changed,
+                    "missing": sorted(set(before_intfs) - set(after_intfs)),
+                    "new": sorted(set(after_intfs) - set(before_intfs)),
+                }
 
             result[apic]["interface_changes"] = intf_changes
 
@@ -184,115 +260,39 @@ def compare_snapshots(file1, file2):
             # =====================
             # Interface Errors
             # =====================
-            interfaces_map = {}
-            po_map = {}
-            interfaces = after.get("interfaces", [])
-            pos = after.get("pc_aggr", [])
-
-            for item in interfaces:
-                attr = item.get("l1PhysIf", {}).get("attributes", {})
-
-                dn = attr.get("dn", "")
-
-                node = None
-                for part in dn.split("/"):
-                    if part.startswith("node-"):
-                        node = part
-                        break
-
-                entry = {
-                    "node": node,
-                    "id": attr.get("id", ""),
-                    "descr": attr.get("descr", ""),
-                }
-                interfaces_map[f"{node}-{attr.get('id', 'none')}"] = entry
-
-                for po in pos:
-                    attr = po.get("pcAggrIf", {}).get("attributes", {})
-                    dn = attr.get("dn", "")
-                    node = None
-                    for part in dn.split("/"):
-                        if part.startswith("node-"):
-                            node = part
-                            break
-
-                    po_entry = {
-                        "node": node,
-                        "id": attr.get("id", ""),
-                        "name": attr.get("name", ""),
+            def error_changes(key, field):
+                if not comparable(key) or unchanged(apic, key):
+                    return []
+                if "descriptions" not in lookups:
+                    lookups["descriptions"] = {
+                        (r["node"], r["port"]): r["descr"] for r in after.get("interfaces", [])
                     }
-
-                    po_map[f"{node}-{attr.get('id', 'None')}"] = po_entry
-
-            before_errs = summarize_interface_errors(before.get("interface_errors", []))
-            after_errs = summarize_interface_errors(after.get("interface_errors", []))
-            error_changes = {}
-            for dn in set(before_errs) | set(after_errs):
-                b = before_errs.get(dn, 0)
-                a = after_errs.get(dn, 0)
-                if a > b:
-                    error_changes[dn] = f"{b} ➜ {a}"
-                result[apic]["interface_error_changes"] = error_changes
-            debug(f"{apic}: interface error increases={len(error_changes)}")
-
-            # =====================
-            # CRC Errors
-            # =====================
-            before_crc = {}
-            for e in before.get("crc_errors", []):
-                if "rmonEtherStats" in e and "attributes" in e["rmonEtherStats"]:
-                    dn = e["rmonEtherStats"]["attributes"].get("dn")
-                    # Note: The key is "cRCAlignErrors" not "crcAlignErrors"
-                    crc_align_errors = int(
-                        e["rmonEtherStats"]["attributes"].get("cRCAlignErrors", 0)
-                    )
-                    if dn:
-                        before_crc[dn] = crc_align_errors
-
-            after_crc = {}
-            for e in after.get("crc_errors", []):
-                if "rmonEtherStats" in e and "attributes" in e["rmonEtherStats"]:
-                    dn = e["rmonEtherStats"]["attributes"].get("dn")
-                    # Note: The key is "cRCAlignErrors" not "crcAlignErrors"
-                    crc_align_errors = int(
-                        e["rmonEtherStats"]["attributes"].get("cRCAlignErrors", 0)
-                    )
-                    if dn:
-                        after_crc[dn] = crc_align_errors
-
-            all_interfaces = set(before_crc.keys()) | set(after_crc.keys())
-            crc_changes = []
-            for dn in all_interfaces:
-                b = before_crc.get(dn, 0)
-                a = after_crc.get(dn, 0)
-
-                if a > b:
-                    # Extract interface name for better readability
-                    node, port = extract_interface_from_dn(dn)
-                    if node is None:
-                        continue
-
+                descriptions = lookups["descriptions"]
+                changes = []
+                for node, port, b, a in counter_increases(
+                    before.get(key, []), after.get(key, []), field
+                ):
                     err_eps = [
                         ep
-                        for ep in after_eps.values()
-                        if ep["node"] == node.split("-")[1] and ep["interface"] == port
+                        for ep in after_endpoints().values()
+                        if ep["node"] == str(node) and ep["interface"] == port
                     ]
-
-                    crc_changes.append(
+                    changes.append(
                         {
                             "before": b,
                             "after": a,
-                            "node": node,
-                            "interface": port
-                            if not port.startswith("po")  # type: ignore
-                            else po_map.get(f"{node}-{port}", {}).get("name", port),
-                            "interface_descr": interfaces_map.get(f"{node}-{port}", {}).get(
-                                "descr", ""
-                            ),
+                            "node": node_name(node),
+                            "interface": port,
+                            "interface_descr": descriptions.get((node, port), ""),
                             "endpoints": err_eps,
                         }
                     )
+                return changes
 
+            # =====================
+            # CRC Errors
+            # =====================
+            crc_changes = error_changes("crc_errors", "crc")
             result[apic]["crc_error_changes"] = crc_changes
 
             debug(f"{apic}: interface crc changes={len(crc_changes)}")
@@ -300,134 +300,38 @@ def compare_snapshots(file1, file2):
             # =====================
             # Interface Errors
             # =====================
-            before_drop = {}
-            for e in before.get("drop_errors", []):
-                if "rmonEgrCounters" in e and "attributes" in e["rmonEgrCounters"]:
-                    dn = e["rmonEgrCounters"]["attributes"].get("dn")
-                    drop_errors = int(
-                        e["rmonEgrCounters"]["attributes"].get("bufferdroppkts", 0)
-                    )
-                    if dn:
-                        before_drop[dn] = drop_errors
-            after_drop = {}
-            for e in after.get("drop_errors", []):
-                if "rmonEgrCounters" in e and "attributes" in e["rmonEgrCounters"]:
-                    dn = e["rmonEgrCounters"]["attributes"].get("dn")
-                    drop_errors = int(
-                        e["rmonEgrCounters"]["attributes"].get("bufferdroppkts", 0)
-                    )
-                    if dn:
-                        after_drop[dn] = drop_errors
-
-            all_interfaces = set(before_drop.keys()) | set(after_drop.keys())
-            drop_changes = []
-            for dn in all_interfaces:
-                b = before_drop.get(dn, 0)
-                a = after_drop.get(dn, 0)
-                if a > b:
-                    node, intf = extract_interface_from_dn(dn)
-                    if node is None:
-                        continue
-                    err_eps = [
-                        ep
-                        for ep in after_eps.values()
-                        if ep["node"] == node.split("-")[1] and ep["interface"] == intf
-                    ]
-
-                    drop_changes.append(
-                        {
-                            "before": b,
-                            "after": a,
-                            "node": node,
-                            "interface": intf
-                            if not intf.startswith("po")  # type: ignore
-                            else po_map.get(f"{node}-{intf}", {}).get("name", intf),
-                            "interface_descr": interfaces_map.get(f"{node}-{intf}", {}).get(
-                                "descr", ""
-                            ),
-                            "endpoints": err_eps,
-                        }
-                    )
-
+            drop_changes = error_changes("drop_errors", "drops")
             result[apic]["drop_error_changes"] = drop_changes
             debug(f"{apic}: interface drop changes={len(drop_changes)}")
 
             # =====================
             # Output Errors
             # =====================
-            before_output = {}
-            for e in before.get("output_errors", []):
-                if "rmonIfOut" in e and "attributes" in e["rmonIfOut"]:
-                    dn = e["rmonIfOut"]["attributes"].get("dn")
-                    output_errors = int(e["rmonIfOut"]["attributes"].get("errors", 0))
-                    if dn:
-                        before_output[dn] = output_errors
-            after_output = {}
-            for e in after.get("output_errors", []):
-                if "rmonIfOut" in e and "attributes" in e["rmonIfOut"]:
-                    dn = e["rmonIfOut"]["attributes"].get("dn")
-                    output_errors = int(e["rmonIfOut"]["attributes"].get("errors", 0))
-                    if dn:
-                        after_output[dn] = output_errors
-
-            output_changes = []
-            all_interfaces = set(before_output.keys()) | set(after_output.keys())
-            for dn in all_interfaces:
-                b = before_output.get(dn, 0)
-                a = after_output.get(dn, 0)
-                if a > b:
-                    node, intf = extract_interface_from_dn(dn)
-
-                    # === PATCH: Safe interface handling ===
-                    if intf is None:
-                        safe_interface = ""
-                    else:
-                        safe_interface = (
-                            po_map.get(f"{node}-{intf}", {}).get("name", intf)
-                            if intf.startswith("po")
-                            else intf
-                        )
-                    # =======================================
-
-                    err_eps = [
-                        ep
-                        for ep in after_eps.values()
-                        if ep["node"] == node and ep["interface"] == intf
-                    ]
-
-                    output_changes.append(
-                        {
-                            "before": b,
-                            "after": a,
-                            "node": node,
-                            "interface": safe_interface,
-                            "interface_descr": interfaces_map.get(f"{node}-{intf}", {}).get(
-                                "descr", ""
-                            ),
-                            "endpoints": err_eps,
-                        }
-                    )
-
+            output_changes = error_changes("output_errors", "errors")
             result[apic]["output_error_changes"] = output_changes
             debug(f"{apic}: interface output error changes={len(output_changes)}")
 
             # =====================
             # URIB Route
             # =====================
-            before_routes = {
-                r["uribv4Route"]["attributes"]["dn"] for r in before.get("urib_routes", [])
-            }
-            after_routes = {
-                r["uribv4Route"]["attributes"]["dn"] for r in after.get("urib_routes", [])
-            }
-            route_changes = {
-                "missing": sorted(before_routes - after_routes),
-                "new": sorted(after_routes - before_routes),
-            }
+            if not comparable("urib_routes") or unchanged(apic, "urib_routes"):
+                route_changes = {"missing": [], "new": []}
+            else:
+                before_routes = {route_dn(r) for r in before.get("urib_routes", [])}
+                after_routes = {route_dn(r) for r in after.get("urib_routes", [])}
+                route_changes = {
+                    "missing": sorted(before_routes - after_routes),
+                    "new": sorted(after_routes - before_routes),
+                }
             result[apic]["urib_route_changes"] = route_changes
             debug(f"{apic}: urib route changes={len(route_changes)}")
 
-        return result
+            result[apic]["skipped_sections"] = skipped
+            if skipped:
+                debug(f"{apic}: not compared (missing on one side): {', '.join(skipped)}")
+            progress.advance(task)
+
+        return {apic: result[apic] for apic in sorted(result)}
         
 
 
@@ -447,13 +351,11 @@ def compare_last_two(base_dir):
     customer_name = get_customer_name()
     if base_dir:
         print("base dir")
-        files = sorted(
-            glob.glob(f"{base_dir}/{customer_name}/aci/snapshot/*_snapshot_*.json")
-        )
+        folder = os.path.join(base_dir, customer_name, "aci", "snapshot")
     else:
-        files = sorted(
-            glob.glob(f"results/{customer_name}/aci/snapshot/*_snapshot_*.json")
-        )
+        folder = os.path.join("results", customer_name, "aci", "snapshot")
+    catalog.sync(folder, validate_snapshot)
+    files = [os.path.join(folder, entry.file) for entry in catalog.latest(folder, 2)]
     if len(files) < 2:
         print("❌ Not enough snapshot files found to compare.")
     else:
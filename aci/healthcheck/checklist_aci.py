@@ -17,6 +17,8 @@ from requests.cookies import RequestsCookieJar
 from openpyxl import Workbook
 from inventory.lib.credential_manager import load_key
 from aci.lib.utils import load_devices
+from aci.api.aci_client import DeadlineExceeded, get_client, load_class_query
+from aci.api.planner import ClassQuery, Filter, active_planner
 from legacy.customer_context import get_customer_name
 from cryptography.fernet import Fernet
 
@@ -24,6 +26,22 @@ from cryptography.fernet import Fernet
 # Suppress SSL warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Counter behind each interface error check: (class, counter attribute)
+INTERFACE_ERROR_COUNTERS = {
+    "crc": ("rmonEtherStats", "cRCAlignErrors"),
+    "fcs": ("rmonDot3Stats", "fCSErrors"),
+    "drop": ("rmonEgrCounters", "bufferdroppkts"),
+    "output": ("rmonIfOut", "errors"),
+}
+
+
+def healthcheck_class_queries(threshold: int = 0) -> List[ClassQuery]:
+    """Class queries the healthcheck can share with other tools in one run"""
+    queries = [ClassQuery("fabricHealthTotal")]
+    for class_name, counter in INTERFACE_ERROR_COUNTERS.values():
+        queries.append(ClassQuery(class_name, where=Filter("gt", counter, threshold)))
+    return queries
+
 
 class ACIHealthChecker:
     """Main class for ACI Health Check operations"""
@@ -35,6 +53,7 @@ class ACIHealthChecker:
         self.DEFAULT_HEALTH_THRESHOLD = 90
         self.DEFAULT_CPU_MEM_THRESHOLD = 75  # percent
         self.DEFAULT_INTERFACE_ERROR_THRESHOLD = 0
+        self.DEFAULT_RUN_BUDGET = 600  # seconds of queries per APIC
 
         self.apic_ip = ""
         self.cookies = None
@@ -66,52 +85,56 @@ class ACIHealthChecker:
     def apic_login(
         self, apic_ip: str, username: str, password: str
     ) -> Optional[RequestsCookieJar]:
-        key = load_key()
-        fernet = Fernet(key)
-
-        login_url = f"https://{apic_ip}/api/aaaLogin.json"
-        auth_payload = {
-            "aaaUser": {
-                "attributes": {
-                    "name": username,
-                    "pwd": fernet.decrypt(password.encode()).decode(),
-                }
-            }
-        }
+        client = get_client(apic_ip)
 
-        try:
-            resp = requests.post(login_url, json=auth_payload, verify=False, timeout=30)
-            if resp.status_code != 200:
-                self.console.print(
-                    f"[red]✗ Login failed with status code: {resp.status_code}[/red]"
-                )
-                return None
+        # Share the process-wide APIC token with the snapshot tools; only
+        # decrypt the password and run aaaLogin when no valid token exists.
+        with client.auth_lock:
+            try:
+                cookies = client.cached_cookies(username)
+                if cookies is not None:
+                    self.console.print(
+                        f"[green]✓ Reusing APIC session for {apic_ip}[/green]"
+                    )
+                    return cookies
 
-            # Check if login was successful
-            response_data = resp.json()
-            if "imdata" in response_data and len(response_data["imdata"]) > 0:
-                if (
-                    isinstance(response_data["imdata"][0], dict)
-                    and "error" in response_data["imdata"][0]
-                ):
+                key = load_key()
+                fernet = Fernet(key)
+
+                resp = client.login(
+                    username, fernet.decrypt(password.encode()).decode()
+                )
+                if resp.status_code != 200:
                     self.console.print(
-                        "[red]✗ Authentication failed: Invalid credentials[/red]"
+                        f"[red]✗ Login failed with status code: {resp.status_code}[/red]"
                     )
                     return None
 
-            self.console.print(
-                f"[green]✓ Successfully authenticated to APIC {apic_ip}[/green]"
-            )
-            return resp.cookies
-        except requests.exceptions.ConnectionError:
-            self.console.print(f"[red]✗ Cannot connect to APIC at {apic_ip}[/red]")
-            return None
-        except requests.exceptions.Timeout:
-            self.console.print("[red]✗ Connection timeout[/red]")
-            return None
-        except Exception as e:
-            self.console.print(f"[red]✗ Login failed: {str(e)}[/red]")
-            return None
+                # Check if login was successful
+                response_data = resp.json()
+                if "imdata" in response_data and len(response_data["imdata"]) > 0:
+                    if (
+                        isinstance(response_data["imdata"][0], dict)
+                        and "error" in response_data["imdata"][0]
+                    ):
+                        self.console.print(
+                            "[red]✗ Authentication failed: Invalid credentials[/red]"
+                        )
+                        return None
+
+                self.console.print(
+                    f"[green]✓ Successfully authenticated to APIC {apic_ip}[/green]"
+                )
+                return resp.cookies
+            except requests.exceptions.ConnectionError:
+                self.console.print(f"[red]✗ Cannot connect to APIC at {apic_ip}[/red]")
+                return None
+            except requests.exceptions.Timeout:
+                self.console.print("[red]✗ Connection timeout[/red]")
+                return None
+            except Exception as e:
+                self.console.print(f"[red]✗ Login failed: {str(e)}[/red]")
+                return None
 
     # -------------------- API Client -------------------- #
 
@@ -122,6 +145,8 @@ class ACIHealthChecker:
             self.apic_ip = apic_ip
             self.cookies = cookies
             self.console = console
+            self.client = get_client(apic_ip, cookies)
+            self.client.discover_members()
 
         def fetch_api(
             self, url: str, description: str = "Fetching data"
@@ -131,9 +156,7 @@ class ACIHealthChecker:
                 with self.console.status(
                     f"[cyan]{description}...[/cyan]", spinner="dots"
                 ):
-                    response = requests.get(
-                        url, cookies=self.cookies, verify=False, timeout=60
-                    )
+                    response = self.client.get(url)
 
                 if response.status_code != 200:
                     self.console.print(
@@ -142,7 +165,7 @@ class ACIHealthChecker:
                     return None
 
                 return response.json()
-            except requests.exceptions.Timeout:
+            except (requests.exceptions.Timeout, DeadlineExceeded):
                 self.console.print(f"[yellow]⚠ Timeout while {description}[/yellow]")
                 return None
             except Exception as e:
@@ -153,12 +176,12 @@ class ACIHealthChecker:
 
         def fetch_apic_health(self) -> Optional[Dict]:
             """Fetch APIC cluster health data"""
-            url = f"https://{self.apic_ip}/api/node/mo/topology/pod-1/node-1.json?query-target=subtree&target-subtree-class=infraWiNode"
+            url = "/api/node/mo/topology/pod-1/node-1.json?query-target=subtree&target-subtree-class=infraWiNode"
             return self.fetch_api(url, "Fetching APIC health")
 
         def fetch_top_system(self) -> Optional[Dict]:
             """Fetch topSystem data with health information"""
-            url = f"https://{self.apic_ip}/api/node/class/topSystem.json?rsp-subtree-include=health"
+            url = "/api/node/class/topSystem.json?rsp-subtree-include=health"
             return self.fetch_api(url, "Fetching node information")
 
         def fetch_faults(self, hours_back: int = 20) -> Optional[Dict]:
@@ -171,45 +194,79 @@ class ACIHealthChecker:
             time_filter = time_threshold.strftime("%Y-%m-%dT%H:%M:%S.000Z")
 
             # Filter for faults created or changed in the last specified hours
-            url = f'https://{self.apic_ip}/api/node/class/faultInst.json?query-target-filter=and(gt(faultInst.created,"{time_filter}"),or(w(severity,"critical"),w(severity,"major")))'
+            url = f'/api/node/class/faultInst.json?query-target-filter=and(gt(faultInst.created,"{time_filter}"),or(w(severity,"critical"),w(severity,"major")))'
 
             return self.fetch_api(url, f"Fetching faults from last {hours_back} hours")
 
         def fetch_cpu_mem(self) -> Tuple[Optional[Dict], Optional[Dict]]:
             """Fetch CPU and memory utilization data"""
-            cpu_url = f"https://{self.apic_ip}/api/node/class/procSysCPU1d.json"
-            mem_url = f"https://{self.apic_ip}/api/node/class/procSysMem1d.json"
+            cpu_url = "/api/node/class/procSysCPU1d.json"
+            mem_url = "/api/node/class/procSysMem1d.json"
 
             cpu_data = self.fetch_api(cpu_url, "Fetching CPU data")
             mem_data = self.fetch_api(mem_url, "Fetching memory data")
 
             return cpu_data, mem_data
 
+        def fetch_planned(self, query: ClassQuery, description: str) -> Optional[Dict]:
+            """Serve a class query from the run's query planner, if one is active"""
+            planner = active_planner()
+            if planner is None:
+                return None
+            try:
+                with self.console.status(
+                    f"[cyan]{description}...[/cyan]", spinner="dots"
+                ):
+                    mos = list(planner.fetch(self.client, query, load_class_query))
+                return {"imdata": mos}
+            except Exception as e:
+                self.console.print(
+                    f"[yellow]⚠ Error while {description}: {str(e)}[/yellow]"
+                )
+                return None
+
         def fetch_fabric_health(self) -> Optional[Dict]:
             """Fetch fabric health data"""
-            url = f"https://{self.apic_ip}/api/node/class/fabricHealthTotal.json"
+            if active_planner() is not None:
+                return self.fetch_planned(
+                    ClassQuery("fabricHealthTotal"), "Fetching fabric health"
+                )
+            url = "/api/node/class/fabricHealthTotal.json"
             return self.fetch_api(url, "Fetching fabric health")
 
-        def fetch_crc_errors(self) -> Optional[Dict]:
+        def fetch_counter_errors(
+            self, check: str, threshold: int, description: str
+        ) -> Optional[Dict]:
+            """Fetch the MOs whose error counter exceeds the threshold"""
+            class_name, counter = INTERFACE_ERROR_COUNTERS[check]
+            query = ClassQuery(class_name, where=Filter("gt", counter, threshold))
+            if active_planner() is not None:
+                return self.fetch_planned(query, description)
+            url = f"/api/node/class/{class_name}.json?query-target-filter={query.where.query(class_name)}"
+            return self.fetch_api(url, description)
+
+        def fetch_crc_errors(self, threshold: int = 0) -> Optional[Dict]:
             """Fetch CRC error statistics from rmonEtherStats"""
-            url = f"https://{self.apic_ip}/api/node/class/rmonEtherStats.json"
-            return self.fetch_api(url, "Fetching CRC error statistics")
+            return self.fetch_counter_errors(
+                "crc", threshold, "Fetching CRC error statistics"
+            )
 
-        def fetch_fcs_errors(self) -> Optional[Dict]:
+        def fetch_fcs_errors(self, threshold: int = 0) -> Optional[Dict]:
             """Fetch FCS error statistics from rmonDot3Stats"""
-            url = f"https://{self.apic_ip}/api/node/class/rmonDot3Stats.json"
-            return self.fetch_api(url, "Fetching FCS error statistics")
+            return self.fetch_counter_errors(
+                "fcs", threshold, "Fetching FCS error statistics"
+            )
 
-        def fetch_drop_errors(self) -> List[Dict]:
+        def fetch_drop_errors(self, threshold: int = 0) -> List[Dict]:
             """Get drop error statistics from rmonEgrCounters"""
-            url = f"https://{self.apic_ip}/api/node/class/rmonEgrCounters.json"
-            data = self.fetch_api(url, "Fetching drop errors")
+            data = self.fetch_counter_errors("drop", threshold, "Fetching drop errors")
             return data.get("imdata", []) if data else []
 
-        def fetch_output_errors(self) -> List[Dict]:
+        def fetch_output_errors(self, threshold: int = 0) -> List[Dict]:
             """Get output error statistics from rmonIfOut"""
-            url = f"https://{self.apic_ip}/api/node/class/rmonIfOut.json"
-            data = self.fetch_api(url, "Fetching output errors")
+            data = self.fetch_counter_errors(
+                "output", threshold, "Fetching output errors"
+            )
             return data.get("imdata", []) if data else []
 
     # -------------------- Data Processors -------------------- #
@@ -553,14 +610,14 @@ class ACIHealthChecker:
         def process_drop_errors(data: Dict, threshold: int) -> List[Dict]:
             """Process Drop error data"""
             return ACIHealthChecker.DataProcessor._process_interface_errors(
-                data, threshold, "dropPkts", "dropPkts", "drop_errors"
+                data, threshold, "bufferdroppkts", "dropPkts", "drop_errors"
             )
 
         @staticmethod
         def process_output_errors(data: Dict, threshold: int) -> List[Dict]:
             """Process Output error data"""
             return ACIHealthChecker.DataProcessor._process_interface_errors(
-                data, threshold, "outErrors", "outErrors", "output_errors"
+                data, threshold, "errors", "outErrors", "output_errors"
             )
 
         @staticmethod
@@ -1487,8 +1544,9 @@ class ACIHealthChecker:
             )
             data_saver = self.DataSaver(self.console)
 
-            # Fetch data with progress indication
-            with Progress(
+            # Fetch data with progress indication, every query within the
+            # APIC's deadline budget
+            with api_client.client.deadline_budget(self.DEFAULT_RUN_BUDGET), Progress(
                 SpinnerColumn(),
                 TextColumn("[progress.description]{task.description}"),
                 transient=True,
@@ -1515,16 +1573,24 @@ class ACIHealthChecker:
                 fabric_raw = api_client.fetch_fabric_health()
 
                 progress.add_task(description="Checking FCS errors...", total=None)
-                fcs_raw = api_client.fetch_fcs_errors()
+                fcs_raw = api_client.fetch_fcs_errors(
+                    self.DEFAULT_INTERFACE_ERROR_THRESHOLD
+                )
 
                 progress.add_task(description="Checking CRC errors...", total=None)
-                crc_raw = api_client.fetch_crc_errors()
+                crc_raw = api_client.fetch_crc_errors(
+                    self.DEFAULT_INTERFACE_ERROR_THRESHOLD
+                )
 
                 progress.add_task(description="Collecting drop errors...", total=None)
-                drop_raw = api_client.fetch_drop_errors()
+                drop_raw = api_client.fetch_drop_errors(
+                    self.DEFAULT_INTERFACE_ERROR_THRESHOLD
+                )
 
                 progress.add_task(description="Collecting output errors...", total=None)
-                output_raw = api_client.fetch_output_errors()
+                output_raw = api_client.fetch_output_errors(
+                    self.DEFAULT_INTERFACE_ERROR_THRESHOLD
+                )
 
             # Process data
             apic_nodes = data_processor.process_apic_data(apic_raw) if apic_raw else []
@@ -9,12 +9,12 @@ from rich.console import Console
 from rich.table import Column
 from rich import print as rprint
 from legacy.customer_context import get_customer_name
+from aci.api.aci_client import get_client
 import datetime
 from openpyxl import Workbook
 from openpyxl.styles import Alignment
 from openpyxl.cell.cell import MergedCell
 from openpyxl.utils import get_column_letter
-import re
 
 DEBUG = True
 
@@ -60,40 +60,42 @@ def load_devices(file=None):
 def apic_login(
     apic_ip: str, username: str, password: str
 ) -> Optional[RequestsCookieJar]:
-    key = load_key()
-    fernet = Fernet(key)
-
-    login_url = f"https://{apic_ip}/api/aaaLogin.json"
-    auth_payload = {
-        "aaaUser": {
-            "attributes": {
-                "name": username,
-                "pwd": fernet.decrypt(password.encode()).decode(),
-            }
-        }
-    }
-
-    try:
-        resp = requests.post(login_url, json=auth_payload, verify=False, timeout=30)
-        if resp.status_code != 200:
-            print(f"✗ Login failed with status code: {resp.status_code}")
-            return None
-
-        data = resp.json()
-        if "imdata" in data and len(data["imdata"]) > 0:
-            if isinstance(data["imdata"][0], dict) and "error" in data["imdata"][0]:
-                print("✗ Authentication failed: Invalid credentials.")
+    client = get_client(apic_ip)
+
+    # One login per APIC at a time; a still-valid token is reused (and
+    # refreshed when close to expiry) instead of logging in again.
+    with client.auth_lock:
+        try:
+            cookies = client.cached_cookies(username)
+            if cookies is not None:
+                console.print(f"[green]✓ Reusing APIC session for {apic_ip}[/green]")
+                return cookies
+
+            key = load_key()
+            fernet = Fernet(key)
+
+            resp = client.login(
+                username, fernet.decrypt(password.encode()).decode()
+            )
+            if resp.status_code != 200:
+                print(f"✗ Login failed with status code: {resp.status_code}")
                 return None
 
-        console.print(f"[green]✓ Successfully authenticated to APIC {apic_ip}[/green]")
-        return resp.cookies
+            data = resp.json()
+            if "imdata" in data and len(data["imdata"]) > 0:
+                if isinstance(data["imdata"][0], dict) and "error" in data["imdata"][0]:
+                    print("✗ Authentication failed: Invalid credentials.")
+                    return None
 
-    except requests.exceptions.ConnectionError:
-        print(f"✗ Cannot connect to APIC at {apic_ip}")
-    except requests.exceptions.Timeout:
-        print("✗ Connection timeout.")
-    except Exception as e:
-        print(f"✗ Login failed: {str(e)}")
+            console.print(f"[green]✓ Successfully authenticated to APIC {apic_ip}[/green]")
+            return resp.cookies
+
+        except requests.exceptions.ConnectionError:
+            print(f"✗ Cannot connect to APIC at {apic_ip}")
+        except requests.exceptions.Timeout:
+            print("✗ Connection timeout.")
+        except Exception as e:
+            print(f"✗ Login failed: {str(e)}")
 
 from rich.table import Table
 from rich.console import Console
@@ -119,6 +121,9 @@ def print_general_table(apic, result):
     fh = result.get("fabric_health", {})
     table.add_row("Fabric Health", "Before", str(fh.get("before", "N/A")))
     table.add_row("Fabric Health", "After", str(fh.get("after", "N/A")))
+    skipped = result.get("skipped_sections")
+    if skipped:
+        table.add_row("Not compared", "Sections", ", ".join(skipped))
 
     console.print(table)
 
@@ -257,23 +262,6 @@ def print_endpoints_table(apic, result):
 
     console.print(table)
 
-def normalize_faults(faults):
-    out = {}
-    for f in faults:
-        attr = f.get("faultInst", {}).get("attributes", {})
-        dn = attr.get("dn")
-        if not dn:
-            continue
-
-        out[dn] = {
-            "dn": dn,
-            "code": attr.get("code", ""),
-            "created": attr.get("created", ""),
-            "severity": attr.get("severity", ""),
-            "descr": attr.get("descr", ""),
-        }
-    return out
-
 def print_faults_table(apic, result):
     table = Table(
         title=f"[bold cyan]{apic}[/bold cyan] - [bold yellow]Faults[/bold yellow]",
@@ -486,6 +474,9 @@ def save_to_excel(all_result: dict, filename=None, base_dir=None):
         fh = result.get("fabric_health", {})
         ws.append(["Fabric Health", "Before", fh.get("before", "N/A")])
         ws.append(["Fabric Health", "After", fh.get("after", "N/A")])
+        skipped = result.get("skipped_sections")
+        if skipped:
+            ws.append(["Not compared", "Sections", ", ".join(skipped)])
         _autosize_columns(ws)
 
         # NOTE: Faults Changes
@@ -640,83 +631,6 @@ def save_to_excel(all_result: dict, filename=None, base_dir=None):
         wb.save(filepath)
     console.print(f"[cyan] ✓ Saved comparison result to: {filepath}[/cyan]")
 
-def summarize_ethpm_interfaces(data):
-    result = {}
-    for item in data:
-        attrs = item.get("ethpmPhysIf", {}).get("attributes", {})
-        dn = attrs.get("dn", "")
-        oper = attrs.get("operSt")
-        qual = attrs.get("operStQual")
-
-        # Extract eth1/33 from DN
-        if "phys-[" in dn:
-            intf = dn.split("phys-[")[-1].split("]")[0]
-            if oper:
-                result[intf] = f"{oper} ({qual})" if qual else oper
-
-    debug(f"summarize_ethpm_interfaces: parsed={len(result)}")
-    return result
-
-
-def summarize_interfaces(l1_data, ethpm_data):
-    l1_map = {}
-    for item in l1_data:
-        attrs = item.get("l1PhysIf", {}).get("attributes", {})
-        dn = attrs.get("dn", "")
-        intf = attrs.get("id")
-
-        # Extract node from DN
-        node = ""
-        for part in dn.split("/"):
-            if part.startswith("node-"):
-                node = part
-                break
-        if intf:
-            l1_map[intf] = {
-                "node": node,
-                "cfg": attrs.get("switchingSt", "unknown"),
-            }
-
-    ethpm_map = summarize_ethpm_interfaces(ethpm_data)
-
-    merged = {}
-    for intf, info in l1_map.items():
-        oper_state = ethpm_map.get(intf, "unknown")
-        merged[intf] = {
-            "node": info["node"],
-            "status": f"{info['cfg']} / {oper_state}",
-        }
-
-    debug(f"summarize_interfaces: merged interfaces={len(merged)}")
-    return merged
-
-def summarize_interface_errors(interface_errors):
-    summary = {}
-    for entry in interface_errors:
-        dn = entry.get("dn")
-        crc = int(entry.get("crc", 0))
-        input_discards = int(entry.get("inputDiscards", 0))
-        state = int(entry.get("operSt", 0))
-        total_errors = crc + input_discards
-        if dn:
-            summary[dn] = total_errors
-    return summary
-
-
-def extract_interface_from_dn(dn):
-    """
-    Extract node ID and port from DN string.
-    Example input: "topology/pod-1/node-102/sys/phys-[eth1/5]/dbgEtherStats"
-    Output: ("node-102", "eth1/5")
-    """
-    match = re.search(r"node-(\d+).*phys-\[(.*?)\]", dn)
-    if match:
-        node_id = f"node-{match.group(1)}"
-        port = match.group(2)
-        return node_id, port
-    return None, None
-
-
 def write_interface_errors(intf_ws, category: str, changes: list):
     align_center = Alignment(horizontal="center", vertical="center", wrap_text=True)
 
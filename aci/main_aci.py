@@ -8,13 +8,17 @@ from rich.console import Console
 from rich.panel import Panel
 from rich.progress import Progress, SpinnerColumn, TextColumn
 from rich.text import Text
-from aci.api.aci_client import login
-from aci.snapshot.snapshotter import take_all_snapshots
+from aci.api.aci_client import login, close_clients, SNAPSHOT_CLASS_QUERIES
+from aci.api.planner import query_plan
+from aci.snapshot.snapshotter import take_all_snapshots, delete_snapshots
 from aci.compare.comparer import (
     compare_select,
     compare_last_two,
 )
-from aci.healthcheck.checklist_aci import main_healthcheck_aci
+from aci.healthcheck.checklist_aci import (
+    main_healthcheck_aci,
+    healthcheck_class_queries,
+)
 from legacy.customer_context import get_customer_name
 from inventory.lib.path import get_data_dir
 
@@ -88,6 +92,14 @@ def show_menu():
 
     [bold]4.[/bold] Compare any two snapshots
 
+    [bold]5.[/bold] Take snapshot and run health check
+
+    [bold]6.[/bold] Take incremental snapshot (changes since the last one)
+
+    [bold]7.[/bold] Delete a snapshot
+
+    [bold]8.[/bold] Take counters-only snapshot (quick pre/post change check)
+
     [bold]q.[/bold] Exit
     """
     console.print(
@@ -130,8 +142,35 @@ def main():
             compare_select(base_dir)
             pause()
 
+        elif choice == "5":
+            slow_print("Taking ACI Snapshot and running Health check...", style="green")
+            # One planner for both tools: fabricHealthTotal is fetched once
+            # per APIC, and the healthcheck's rmonEtherStats, rmonEgrCounters
+            # and rmonIfOut checks are answered from the snapshot's l1PhysIf
+            # subtree
+            with query_plan(SNAPSHOT_CLASS_QUERIES + healthcheck_class_queries()):
+                take_all_snapshots(base_dir)
+                main_healthcheck_aci(base_dir=base_dir)
+            pause()
+
+        elif choice == "6":
+            slow_print("Taking incremental ACI Snapshot...", style="green")
+            take_all_snapshots(base_dir, incremental=True)
+            pause()
+
+        elif choice == "7":
+            delete_snapshots(base_dir)
+            pause()
+
+        elif choice == "8":
+            slow_print("Taking counters-only ACI Snapshot...", style="green")
+            take_all_snapshots(base_dir, profile="counters")
+            pause()
+
         elif choice == "q":
             slow_print("Exit ACI Tools...", style="green")
+            # Pooled APIC sessions are reopened on demand next time.
+            close_clients()
             time.sleep(0.3)
             print("✅ Goodbye! 👋")
             break
@@ -0,0 +1,354 @@
+# SQLite catalog of a customer's snapshot folder.
+#
+# <snapshot dir>/catalog.sqlite3 holds one row per snapshot file (timestamp,
+# format, size, validation status), one per fabric it covers (with the
+# snapshot profile it was taken with) and one per
+# section with its record count, blob digest (manifest snapshots) or byte
+# offset in the uncompressed stream (JSON snapshots). The snapshotter adds
+# a row as it writes each file; files the catalog has not seen (older
+# releases, copied in by hand) or that changed on disk are indexed the
+# next time the folder is listed, and rows of deleted files are dropped.
+
+import datetime
+import logging
+import os
+import sqlite3
+from collections import namedtuple
+from contextlib import closing, contextmanager
+
+from aci.snapshot.storage import (
+    MANIFEST_SUFFIX,
+    SNAPSHOT_SUFFIXES,
+    load_snapshot,
+    section_digests,
+    snapshot_files,
+)
+
+CATALOG_NAME = "catalog.sqlite3"
+CATALOG_VERSION = 2
+# Timestamp format of snapshot file names, which sorts chronologically.
+# A second snapshot within the same minute also carries the seconds.
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H-%M"
+TIMESTAMP_SECONDS_FORMAT = TIMESTAMP_FORMAT + "-%S"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    file TEXT NOT NULL UNIQUE,
+    taken TEXT NOT NULL,
+    format TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    valid INTEGER NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS snapshots_taken ON snapshots (taken, file);
+CREATE TABLE IF NOT EXISTS fabrics (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+    fabric TEXT NOT NULL,
+    schema INTEGER,
+    profile TEXT,
+    valid INTEGER NOT NULL,
+    PRIMARY KEY (snapshot_id, fabric)
+);
+CREATE INDEX IF NOT EXISTS fabrics_fabric ON fabrics (fabric);
+CREATE TABLE IF NOT EXISTS sections (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+    fabric TEXT NOT NULL,
+    key TEXT NOT NULL,
+    records INTEGER,
+    digest TEXT,
+    offset INTEGER,
+    length INTEGER,
+    PRIMARY KEY (snapshot_id, fabric, key)
+);
+"""
+
+# A cataloged snapshot; `fabrics` is a tuple of hostnames and `profile`
+# the snapshot profile of its fabrics ("mixed" when they differ).
+SnapshotEntry = namedtuple("SnapshotEntry", "file taken format size valid fabrics profile")
+
+
+def catalog_path(folder):
+    return os.path.join(folder, CATALOG_NAME)
+
+
+@contextmanager
+def connect(folder):
+    """Open (creating if needed) the catalog of a snapshot folder."""
+    os.makedirs(folder, exist_ok=True)
+    with closing(sqlite3.connect(catalog_path(folder), timeout=30)) as conn:
+        conn.execute("PRAGMA foreign_keys = ON")
+        if conn.execute("PRAGMA user_version").fetchone()[0] != CATALOG_VERSION:
+            # Rebuilt from the files on disk rather than migrated.
+            conn.executescript(
+                "DROP TABLE IF EXISTS sections; DROP TABLE IF EXISTS fabrics;"
+                " DROP TABLE IF EXISTS snapshots;"
+            )
+            conn.executescript(SCHEMA)
+            conn.execute(f"PRAGMA user_version = {CATALOG_VERSION}")
+        with conn:
+            yield conn
+
+
+def split_name(name):
+    """(timestamp, format) of a snapshot file name."""
+    for suffix in SNAPSHOT_SUFFIXES:
+        if name.endswith(suffix):
+            stem = name[: -len(suffix)]
+            fmt = "manifest" if suffix == MANIFEST_SUFFIX else suffix[1:]
+            return stem.split("_snapshot_", 1)[-1], fmt
+    raise ValueError(f"Not a snapshot file: {name}")
+
+
+def summarize(data, validate=None):
+    """What the catalog keeps of one fabric's data: validity, schema, profile, record counts.
+
+    `validate(data)` decides the validation status; empty data (a fabric
+    that could not be collected) is never valid.
+    """
+    return {
+        "valid": bool(data) and (validate is None or bool(validate(data))),
+        "schema": data.get("schema", 1) if data else None,
+        # Snapshots from before profiles existed are full ones.
+        "profile": data.get("profile", "full") if data else None,
+        "records": {
+            key: len(value) if isinstance(value, list) else None
+            for key, value in (data or {}).items()
+        },
+    }
+
+
+def _insert(conn, folder, name, summaries, layout, error=None):
+    path = os.path.join(folder, name)
+    stat = os.stat(path)
+    taken, fmt = split_name(name)
+    valid = {hostname: summary["valid"] for hostname, summary in summaries.items()}
+    conn.execute("DELETE FROM snapshots WHERE file = ?", (name,))
+    snapshot_id = conn.execute(
+        "INSERT INTO snapshots (file, taken, format, size, mtime, valid, error)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (
+            name,
+            taken,
+            fmt,
+            stat.st_size,
+            stat.st_mtime,
+            int(error is None and bool(valid) and all(valid.values())),
+            error,
+        ),
+    ).lastrowid
+    conn.executemany(
+        "INSERT INTO fabrics (snapshot_id, fabric, schema, profile, valid) VALUES (?, ?, ?, ?, ?)",
+        [
+            (
+                snapshot_id,
+                hostname,
+                summary["schema"],
+                summary.get("profile"),
+                int(summary["valid"]),
+            )
+            for hostname, summary in summaries.items()
+        ],
+    )
+    rows = []
+    for hostname, summary in summaries.items():
+        for key, records in summary["records"].items():
+            placement = layout.get((hostname, key), {})
+            if records is None and not placement:
+                continue
+            rows.append(
+                (
+                    snapshot_id,
+                    hostname,
+                    key,
+                    records,
+                    placement.get("digest"),
+                    placement.get("offset"),
+                    placement.get("length"),
+                )
+            )
+    conn.executemany(
+        "INSERT INTO sections (snapshot_id, fabric, key, records, digest, offset, length)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+
+
+def add_snapshot(path, summaries, layout=None):
+    """Catalog a snapshot just written.
+
+    `summaries` is {hostname: summarize(data)} of its fabrics and `layout`
+    what write_snapshot (or SnapshotWriter.finish) reported.
+    """
+    folder, name = os.path.split(path)
+    with connect(folder) as conn:
+        _insert(conn, folder, name, summaries, layout or {})
+
+
+def remove_snapshot(path):
+    folder, name = os.path.split(path)
+    with connect(folder) as conn:
+        conn.execute("DELETE FROM snapshots WHERE file = ?", (name,))
+
+
+def index_file(conn, folder, name, validate=None):
+    """Catalog a snapshot file the catalog has not seen, by loading it."""
+    path = os.path.join(folder, name)
+    try:
+        fabrics = load_snapshot(path)
+        layout = {
+            (hostname, key): {"digest": digest}
+            for hostname, sections in section_digests(path).items()
+            for key, digest in sections.items()
+        }
+    except (OSError, ValueError, EOFError, RuntimeError) as e:
+        logging.warning(f"Could not read snapshot {path}: {e}")
+        _insert(conn, folder, name, {}, {}, error=str(e))
+        return
+    summaries = {hostname: summarize(data, validate) for hostname, data in fabrics.items()}
+    _insert(conn, folder, name, summaries, layout)
+
+
+def sync(folder, validate=None):
+    """Bring the catalog in line with the snapshot files in `folder`."""
+    names = set(snapshot_files(folder))
+    if not names and not os.path.exists(catalog_path(folder)):
+        return
+    with connect(folder) as conn:
+        known = {
+            name: (size, mtime)
+            for name, size, mtime in conn.execute("SELECT file, size, mtime FROM snapshots")
+        }
+        for name in known.keys() - names:
+            conn.execute("DELETE FROM snapshots WHERE file = ?", (name,))
+        for name in sorted(names):
+            stat = os.stat(os.path.join(folder, name))
+            if known.get(name) != (stat.st_size, stat.st_mtime):
+                index_file(conn, folder, name, validate)
+
+
+def find_snapshots(folder, since=None, until=None, fabric=None, limit=None, newest_first=False):
+    """Cataloged snapshots, oldest first unless `newest_first`.
+
+    `since`/`until` (datetime or file-name timestamp string, inclusive)
+    bound the time taken; `fabric` keeps snapshots covering that APIC.
+    """
+    if not os.path.exists(catalog_path(folder)):
+        return []
+    where, params = [], []
+    if since is not None:
+        where.append("s.taken >= ?")
+        params.append(_timestamp(since))
+    if until is not None:
+        where.append("s.taken <= ?")
+        params.append(_timestamp(until))
+    if fabric is not None:
+        where.append("s.id IN (SELECT snapshot_id FROM fabrics WHERE fabric = ?)")
+        params.append(fabric)
+    sql = (
+        "SELECT s.file, s.taken, s.format, s.size, s.valid,"
+        " (SELECT group_concat(fabric, char(10)) FROM fabrics WHERE snapshot_id = s.id),"
+        " (SELECT group_concat(DISTINCT profile) FROM fabrics WHERE snapshot_id = s.id)"
+        " FROM snapshots s"
+    )
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    order = "DESC" if newest_first else "ASC"
+    sql += f" ORDER BY s.taken {order}, s.file {order}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    with connect(folder) as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [
+        SnapshotEntry(
+            file,
+            taken,
+            fmt,
+            size,
+            bool(valid),
+            tuple(sorted(fabrics.split("\n"))) if fabrics else (),
+            _profile(profiles),
+        )
+        for file, taken, fmt, size, valid, fabrics, profiles in rows
+    ]
+
+
+def latest(folder, count=1):
+    """The `count` most recent cataloged snapshots, oldest first."""
+    return find_snapshots(folder, limit=count, newest_first=True)[::-1]
+
+
+def sections(folder, name):
+    """{hostname: {key: {"records", "digest", "offset", "length"}}} of one snapshot."""
+    with connect(folder) as conn:
+        rows = conn.execute(
+            "SELECT c.fabric, c.key, c.records, c.digest, c.offset, c.length"
+            " FROM sections c JOIN snapshots s ON s.id = c.snapshot_id WHERE s.file = ?",
+            (name,),
+        ).fetchall()
+    out = {}
+    for fabric, key, records, digest, offset, length in rows:
+        out.setdefault(fabric, {})[key] = {
+            "records": records,
+            "digest": digest,
+            "offset": offset,
+            "length": length,
+        }
+    return out
+
+
+def stream_offsets(path):
+    """{hostname: {key: (offset, length)}} of a JSON snapshot, in file order.
+
+    None when the catalog has no offsets for the file or they were
+    recorded for a different version of it.
+    """
+    folder, name = os.path.split(path)
+    if not os.path.exists(catalog_path(folder)):
+        return None
+    stat = os.stat(path)
+    with connect(folder) as conn:
+        row = conn.execute(
+            "SELECT id, size, mtime FROM snapshots WHERE file = ?", (name,)
+        ).fetchone()
+        if row is None or (row[1], row[2]) != (stat.st_size, stat.st_mtime):
+            return None
+        rows = conn.execute(
+            "SELECT fabric, key, offset, length FROM sections"
+            " WHERE snapshot_id = ? ORDER BY offset",
+            (row[0],),
+        ).fetchall()
+        fabrics = conn.execute(
+            "SELECT fabric FROM fabrics WHERE snapshot_id = ?", (row[0],)
+        ).fetchall()
+    if not rows or any(offset is None for _, _, offset, _ in rows):
+        return None
+    offsets = {}
+    for fabric, key, offset, length in rows:
+        offsets.setdefault(fabric, {})[key] = (offset, length)
+    for (fabric,) in fabrics:
+        offsets.setdefault(fabric, {})
+    return offsets
+
+
+def parse_taken(taken):
+    """The datetime of a file-name timestamp; ValueError when it is not one."""
+    try:
+        return datetime.datetime.strptime(taken, TIMESTAMP_FORMAT)
+    except ValueError:
+        return datetime.datetime.strptime(taken, TIMESTAMP_SECONDS_FORMAT)
+
+
+def _profile(profiles):
+    # group_concat of the distinct, non-null fabric profiles.
+    if not profiles:
+        return "full"
+    return "mixed" if "," in profiles else profiles
+
+
+def _timestamp(value):
+    if hasattr(value, "strftime"):
+        return value.strftime(TIMESTAMP_FORMAT)
+    return value
@@ -0,0 +1,158 @@
+# Incremental snapshot collection.
+#
+# Every snapshot records, per tracked class, the object count and the
+# newest modTs seen just before it was collected ("high_water"). An
+# incremental snapshot fetches only the MOs modified since those marks
+# (query-target-filter=gt(<class>.modTs,...)), normalizes them into
+# schema records, merges those onto the previous snapshot by dn and
+# checks the merged result against the APIC's object counts. A class
+# whose count does not add up (something was deleted) is collected in
+# full instead.
+
+import logging
+
+from rich.console import Console
+
+from aci.api.aci_client import (
+    FAULTS_QUERY,
+    URIB_ROUTES_QUERY,
+    ENDPOINTS_QUERY,
+    load_class_query,
+)
+from aci.api.cache import probe_class
+from aci.api.planner import ClassQuery, Filter
+from aci.snapshot.schema import RECORDS, record_dn
+
+console = Console()
+
+# Tracked class -> the snapshot key it is collected for.
+TRACKED_CLASSES = {
+    "faultInst": "faults",
+    "uribv4Route": "urib_routes",
+    "fvCEp": "endpoints",
+    "fvIp": "endpoints",
+}
+# Snapshot keys that are records of one class, merged by dn.
+INCREMENTAL_QUERIES = {
+    "faults": FAULTS_QUERY,
+    "urib_routes": URIB_ROUTES_QUERY,
+}
+INCREMENTAL_KEYS = tuple(INCREMENTAL_QUERIES) + ("endpoints",)
+
+
+def high_water_marks(client, keys=None):
+    """{class: {"count", "modTs"}} of the tracked classes, as of now.
+
+    With `keys`, only the classes behind those snapshot keys are probed.
+    """
+    marks = {}
+    for class_name, key in TRACKED_CLASSES.items():
+        if keys is not None and key not in keys:
+            continue
+        count, newest = probe_class(client, class_name)
+        marks[class_name] = {"count": count, "modTs": newest}
+    return marks
+
+
+def changed_since(client, query, since):
+    """MOs of the query's class (and children) modified after `since`.
+
+    The query's own filter is not sent: an MO that stopped matching it
+    must come back too, so it can be dropped from the merged state.
+    """
+    changed = ClassQuery(query.class_name, query.children, Filter("gt", "modTs", since))
+    return load_class_query(client, changed)
+
+
+def server_count(client, query):
+    params = {}
+    if query.where is not None:
+        params["query-target-filter"] = query.where.query(query.class_name)
+    return client.count_class(query.class_name, params)
+
+
+def _mo_dn(mo):
+    return next(iter(mo.values())).get("attributes", {}).get("dn", "")
+
+
+def update_class(client, key, prior, marks):
+    """Merged records for an INCREMENTAL_QUERIES key, or None to collect it in full."""
+    query = INCREMENTAL_QUERIES[key]
+    since = marks.get(query.class_name, {}).get("modTs")
+    if not since:
+        return None
+
+    merged = {record_dn(key, record): record for record in prior}
+    changed = 0
+    for mo in changed_since(client, query, since):
+        changed += 1
+        attrs = next(iter(mo.values())).get("attributes", {})
+        record = RECORDS[key](mo)
+        if record is not None and (query.where is None or query.where.matches(attrs)):
+            merged[record_dn(key, record)] = record
+        else:
+            merged.pop(_mo_dn(mo), None)
+
+    expected = server_count(client, query)
+    if expected != len(merged):
+        logging.info(
+            f"{key} on {client.apic_ip}: {len(merged)} after merge, APIC has {expected}; collecting in full"
+        )
+        return None
+    console.print(
+        f"[green]✓ {key} updated incrementally from {client.apic_ip} ({changed} changed).[/green]"
+    )
+    return list(merged.values())
+
+
+def update_endpoints(client, prior, marks, epg_map, endpoint_records):
+    """Merged endpoint records, or None to collect the endpoints in full.
+
+    Records are grouped by their fvCEp dn. A changed fvCEp replaces all of
+    its records; an fvIp created under an unchanged fvCEp adds one record
+    cloned from that endpoint's existing ones.
+    """
+    cep_since = marks.get("fvCEp", {}).get("modTs")
+    ip_since = marks.get("fvIp", {}).get("modTs")
+    if not cep_since or not ip_since:
+        return None
+
+    by_cep = {}
+    for record in prior:
+        by_cep.setdefault(record.get("dn", ""), []).append(record)
+
+    changed_ceps = set()
+    for ep in changed_since(client, ENDPOINTS_QUERY, cep_since):
+        dn = _mo_dn(ep)
+        changed_ceps.add(dn)
+        by_cep[dn] = endpoint_records(ep, epg_map)
+
+    for mo in changed_since(client, ClassQuery("fvIp"), ip_since):
+        attrs = mo.get("fvIp", {}).get("attributes", {})
+        parent = attrs.get("dn", "").rsplit("/ip-[", 1)[0]
+        if parent in changed_ceps:
+            continue
+        records = by_cep.get(parent)
+        if not records:
+            return None
+        addr = attrs.get("addr", "")
+        if any(r.get("ip") == addr for r in records):
+            continue
+        by_cep[parent] = [r for r in records if r.get("ip")] + [dict(records[0], ip=addr)]
+
+    with_ip = sum(1 for records in by_cep.values() for r in records if r.get("ip"))
+    if (
+        client.count_class("fvCEp") != len(by_cep)
+        or client.count_class("fvIp") != with_ip
+    ):
+        logging.info(f"endpoints on {client.apic_ip}: counts changed; collecting in full")
+        return None
+
+    merged = []
+    for dn, records in by_cep.items():
+        epg_descr = epg_map.get(dn.split("/cep-")[0] if "/cep-" in dn else "", "")
+        merged.extend(dict(r, epg_descr=epg_descr) for r in records)
+    console.print(
+        f"[green]✓ endpoints updated incrementally from {client.apic_ip} ({len(changed_ceps)} changed).[/green]"
+    )
+    return merged
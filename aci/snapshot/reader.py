@@ -0,0 +1,137 @@
+# Lazy, section-level access to a snapshot file.
+#
+# A SnapshotReader lists the fabrics of a snapshot without loading them and
+# hands out one fabric at a time as a read-only mapping whose sections are
+# loaded on first access:
+#   - manifest snapshots read the small manifest and then one blob per
+#     section asked for;
+#   - JSON snapshots with catalog offsets read just that fabric's byte
+#     range of the stream;
+#   - anything else (msgpack, files the catalog does not know) is loaded
+#     whole once, as before.
+# Sections of older snapshots are normalized to the current schema as they
+# are loaded.
+
+import json
+from collections.abc import Mapping
+
+from aci.snapshot.catalog import stream_offsets
+from aci.snapshot.schema import SCHEMA_VERSION, normalize_section
+from aci.snapshot.storage import (
+    BLOB_REF,
+    blob_folder,
+    get_blob,
+    is_manifest,
+    load_manifest,
+    load_snapshot,
+    read_range,
+)
+
+
+class FabricSections(Mapping):
+    """One APIC's snapshot data, each section loaded when first read."""
+
+    def __init__(self, keys, load):
+        self._keys = list(keys)
+        self._load = load
+        self._loaded = {}
+        self._schema = None
+
+    def __getitem__(self, key):
+        if key not in self._loaded:
+            if key not in self._keys:
+                raise KeyError(key)
+            value = self._load(key)
+            if isinstance(value, list) and self.schema != SCHEMA_VERSION:
+                value = normalize_section(key, value)
+            self._loaded[key] = value
+        return self._loaded[key]
+
+    def __contains__(self, key):
+        # Mapping's default goes through __getitem__ and would load the section.
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    @property
+    def schema(self):
+        if self._schema is None:
+            self._schema = self._load("schema") if "schema" in self._keys else 1
+        return self._schema
+
+
+class SnapshotReader:
+    """Fabric-by-fabric reader of a snapshot file of any format."""
+
+    def __init__(self, path):
+        self.path = path
+        self._manifest = None
+        self._offsets = None
+        self._data = None
+        if is_manifest(path):
+            self._manifest = load_manifest(path)
+        else:
+            self._offsets = stream_offsets(path)
+            if self._offsets is None:
+                self._data = load_snapshot(path)
+
+    def fabrics(self):
+        """Hostnames in the snapshot, in file order."""
+        if self._manifest is not None:
+            return list(self._manifest)
+        if self._offsets is not None:
+            return list(self._offsets)
+        return list(self._data)
+
+    def digests(self, hostname):
+        """{key: blob digest} of a fabric's sections; {} unless a manifest."""
+        if self._manifest is None:
+            return {}
+        return {
+            key: value[BLOB_REF]
+            for key, value in self._manifest.get(hostname, {}).items()
+            if isinstance(value, dict) and set(value) == {BLOB_REF}
+        }
+
+    def fabric(self, hostname):
+        """A fabric's data as a lazily loaded mapping ({} when not in the snapshot)."""
+        if self._manifest is not None:
+            return self._manifest_fabric(hostname)
+        if self._offsets is not None:
+            return self._stream_fabric(hostname)
+        data = self._data.get(hostname, {})
+        return FabricSections(data, data.get)
+
+    def _manifest_fabric(self, hostname):
+        entries = self._manifest.get(hostname, {})
+        folder = blob_folder(self.path)
+        refs = self.digests(hostname)
+
+        def load(key):
+            if key in refs:
+                return get_blob(folder, refs[key])
+            return entries[key]
+
+        return FabricSections(entries, load)
+
+    def _stream_fabric(self, hostname):
+        offsets = self._offsets.get(hostname, {})
+        span = {}
+
+        def load(key):
+            # The whole fabric is read in one pass on first use, so the
+            # stream is decompressed once per fabric rather than per section.
+            if not span:
+                start = min(offset for offset, _ in offsets.values())
+                end = max(offset + length for offset, length in offsets.values())
+                span["start"] = start
+                span["bytes"] = read_range(self.path, start, end - start)
+            offset, length = offsets[key]
+            begin = offset - span["start"]
+            return json.loads(span["bytes"][begin : begin + length])
+
+        return FabricSections(offsets, load)
@@ -0,0 +1,112 @@
+# Retention of a customer's ACI snapshot folder.
+#
+# apply_retention runs the shared retention rules over the cataloged
+# snapshots: old snapshots beyond the hourly/daily representatives are
+# deleted, and representatives past the compaction age are rewritten in
+# summary form. A compacted fabric keeps its health, fault set, counter
+# totals and per-class record counts, which is what long-term trending
+# needs, and is marked {"compacted": true}.
+
+import logging
+import os
+
+from inventory.lib.retention import DEFAULT_RETENTION, plan_retention
+from aci.snapshot import catalog
+from aci.snapshot.reader import SnapshotReader
+from aci.snapshot.schema import COUNTER_FIELDS, SCHEMA_VERSION
+from aci.snapshot.storage import gc_blobs, write_snapshot
+
+# Retention rules of the ACI snapshot folders; None keeps everything.
+SNAPSHOT_RETENTION = DEFAULT_RETENTION
+# Kept as they are in a compacted fabric.
+SUMMARY_KEYS = ("profile", "fabric_health", "faults", "collection_errors", "collection_seconds")
+
+
+def compact_fabric(data):
+    """The summary form of one fabric's snapshot data."""
+    if not data or data.get("compacted"):
+        return dict(data)
+    summary = {"schema": SCHEMA_VERSION, "compacted": True}
+    summary.update((key, data[key]) for key in SUMMARY_KEYS if key in data)
+    summary["counter_totals"] = {
+        key: sum(record[field] for record in data[key])
+        for key, field in COUNTER_FIELDS.items()
+        if key in data
+    }
+    summary["records"] = {
+        key: len(value) for key, value in data.items() if isinstance(value, list)
+    }
+    return summary
+
+
+def is_compacted(path):
+    reader = SnapshotReader(path)
+    return all(
+        not fabric or fabric.get("compacted")
+        for fabric in (reader.fabric(hostname) for hostname in reader.fabrics())
+    )
+
+
+def compact_snapshot(path, validate=None):
+    """Rewrite a snapshot in summary form, in place, one fabric at a time.
+
+    `validate` is passed to catalog.summarize for the compacted fabrics.
+    """
+    reader = SnapshotReader(path)
+    fabrics = {hostname: compact_fabric(reader.fabric(hostname)) for hostname in reader.fabrics()}
+    layout = {}
+    write_snapshot(path, fabrics, layout)
+    catalog.add_snapshot(
+        path,
+        {hostname: catalog.summarize(data, validate) for hostname, data in fabrics.items()},
+        layout,
+    )
+
+
+def apply_retention(folder, policy=SNAPSHOT_RETENTION, now=None, validate=None):
+    """Apply the retention rules to a snapshot folder; returns (compacted, deleted) counts.
+
+    `validate` is passed to catalog.sync for files indexed on the way and
+    to compact_snapshot. A snapshot that cannot be removed is left in the
+    catalog and retried on the next run.
+    """
+    if policy is None or not os.path.isdir(folder):
+        return 0, 0
+    catalog.sync(folder, validate)
+    taken = []
+    full = set()
+    for entry in catalog.find_snapshots(folder):
+        try:
+            taken.append((entry.file, catalog.parse_taken(entry.taken)))
+        except ValueError:
+            continue  # not named by the snapshotter; left alone
+        if entry.profile == "full":
+            full.add(entry.file)
+    # Full snapshots represent their hour/day ahead of counters-only ones,
+    # so long-term trending keeps health, endpoints and routes.
+    plan = plan_retention(taken, policy, now, preferred=full)
+
+    compacted = 0
+    for name in plan.compact:
+        path = os.path.join(folder, name)
+        try:
+            if not is_compacted(path):
+                compact_snapshot(path, validate)
+                compacted += 1
+        except (OSError, ValueError, EOFError, RuntimeError) as e:
+            logging.warning(f"Could not compact snapshot {path}: {e}")
+    deleted = 0
+    for name in plan.delete:
+        path = os.path.join(folder, name)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Could not delete snapshot {path}: {e}")
+            continue
+        catalog.remove_snapshot(path)
+        deleted += 1
+    if compacted or deleted:
+        gc_blobs(folder)
+    return compacted, deleted
@@ -0,0 +1,199 @@
+# Normalized snapshot schema (version 2).
+#
+# Version 1 snapshots store the APIC's imdata wrappers as returned
+# ({"l1PhysIf": {"attributes": {...}}}), so every comparison re-parsed
+# node, port, VRF and prefix out of the DNs. Version 2 snapshots carry
+# {"schema": 2} and hold each class as flat records, normalized once when
+# the snapshot is taken:
+#
+#   faults            {"dn", "code", "created", "severity", "descr"}
+#   interfaces        {"node", "port", "descr", "switching"}
+#   interface_errors  {"node", "port", "oper", "qual"}
+#   crc_errors        {"node", "port", "crc"}
+#   drop_errors       {"node", "port", "drops"}
+#   output_errors     {"node", "port", "errors"}
+#   urib_routes       {"pod", "node", "vrf", "prefix"}
+#   path_ep           {"pod", "node", "port", "targets"}
+#   pc_aggr           {"node", "port", "name", "members"}
+#
+# Switch nodes are ints (101 for node-101) and counters are ints.
+# Endpoints are already records and fabric_health is a number. upgrade()
+# turns a version 1 snapshot into version 2 when it is loaded.
+
+import re
+
+SCHEMA_VERSION = 2
+
+NODE_RE = re.compile(r"/node-(\d+)(?:/|$)")
+PHYS_RE = re.compile(r"node-(\d+).*phys-\[(.*?)\]")
+ROUTE_RE = re.compile(
+    r"^topology/pod-(\d+)/node-(\d+)/sys/uribv4/dom-(.+)/db-rt/rt-\[(.*)\]$"
+)
+PATH_EP_RE = re.compile(r"^topology/pod-(\d+)/(?:prot)?paths-([\d-]+)/pathep-\[(.*)\]$")
+
+
+def _attrs(mo, class_name):
+    return mo.get(class_name, {}).get("attributes", {})
+
+
+def _children(mo, class_name, child_class, prop):
+    return [
+        child[child_class]["attributes"].get(prop, "")
+        for child in mo.get(class_name, {}).get("children", [])
+        if child_class in child
+    ]
+
+
+def _node(dn):
+    match = NODE_RE.search(dn)
+    return int(match.group(1)) if match else None
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def fault_record(mo):
+    attrs = _attrs(mo, "faultInst")
+    if not attrs.get("dn"):
+        return None
+    return {
+        "dn": attrs["dn"],
+        "code": attrs.get("code", ""),
+        "created": attrs.get("created", ""),
+        "severity": attrs.get("severity", ""),
+        "descr": attrs.get("descr", ""),
+    }
+
+
+def interface_record(mo):
+    attrs = _attrs(mo, "l1PhysIf")
+    if not attrs.get("id"):
+        return None
+    return {
+        "node": _node(attrs.get("dn", "")),
+        "port": attrs["id"],
+        "descr": attrs.get("descr", ""),
+        "switching": attrs.get("switchingSt", "unknown"),
+    }
+
+
+def oper_state_record(mo):
+    attrs = _attrs(mo, "ethpmPhysIf")
+    match = PHYS_RE.search(attrs.get("dn", ""))
+    if not match:
+        return None
+    return {
+        "node": int(match.group(1)),
+        "port": match.group(2),
+        "oper": attrs.get("operSt", ""),
+        "qual": attrs.get("operStQual", ""),
+    }
+
+
+def _counter_record(class_name, prop, field):
+    def record(mo):
+        attrs = _attrs(mo, class_name)
+        # Counters not under a physical port (port-channel aggregates)
+        # cannot be tied to an interface and are not compared.
+        match = PHYS_RE.search(attrs.get("dn", ""))
+        if not match:
+            return None
+        return {
+            "node": int(match.group(1)),
+            "port": match.group(2),
+            field: _int(attrs.get(prop, 0)),
+        }
+
+    return record
+
+
+def route_record(mo):
+    dn = _attrs(mo, "uribv4Route").get("dn", "")
+    match = ROUTE_RE.match(dn)
+    if not match:
+        return {"dn": dn} if dn else None
+    pod, node, vrf, prefix = match.groups()
+    return {"pod": int(pod), "node": int(node), "vrf": vrf, "prefix": prefix}
+
+
+def route_dn(record):
+    """The uribv4Route DN a route record was normalized from."""
+    if "dn" in record:
+        return record["dn"]
+    return (
+        f"topology/pod-{record['pod']}/node-{record['node']}/sys/uribv4/"
+        f"dom-{record['vrf']}/db-rt/rt-[{record['prefix']}]"
+    )
+
+
+def path_ep_record(mo):
+    dn = _attrs(mo, "fabricPathEp").get("dn", "")
+    match = PATH_EP_RE.match(dn)
+    if not match:
+        return None
+    return {
+        "pod": int(match.group(1)),
+        "node": match.group(2),
+        "port": match.group(3),
+        "targets": _children(mo, "fabricPathEp", "fabricRsPathToIf", "tDn"),
+    }
+
+
+def port_channel_record(mo):
+    attrs = _attrs(mo, "pcAggrIf")
+    return {
+        "node": _node(attrs.get("dn", "")),
+        "port": attrs.get("id", ""),
+        "name": attrs.get("name", ""),
+        "members": _children(mo, "pcAggrIf", "pcRsMbrIfs", "tDn"),
+    }
+
+
+# Counter snapshot keys and the record field holding the counter.
+COUNTER_FIELDS = {"crc_errors": "crc", "drop_errors": "drops", "output_errors": "errors"}
+
+# Snapshot key -> MO -> record (None drops the MO). Keys not listed are
+# stored as collected.
+RECORDS = {
+    "faults": fault_record,
+    "interfaces": interface_record,
+    "interface_errors": oper_state_record,
+    "crc_errors": _counter_record("rmonEtherStats", "cRCAlignErrors", COUNTER_FIELDS["crc_errors"]),
+    "drop_errors": _counter_record("rmonEgrCounters", "bufferdroppkts", COUNTER_FIELDS["drop_errors"]),
+    "output_errors": _counter_record("rmonIfOut", "errors", COUNTER_FIELDS["output_errors"]),
+    "urib_routes": route_record,
+    "path_ep": path_ep_record,
+    "pc_aggr": port_channel_record,
+}
+
+
+def normalize_section(key, mos):
+    """Records of one snapshot key from its collected MOs."""
+    record = RECORDS.get(key)
+    if record is None:
+        return mos
+    records = []
+    for mo in mos:
+        item = record(mo)
+        if item is not None:
+            records.append(item)
+    return records
+
+
+def record_dn(key, record):
+    """The DN identifying a record of a key merged by dn (faults, routes)."""
+    return route_dn(record) if key == "urib_routes" else record.get("dn", "")
+
+
+def upgrade(data):
+    """One APIC's snapshot data in the current schema."""
+    if not data or data.get("schema") == SCHEMA_VERSION:
+        return data
+    upgraded = {"schema": SCHEMA_VERSION}
+    for key, value in data.items():
+        upgraded[key] = normalize_section(key, value) if isinstance(value, list) else value
+    return upgraded
@@ -1,14 +1,16 @@
 # ✅ Updated snapshotter.py to include timestamped filenames and history viewer with interactive snapshot comparison
 
 import re
-import json
 import os
 import datetime
 import logging
+import sqlite3
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from aci.api.aci_client import (
     get_drop_errors,
     get_epgs,
-    get_endpoints_with_ip,
+    iter_endpoint_mos,
     get_fabric_health,
     get_faults,
     get_interface_status,
@@ -18,9 +20,33 @@ from aci.api.aci_client import (
     get_crc_errors,
     get_output_path_ep,
     get_pc_aggr,
+    get_interface_counters,
+    get_client,
+    client_metrics,
+    shard_plan,
+    INTERFACE_COUNTER_KEYS,
+)
+from aci.api.shards import DEFAULT_SHARD_POLICY
+from aci.snapshot import catalog
+from aci.snapshot.retention import apply_retention
+from aci.snapshot.storage import (
+    PARTIAL_SUFFIX,
+    SnapshotWriter,
+    delete_snapshot,
+    partial_snapshots,
+    snapshot_filename,
+)
+from aci.snapshot.reader import FabricSections, SnapshotReader
+from aci.snapshot.schema import SCHEMA_VERSION, normalize_section, upgrade
+from aci.snapshot.incremental import (
+    INCREMENTAL_KEYS,
+    high_water_marks,
+    update_class,
+    update_endpoints,
 )
 from aci.lib.utils import load_devices, apic_login
 from rich.console import Console
+from rich.table import Table
 from legacy.customer_context import get_customer_name
 
 console = Console()
@@ -29,6 +55,24 @@ logging.basicConfig(
 )
 
 
+# Worker threads per APIC used to run the snapshot class queries concurrently.
+SNAPSHOT_WORKERS = 6
+# APICs snapshotted at the same time by take_all_snapshots.
+SNAPSHOT_FANOUT = 4
+# Collect interface state and counters with one l1PhysIf subtree query
+# instead of five full-class scans.
+CONSOLIDATED_COUNTERS = True
+# Fabrics with at least policy.min_nodes switches read their largest
+# classes (routes, endpoints, interfaces) per node/tenant shard instead
+# of fabric-wide. None disables sharding.
+SNAPSHOT_SHARD_POLICY = DEFAULT_SHARD_POLICY
+# Deadline budget (seconds) for all the queries of one APIC's snapshot; a
+# class not collected in time is reported under "collection_errors".
+SNAPSHOT_BUDGET = 900
+# An interrupted take_all_snapshots run is resumed by the next run within
+# this many seconds; an older one is finished with the fabrics it holds.
+RESUME_MAX_AGE = 12 * 3600
+
 PATH_RE = re.compile(
     r"topology/pod-(?P<pod>\d+)/paths-(?P<node>\d+)/pathep-\[(?P<if>[^\]]+)\]"
 )
@@ -47,35 +91,44 @@ def parse_path_from_attr(fabric_path_dn: str):
     return m.group("node"), m.group("if")
 
 def validate_snapshot(data: dict):
-    """Validate if snapshot JSON has expected keys."""
-    required_keys = [
-        "fabric_health",
-        "faults",
-        "interfaces",
-        "interface_errors",
-        "drop_errors",
-        "output_errors",
-        "crc_errors",
-        "endpoints",
-        "urib_routes",
-        "path_ep",
-        "pc_aggr",
-    ]
-    missing = [k for k in required_keys if k not in data]
+    """Validate if snapshot JSON has the keys of the profile it was taken with.
+
+    A compacted fabric only keeps record counts for its list sections, so
+    those count as present.
+    """
+    required_keys = SNAPSHOT_PROFILES.get(data.get("profile", "full"), SNAPSHOT_KEY_ORDER)
+    records = data.get("records", {}) if data.get("compacted") else {}
+    missing = [k for k in required_keys if k not in data and k not in records]
     if missing:
         logging.warning(f"Snapshot missing keys: {missing}")
         return False
     return True
 
-def process_endpoints(cookies, apic_ip):
+def process_endpoints(client, epgs=None, shards=None):
+    """Build endpoint records from fvCEp pages and the EPG descriptions.
+
+    ``epgs`` may be an already fetched fvAEPg list or a Future resolving to
+    one, so the EPG query can run alongside the endpoint pages.
+    """
+    apic_ip = client.apic_ip
     endpoints = []
-    try:
-        endpoints_with_ip = get_endpoints_with_ip(cookies, apic_ip)
-        epgs = get_epgs(cookies, apic_ip)
-    except Exception as e:
-        logging.error(f"Failed to retrieve endpoints or EPGs from {apic_ip}: {e}")
-        return endpoints
+    if epgs is None:
+        epgs = get_epgs(client)
+    elif isinstance(epgs, Future):
+        epgs = epgs.result()
+
+    epg_map = epg_descriptions(epgs)
+
+    # fvCEp objects are decoded from the response stream one at a time and
+    # turned into records straight away, so no raw page is kept around.
+    for ep in iter_endpoint_mos(client, shards):
+        endpoints.extend(endpoint_records(ep, epg_map))
+
+    logging.info(f"Processed {len(endpoints)} endpoints endpoints from {apic_ip}.")
+    return endpoints
 
+
+def epg_descriptions(epgs):
     epg_map = {}
     for epg in epgs:
         fvAEPg = epg.get("fvAEPg", {})
@@ -84,61 +137,263 @@ def process_endpoints(cookies, apic_ip):
         descr = attr.get("descr", "")
         if dn:
             epg_map[dn] = descr
+    return epg_map
+
+
+def update_or_process_endpoints(client, epgs, shards, prior, marks):
+    """Endpoint records merged onto `prior`, or collected in full when that fails."""
+    epgs = epgs.result() if isinstance(epgs, Future) else epgs
+    merged = update_endpoints(
+        client, prior, marks, epg_descriptions(epgs), endpoint_records
+    )
+    if merged is not None:
+        return merged
+    return process_endpoints(client, epgs, shards)
+
+
+def update_or_get(client, key, getter, prior, marks, shards=None):
+    """A snapshot key merged onto `prior`, or collected in full when that fails."""
+    merged = update_class(client, key, prior, marks)
+    if merged is not None:
+        return merged
+    return collect(getter, key, client, shards)
+
+
+def collect(getter, key, client, shards=None):
+    """Run a snapshot getter and normalize what it returns into schema records.
+
+    `key` is None for get_interface_counters, which returns several keys.
+    """
+    mos = getter(client, shards=shards) if shards is not None else getter(client)
+    if key is None:
+        return {k: normalize_section(k, v) for k, v in mos.items()}
+    return normalize_section(key, mos)
+
+
+def endpoint_records(ep, epg_map):
+    cep = ep.get("fvCEp", {})
+    attr = cep.get("attributes", {})
+    dn = attr.get("dn", "") or ""
+    mac = attr.get("mac", "")
+    encap = attr.get("encap", "") or ""
+    fabric_path_dn = attr.get("fabricPathDn", "")
+
+    node, iface = parse_path_from_attr(fabric_path_dn)
+
+    ips = []
+    for ch in cep.get("children", []):
+        if "fvIp" in ch:
+            ip = ch["fvIp"]["attributes"].get("addr")
+            ips.append(ip if ip else "")
+
+    if not ips:
+        ips = [""]
+
+    epg_dn = dn.split("/cep-")[0] if "/cep-" in dn else ""
+    epg_descr = epg_map.get(epg_dn, "")
+
+    return [
+        {
+            "node": node,
+            "interface": iface,
+            "mac": mac,
+            "ip": ip,
+            "vlan": encap,
+            "dn": dn,
+            "epg_descr": epg_descr,
+        }
+        for ip in ips
+    ]
 
-    for ep in endpoints_with_ip:
-        cep = ep.get("fvCEp", {})
-        attr = cep.get("attributes", {})
-        dn = attr.get("dn", "") or ""
-        mac = attr.get("mac", "")
-        encap = attr.get("encap", "") or ""
-        fabric_path_dn = attr.get("fabricPathDn", "")
-
-        node, iface = parse_path_from_attr(fabric_path_dn)
-
-        ips = []
-        for ch in cep.get("children", []):
-            if "fvIp" in ch:
-                ip = ch["fvIp"]["attributes"].get("addr")
-                ips.append(ip if ip else "")
-
-        if not ips:
-            ips = [""]
-
-        epg_dn = dn.split("/cep-")[0] if "/cep-" in dn else ""
-        epg_descr = epg_map.get(epg_dn, "")
-
-        for ip in ips:
-            data = {
-                "node": node,
-                "interface": iface,
-                "mac": mac,
-                "ip": ip,
-                "vlan": encap,
-                "dn": dn,
-                "epg_descr": epg_descr,
-            }
-            endpoints.append(data)
 
-    logging.info(f"Processed {len(endpoints)} endpoints endpoints from {apic_ip}.")
-    return endpoints
+# Snapshot key -> getter. Every entry is an independent read of one class;
+# "endpoints" is assembled separately from fvCEp pages and fvAEPg. With
+# CONSOLIDATED_COUNTERS the interface keys are read by get_interface_counters.
+# Getters in SHARDABLE_GETTERS accept the fabric's ShardPlan.
+SNAPSHOT_QUERIES = {
+    "fabric_health": get_fabric_health,
+    "faults": get_faults,
+    "interfaces": get_interface_status,
+    "interface_errors": get_interface_errors,
+    "drop_errors": get_drop_errors,
+    "output_errors": get_output_errors,
+    "crc_errors": get_crc_errors,
+    "urib_routes": get_urib_routes,
+    "path_ep": get_output_path_ep,
+    "pc_aggr": get_pc_aggr,
+}
+SHARDABLE_GETTERS = {get_interface_status, get_urib_routes, get_interface_counters}
+SNAPSHOT_KEY_ORDER = [
+    "fabric_health",
+    "faults",
+    "interfaces",
+    "interface_errors",
+    "drop_errors",
+    "output_errors",
+    "crc_errors",
+    "endpoints",
+    "urib_routes",
+    "path_ep",
+    "pc_aggr",
+]
+# Snapshot profile -> keys collected. "counters" reads only faultInst,
+# l1PhysIf, ethpmPhysIf and the rmon counters, for quick before/after
+# checks around a change window.
+SNAPSHOT_PROFILES = {
+    "full": tuple(SNAPSHOT_KEY_ORDER),
+    "counters": (
+        "faults",
+        "interfaces",
+        "interface_errors",
+        "drop_errors",
+        "output_errors",
+        "crc_errors",
+    ),
+}
+
+
+def take_snapshot(
+    client,
+    max_workers=SNAPSHOT_WORKERS,
+    consolidated=CONSOLIDATED_COUNTERS,
+    shard_policy=SNAPSHOT_SHARD_POLICY,
+    budget=SNAPSHOT_BUDGET,
+    previous=None,
+    profile="full",
+):
+    """Collect the snapshot classes of `profile` from one APIC concurrently.
+
+    A class that fails is left out of the snapshot and its error recorded
+    under "collection_errors"; the other classes are still returned. With
+    `consolidated`, the interface keys come from a single subtree query;
+    large fabrics are read in shards as set by `shard_policy`. No query
+    runs past `budget` seconds from the start. Every class is stored as
+    the flat records of aci.snapshot.schema, normalized as it arrives.
+
+    With `previous` (this APIC's data from an earlier snapshot), faults,
+    routes and endpoints are collected incrementally: only MOs modified
+    since that snapshot's "high_water" marks are fetched and merged.
+    """
+    with client.deadline_budget(budget):
+        return _take_snapshot(client, max_workers, consolidated, shard_policy, previous, profile)
+
+
+def incremental_priors(previous):
+    """Keys of an earlier snapshot that can be updated, and its high-water marks.
+
+    `previous` may be a fabric of a SnapshotReader; only the sections that
+    can be updated are read from it. ({}, None) when it cannot be read.
+    """
+    try:
+        if not previous or not previous.get("high_water"):
+            return {}, None
+        # A reader's sections are already normalized as they load.
+        if not isinstance(previous, FabricSections):
+            previous = upgrade(previous)
+        failed = previous.get("collection_errors", {})
+        priors = {
+            key: previous[key]
+            for key in INCREMENTAL_KEYS
+            if key in previous and key not in failed
+        }
+        return priors, previous["high_water"]
+    except (OSError, ValueError, EOFError) as e:
+        logging.warning(f"Could not read the previous snapshot, collecting in full: {e}")
+        return {}, None
 
 
-def take_snapshot(cookies, apic_ip):
-    # Collect all data
+def _take_snapshot(client, max_workers, consolidated, shard_policy, previous, profile):
+    apic_ip = client.apic_ip
+    wanted = SNAPSHOT_PROFILES[profile]
+    results = {}
+    errors = {}
     try:
-        data = {
-            "fabric_health": get_fabric_health(cookies, apic_ip),
-            "faults": get_faults(cookies, apic_ip),
-            "interfaces": get_interface_status(cookies, apic_ip),
-            "interface_errors": get_interface_errors(cookies, apic_ip),
-            "drop_errors": get_drop_errors(cookies, apic_ip),
-            "output_errors": get_output_errors(cookies, apic_ip),
-            "crc_errors": get_crc_errors(cookies, apic_ip),
-            "endpoints": process_endpoints(cookies, apic_ip),
-            "urib_routes": get_urib_routes(cookies, apic_ip),
-            "path_ep": get_output_path_ep(cookies, apic_ip),
-            "pc_aggr": get_pc_aggr(cookies, apic_ip),
-        }
+        # Probed before anything is fetched, so the next incremental run
+        # also picks up changes made while this one was collecting.
+        try:
+            high_water = high_water_marks(client, wanted)
+        except Exception as e:
+            logging.warning(f"Could not read modTs high-water marks on {apic_ip}: {e}")
+            high_water = None
+        priors, marks = incremental_priors(previous)
+
+        try:
+            shards = shard_plan(client, shard_policy)
+        except Exception as e:
+            logging.warning(f"Could not plan sharded collection on {apic_ip}, reading fabric-wide: {e}")
+            shards = None
+
+        # Workers run under this thread's deadline budget.
+        def submit(pool, getter, key=None):
+            sharded = shards if getter in SHARDABLE_GETTERS else None
+            if key in priors:
+                return pool.submit(
+                    client.with_deadline(update_or_get),
+                    client,
+                    key,
+                    getter,
+                    priors[key],
+                    marks,
+                    sharded,
+                )
+            return pool.submit(client.with_deadline(collect), getter, key, client, sharded)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            grouped = (
+                tuple(key for key in INTERFACE_COUNTER_KEYS.values() if key in wanted)
+                if consolidated
+                else ()
+            )
+            futures = {}
+            if "endpoints" in wanted:
+                # Submitted first so a worker always picks it up before the
+                # endpoint task starts waiting on it.
+                epgs = pool.submit(client.with_deadline(get_epgs), client)
+                if "endpoints" in priors:
+                    endpoints = pool.submit(
+                        client.with_deadline(update_or_process_endpoints),
+                        client,
+                        epgs,
+                        shards,
+                        priors["endpoints"],
+                        marks,
+                    )
+                else:
+                    endpoints = pool.submit(
+                        client.with_deadline(process_endpoints), client, epgs, shards
+                    )
+                futures[endpoints] = ("endpoints",)
+            futures.update(
+                (submit(pool, getter, key), (key,))
+                for key, getter in SNAPSHOT_QUERIES.items()
+                if key in wanted and key not in grouped
+            )
+            if grouped:
+                futures[submit(pool, get_interface_counters)] = grouped
+
+            for future in as_completed(futures):
+                keys = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    for key in keys:
+                        errors[key] = str(e)
+                    logging.error(f"Failed to retrieve {', '.join(keys)} from {apic_ip}: {e}")
+                    continue
+                if len(keys) == 1:
+                    results[keys[0]] = result
+                else:
+                    results.update(result)
+
+        data = {"schema": SCHEMA_VERSION, "profile": profile}
+        data.update(
+            (key, results[key]) for key in SNAPSHOT_KEY_ORDER if key in wanted and key in results
+        )
+        if errors:
+            data["collection_errors"] = errors
+        if high_water is not None:
+            data["high_water"] = high_water
+
         if validate_snapshot(data):
             console.print(f"[cyan]Snapshot from {apic_ip} is valid.[/cyan]")
         else:
@@ -159,16 +414,20 @@ def list_snapshots(base_dir=None):
         logging.info(f"No snapshot folder found at {folder}.")
         return []
     
-    files = [f for f in os.listdir(folder) if f.endswith(".json")]
-    if not files:
+    catalog.sync(folder, validate_snapshot)
+    entries = catalog.find_snapshots(folder)
+    if not entries:
         logging.info(f"No snapshot files found in {folder}.")
         return []
     
-    files.sort()
     print("\n🕓 Available Snapshots:")
-    for i, f in enumerate(files):
-        print(f"  [{i + 1}] {f}")
-    return files
+    for i, entry in enumerate(entries):
+        status = "" if entry.valid else " (incomplete)"
+        profile = "" if entry.profile == "full" else f" [{entry.profile}]"
+        print(
+            f"  [{i + 1}] {entry.file}{profile} - {', '.join(entry.fabrics) or 'no fabrics'}{status}"
+        )
+    return [entry.file for entry in entries]
 
 
 def choose_snapshots(base_dir=None):
@@ -197,44 +456,263 @@ def choose_snapshots(base_dir=None):
         return None, None
 
 
-def take_all_snapshots(base_dir=None):
+def delete_snapshots(base_dir=None):
+    """Let the user delete a snapshot, then drop the blobs no snapshot uses anymore."""
     customer = get_customer_name()
-    devices = load_devices()
-
-    combined = {}
+    files = list_snapshots(base_dir)
+    if base_dir:
+        folder = os.path.join(base_dir, customer, "aci", "snapshot")
+    else:
+        folder = os.path.join("results", customer, "aci", "snapshot")
 
+    if not files:
+        print("❌ No snapshots to delete.")
+        return
+    try:
+        index = int(input("🔢 Enter number of the snapshot to DELETE: ")) - 1
+    except ValueError:
+        print("❌ Please enter a valid number.")
+        return
+    if not 0 <= index < len(files):
+        print("❌ Invalid selection.")
+        return
+    path = os.path.join(folder, files[index])
+    removed, freed = delete_snapshot(path)
+    catalog.remove_snapshot(path)
+    console.print(
+        f"[cyan]Deleted {files[index]}; {removed} unused blobs removed ({freed / 1024:.0f} KiB).[/cyan]"
+    )
+
+
+def snapshot_device(device, previous=None, profile="full"):
+    """Log in to one APIC from the inventory and snapshot it.
+
+    Returns (hostname, data, seconds); data is None when the APIC was
+    skipped or could not be reached. `previous` and `profile` are passed
+    to take_snapshot.
+    """
+    hostname = device.get("hostname", "")
+    apic_ip = device.get("ip", "")
+    username = device.get("username")
+    password = device.get("password", "")
+    started = time.monotonic()
+
+    if not username or not password or not apic_ip:
+        console.print(
+            f"[red]Skipping {hostname}: credentials not found in .env[/red]"
+        )
+        return hostname, None, 0.0
+
+    console.print(f"[bold blue]▶ {hostname} ({apic_ip})[/bold blue]")
+
+    cookies = apic_login(apic_ip, username, password)
+
+    if not cookies:
+        console.print(f"[red]Skipping {hostname}: login failed[/red]")
+        return hostname, None, time.monotonic() - started
+
+    client = get_client(apic_ip, cookies)
+    client.discover_members()
+    data = take_snapshot(client, previous=previous, profile=profile)
+    return hostname, data, time.monotonic() - started
+
+
+def print_collection_times(timings):
+    table = Table(title="Snapshot collection time per APIC", header_style="bold cyan")
+    table.add_column("APIC")
+    table.add_column("Status")
+    table.add_column("Seconds", justify="right")
+    for hostname, (status, seconds) in sorted(
+        timings.items(), key=lambda item: item[1][1], reverse=True
+    ):
+        table.add_row(hostname, status, f"{seconds:.1f}")
+    console.print(table)
+
+
+def print_controller_load(devices):
+    """Concurrency limit, peak queue depth and latency each controller ended the run with."""
+    metrics = client_metrics()
+    table = Table(title="APIC controller load", header_style="bold cyan")
+    table.add_column("APIC")
+    table.add_column("Controller")
+    table.add_column("Limit", justify="right")
+    table.add_column("Peak queue", justify="right")
+    table.add_column("Throttled", justify="right")
+    table.add_column("Latency (s)", justify="right")
     for device in devices:
-        hostname = device.get("hostname", "")
-        apic_ip = device.get("ip", "")
-        username = device.get("username")
-        password = device.get("password", "")
-
-        if not username or not password or not apic_ip:
-            console.print(
-                f"[red]Skipping {hostname}: credentials not found in .env[/red]"
+        members = metrics.get(device.get("ip", ""), {})
+        for member, load in sorted(members.items()):
+            table.add_row(
+                device.get("hostname", ""),
+                member.split("://", 1)[-1],
+                str(load["limit"]),
+                str(load["peak_queue_depth"]),
+                str(load["throttled"]),
+                f"{load['latency']:.2f}",
             )
+    if table.row_count:
+        console.print(table)
 
-        console.rule(f"[bold blue]{hostname} ({apic_ip})[/bold blue]", style="grey37")
 
-        cookies = apic_login(apic_ip, username, password)
+def latest_snapshot(base_dir=None):
+    """SnapshotReader of the most recent snapshot file, or None when there is none.
+
+    Fabrics are only read from it when asked for, one at a time.
+    """
+    customer = get_customer_name()
+    if base_dir:
+        folder = os.path.join(base_dir, customer, "aci", "snapshot")
+    else:
+        folder = os.path.join("results", customer, "aci", "snapshot")
+    catalog.sync(folder, validate_snapshot)
+    entries = catalog.latest(folder)
+    if not entries:
+        return None
+    try:
+        return SnapshotReader(os.path.join(folder, entries[0].file))
+    except (OSError, ValueError, EOFError) as e:
+        logging.warning(f"Could not read previous snapshot {entries[0].file}: {e}")
+        return None
 
-        if not cookies:
-            console.print(f"[red]Skipping {hostname}: login failed[/red]")
-            continue
 
-        data = take_snapshot(cookies, apic_ip)
-        combined[hostname] = data
+def finish_snapshot(writer, order=None):
+    """Finish a SnapshotWriter and add the snapshot to the catalog; returns its path."""
+    filepath, layout, summaries = writer.finish(order)
+    try:
+        catalog.add_snapshot(filepath, summaries, layout)
+    except sqlite3.Error as e:
+        # Picked up from the file on the next listing instead.
+        logging.warning(f"Could not add {os.path.basename(filepath)} to the snapshot catalog: {e}")
+    return filepath
+
+
+def snapshot_profile(writer):
+    """The profile of the fabrics a SnapshotWriter holds (None when mixed)."""
+    profiles = {summary.get("profile", "full") for summary in writer.captured().values()}
+    if not profiles:
+        return "full"
+    return profiles.pop() if len(profiles) == 1 else None
+
+
+def open_snapshot_writer(snapshot_dir, customer, profile="full"):
+    """The writer for this run: a recent interrupted snapshot to resume, or a new one.
+
+    Only an interrupted snapshot of the same profile is resumed. Others, and
+    those older than RESUME_MAX_AGE, are finished with the fabrics they
+    already hold.
+    """
+    partials = [SnapshotWriter(path) for path in partial_snapshots(snapshot_dir)]
+    resume = None
+    if (
+        partials
+        and time.time() - os.path.getmtime(partials[-1].partial) < RESUME_MAX_AGE
+        and snapshot_profile(partials[-1]) == profile
+    ):
+        resume = partials.pop()
+    for stale in partials:
+        console.print(
+            f"[yellow]⚠ Finishing interrupted snapshot {os.path.basename(stale.path)} as it is.[/yellow]"
+        )
+        finish_snapshot(stale)
+    if resume is not None:
+        return resume
+    now = datetime.datetime.now()
+    path = os.path.join(snapshot_dir, snapshot_filename(customer, now.strftime(catalog.TIMESTAMP_FORMAT)))
+    if os.path.exists(path) or os.path.exists(path + PARTIAL_SUFFIX):
+        # Quick (counters) snapshots can follow each other within a minute.
+        path = os.path.join(
+            snapshot_dir, snapshot_filename(customer, now.strftime(catalog.TIMESTAMP_SECONDS_FORMAT))
+        )
+    return SnapshotWriter(path)
+
+
+def take_all_snapshots(
+    base_dir=None, max_fabrics=SNAPSHOT_FANOUT, incremental=False, profile="full"
+):
+    """Snapshot every APIC in the inventory into one snapshot file.
+
+    `profile` picks the classes collected (SNAPSHOT_PROFILES); "counters"
+    takes a quick faults/interfaces/counters snapshot for change windows.
+    """
+    customer = get_customer_name()
+    devices = load_devices()
 
     # Create directory structure
     if base_dir:
         snapshot_dir = os.path.join(base_dir, customer, "aci", "snapshot")
     else:
         snapshot_dir = os.path.join("results", customer, "aci", "snapshot")
-
     os.makedirs(snapshot_dir, exist_ok=True)
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H-%M")
-    filename = f"{customer}_snapshot_{timestamp}.json"
-    filepath = os.path.join(snapshot_dir, filename)
-    with open(filepath, "w") as f:
-        json.dump(combined, f, indent=2)
+
+    # Every fabric is written to disk as soon as it is collected; a run
+    # that was interrupted is picked up again, skipping the fabrics it
+    # already captured (fabrics that returned nothing are retried).
+    writer = open_snapshot_writer(snapshot_dir, customer, profile)
+    captured = {
+        hostname
+        for hostname, summary in writer.captured().items()
+        if summary and any(count is not None for count in summary["records"].values())
+    }
+    if captured:
+        console.print(
+            f"[yellow]Resuming {os.path.basename(writer.path)}: "
+            f"{', '.join(sorted(captured))} already captured.[/yellow]"
+        )
+
+    previous = latest_snapshot(base_dir) if incremental else None
+    if incremental and previous is None:
+        console.print("[yellow]⚠ No previous snapshot found, taking a full snapshot.[/yellow]")
+
+    timings = {hostname: ("resumed", 0.0) for hostname in captured}
+    pending = [device for device in devices if device.get("hostname", "") not in captured]
+
+    # Each fabric is collected on its own worker; a failure on one APIC is
+    # recorded and does not stop the others.
+    with ThreadPoolExecutor(max_workers=max(1, max_fabrics)) as pool:
+        futures = {
+            pool.submit(
+                snapshot_device,
+                device,
+                # Sections are loaded by the worker, when it updates them.
+                previous.fabric(device.get("hostname", "")) if previous is not None else None,
+                profile,
+            ): device
+            for device in pending
+        }
+        for future in as_completed(futures):
+            hostname = futures[future].get("hostname", "")
+            try:
+                hostname, data, seconds = future.result()
+            except Exception as e:
+                console.print(f"[red]❌ Error taking snapshot from {hostname}: {e}[/red]")
+                timings[hostname] = ("failed", 0.0)
+                continue
+
+            if data is None:
+                timings[hostname] = ("skipped", seconds)
+                continue
+            if not data:
+                timings[hostname] = ("failed", seconds)
+                continue
+            data["collection_seconds"] = round(seconds, 2)
+            writer.add(
+                hostname, data, dict(catalog.summarize(data, validate_snapshot), profile=profile)
+            )
+            timings[hostname] = ("ok", seconds)
+
+    print_collection_times(timings)
+    print_controller_load(pending)
+
+    # Keep the inventory order in the snapshot file.
+    filepath = finish_snapshot(writer, [device.get("hostname", "") for device in devices])
     console.print(f"[cyan]All snapshots taken and saved to {filepath}.[/cyan]")
+
+    try:
+        compacted, deleted = apply_retention(snapshot_dir, validate=validate_snapshot)
+    except (OSError, sqlite3.Error) as e:
+        logging.warning(f"Could not apply snapshot retention in {snapshot_dir}: {e}")
+    else:
+        if compacted or deleted:
+            console.print(
+                f"[cyan]Retention: {compacted} old snapshots compacted, {deleted} deleted.[/cyan]"
+            )
@@ -0,0 +1,434 @@
+# Snapshot file format.
+#
+# Snapshots are written as a small versioned envelope
+#     {"format": "aci-snapshot", "version": 1, "fabrics": {<hostname>: data}}
+# encoded as compact JSON (or msgpack, when installed) and streamed through
+# gzip or lzma. The file suffix names the encoding and compression.
+# Plain indented *.json files written by earlier releases hold the bare
+# {hostname: data} mapping; load_snapshot reads both transparently.
+#
+# The "manifest" format (version 2) stores every list section of every
+# APIC as a content-addressed blob under <snapshot dir>/blobs/, named by
+# the SHA-256 of its canonical JSON; the snapshot file itself is a small
+# manifest in which those sections are {"$blob": <digest>} references.
+# A section that did not change between snapshots is stored once, and
+# equal digests tell the comparer there is nothing to diff.
+#
+# SnapshotWriter builds a snapshot fabric by fabric: each one is appended
+# to <snapshot>.partial as a JSON line when collected, and the final file
+# is assembled from those lines and renamed into place at the end. An
+# interrupted run leaves the .partial behind to be resumed.
+
+import gzip
+import hashlib
+import json
+import logging
+import lzma
+import os
+import threading
+import time
+from itertools import chain
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+SNAPSHOT_FORMAT_NAME = "aci-snapshot"
+SNAPSHOT_FORMAT_VERSION = 1
+MANIFEST_FORMAT_VERSION = 2
+# Encoding/compression of newly written snapshots: "manifest" (blob
+# store), "json.gz", "json.xz", "msgpack.gz", "msgpack.xz" or "json"
+# (uncompressed, compact).
+SNAPSHOT_FORMAT = "manifest"
+BLOB_DIR = "blobs"
+BLOB_REF = "$blob"
+# Blobs younger than this are never collected: their manifest may still be
+# being written.
+GC_GRACE_SECONDS = 3600
+GZIP_LEVEL = 6
+# lzma presets above 2 are several times slower for little gain on snapshots.
+LZMA_PRESET = 2
+
+MANIFEST_SUFFIX = ".manifest.json"
+# Appended to a snapshot's path while SnapshotWriter is still adding fabrics.
+PARTIAL_SUFFIX = ".partial"
+SNAPSHOT_SUFFIXES = (
+    MANIFEST_SUFFIX,
+    ".json",
+    ".json.gz",
+    ".json.xz",
+    ".msgpack.gz",
+    ".msgpack.xz",
+)
+
+
+def _open(path, mode, compression):
+    if compression == ".gz":
+        return gzip.open(path, mode, compresslevel=GZIP_LEVEL)
+    if compression == ".xz":
+        return lzma.open(path, mode, preset=LZMA_PRESET if "w" in mode else None)
+    return open(path, mode)
+
+
+def is_snapshot_file(name):
+    return "_snapshot_" in name and name.endswith(SNAPSHOT_SUFFIXES)
+
+
+def snapshot_files(folder):
+    """Snapshot file names in a folder, oldest first (names carry the timestamp)."""
+    if not os.path.isdir(folder):
+        return []
+    return sorted(f for f in os.listdir(folder) if is_snapshot_file(f))
+
+
+def _split_suffix(path):
+    """(encoding, compression suffix) of a snapshot path."""
+    for suffix in SNAPSHOT_SUFFIXES[1:]:
+        if path.endswith(suffix):
+            encoding, _, compression = suffix[1:].partition(".")
+            return encoding, f".{compression}" if compression else ""
+    raise ValueError(f"Not a snapshot file: {path}")
+
+
+def snapshot_filename(customer, timestamp, fmt=None):
+    fmt = SNAPSHOT_FORMAT if fmt is None else fmt
+    if fmt == "manifest":
+        return f"{customer}_snapshot_{timestamp}{MANIFEST_SUFFIX}"
+    if fmt.startswith("msgpack") and msgpack is None:
+        fmt = "json" + fmt[len("msgpack"):]
+    return f"{customer}_snapshot_{timestamp}.{fmt}"
+
+
+def _json_chunks(value, depth, path=()):
+    # Containers down to `depth` are written piece by piece; everything
+    # below is encoded in one go by the C encoder, so memory stays bounded
+    # by the largest snapshot key rather than the whole file. Yields
+    # (key path, chunk); the path is set on the chunks holding a value.
+    if depth and isinstance(value, dict):
+        yield None, "{"
+        for i, (key, item) in enumerate(value.items()):
+            yield None, ("," if i else "") + json.dumps(key) + ":"
+            yield from _json_chunks(item, depth - 1, path + (key,))
+        yield None, "}"
+    else:
+        yield path, json.dumps(value, separators=(",", ":"))
+
+
+def is_manifest(path):
+    return path.endswith(MANIFEST_SUFFIX)
+
+
+def blob_folder(snapshot_path):
+    return os.path.join(os.path.dirname(snapshot_path), BLOB_DIR)
+
+
+def blob_path(folder, digest):
+    return os.path.join(folder, digest[:2], f"{digest}.json.gz")
+
+
+def put_blob(folder, value):
+    """Store a section in the blob store once; returns its digest."""
+    encoded = json.dumps(value, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    digest = hashlib.sha256(encoded).hexdigest()
+    path = blob_path(folder, digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with _open(tmp, "wb", ".gz") as f:
+            f.write(encoded)
+        os.replace(tmp, path)
+    return digest
+
+
+def get_blob(folder, digest):
+    with _open(blob_path(folder, digest), "rb", ".gz") as f:
+        return json.loads(f.read())
+
+
+def _is_ref(value):
+    return isinstance(value, dict) and set(value) == {BLOB_REF}
+
+
+def blob_refs(folder, data):
+    """A fabric's data with each list section stored as a blob and replaced by its reference."""
+    return {
+        key: {BLOB_REF: put_blob(folder, value)} if isinstance(value, list) else value
+        for key, value in data.items()
+    }
+
+
+def _dump_manifest(path, manifest, layout=None):
+    if layout is not None:
+        for hostname, data in manifest.items():
+            for key, value in data.items():
+                if _is_ref(value):
+                    layout[(hostname, key)] = {"digest": value[BLOB_REF]}
+    envelope = {
+        "format": SNAPSHOT_FORMAT_NAME,
+        "version": MANIFEST_FORMAT_VERSION,
+        "fabrics": manifest,
+    }
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(envelope, f, separators=(",", ":"))
+    os.replace(tmp, path)
+    return path
+
+
+def write_manifest(path, fabrics, layout=None):
+    """Store each list section as a blob and write the manifest referencing them."""
+    folder = blob_folder(path)
+    manifest = {hostname: blob_refs(folder, data) for hostname, data in fabrics.items()}
+    return _dump_manifest(path, manifest, layout)
+
+
+def _write_stream(path, fabric_items, count, layout=None):
+    # Writes the envelope around `count` (hostname, data) pairs taken one
+    # at a time from `fabric_items`, so only one fabric is held at once.
+    encoding, compression = _split_suffix(path)
+    tmp = f"{path}.tmp"
+    with _open(tmp, "wb", compression) as f:
+        if encoding == "msgpack":
+            packer = msgpack.Packer()
+            f.write(packer.pack_map_header(3))
+            for item in ("format", SNAPSHOT_FORMAT_NAME, "version", SNAPSHOT_FORMAT_VERSION, "fabrics"):
+                f.write(packer.pack(item))
+            f.write(packer.pack_map_header(count))
+            for hostname, data in fabric_items:
+                f.write(packer.pack(hostname))
+                f.write(packer.pack(data))
+        else:
+            header = (
+                f'{{"format":{json.dumps(SNAPSHOT_FORMAT_NAME)},'
+                f'"version":{SNAPSHOT_FORMAT_VERSION},"fabrics":{{'
+            )
+            f.write(header.encode("utf-8"))
+            offset = len(header)
+            for i, (hostname, data) in enumerate(fabric_items):
+                chunks = [(None, ("," if i else "") + json.dumps(hostname) + ":")]
+                # fabric data -> snapshot keys
+                for key_path, chunk in chain(chunks, _json_chunks(data, 1, (hostname,))):
+                    encoded = chunk.encode("utf-8")
+                    if layout is not None and key_path and len(key_path) == 2:
+                        layout[key_path] = {"offset": offset, "length": len(encoded)}
+                    f.write(encoded)
+                    offset += len(encoded)
+            f.write(b"}}")
+    os.replace(tmp, path)
+    return path
+
+
+def write_snapshot(path, fabrics, layout=None):
+    """Write a snapshot envelope to `path`, streaming it through the compressor.
+
+    The file appears under its final name only once completely written.
+    When a `layout` dict is given it is filled with where each
+    (hostname, key) section went: {"digest"} of its blob in a manifest,
+    or its {"offset", "length"} in the uncompressed JSON stream.
+    """
+    if is_manifest(path):
+        return write_manifest(path, fabrics, layout)
+    return _write_stream(path, fabrics.items(), len(fabrics), layout)
+
+
+class SnapshotWriter:
+    """Crash-safe writer of a snapshot, one fabric at a time.
+
+    Each fabric is appended to <path>.partial as a JSON line as soon as it
+    is added (its sections already stored as blobs for a manifest) and
+    synced to disk. finish() assembles the final file from those lines and
+    renames it into place; until then the snapshot does not exist under
+    its own name. A writer opened on an existing .partial resumes it,
+    dropping a last line left incomplete by a crash.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.partial = path + PARTIAL_SUFFIX
+        if os.path.exists(self.partial):
+            self._recover()
+
+    def _lines(self):
+        return partial_entries(self.partial)
+
+    def _recover(self):
+        end = 0
+        for offset, length, _ in self._lines():
+            end = offset + length
+        if os.path.getsize(self.partial) != end:
+            logging.warning(f"Dropping an incomplete fabric at the end of {self.partial}")
+            with open(self.partial, "r+b") as f:
+                f.truncate(end)
+
+    def captured(self):
+        """{hostname: summary} of the fabrics already written."""
+        return {entry["hostname"]: entry.get("summary") for _, _, entry in self._lines()}
+
+    def add(self, hostname, data, summary=None):
+        """Append one fabric's data; `summary` is kept alongside for finish()."""
+        if is_manifest(self.path):
+            data = blob_refs(blob_folder(self.path), data)
+        line = json.dumps(
+            {"hostname": hostname, "summary": summary, "data": data}, separators=(",", ":")
+        )
+        os.makedirs(os.path.dirname(self.partial) or ".", exist_ok=True)
+        with open(self.partial, "ab") as f:
+            f.write(line.encode("utf-8") + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def finish(self, order=None):
+        """Write the snapshot, fabrics in `order` first; returns (path, layout, summaries)."""
+        index = {}
+        summaries = {}
+        for offset, _, entry in self._lines():
+            index[entry["hostname"]] = offset
+            summaries[entry["hostname"]] = entry.get("summary")
+        hostnames = [h for h in order or () if h in index]
+        hostnames += [h for h in index if h not in hostnames]
+        layout = {}
+
+        with open(self.partial, "rb") as f:
+
+            def fabric_items():
+                for hostname in hostnames:
+                    f.seek(index[hostname])
+                    yield hostname, json.loads(f.readline())["data"]
+
+            if is_manifest(self.path):
+                _dump_manifest(self.path, dict(fabric_items()), layout)
+            else:
+                _write_stream(self.path, fabric_items(), len(hostnames), layout)
+        os.remove(self.partial)
+        return self.path, layout, {h: summaries[h] for h in hostnames}
+
+
+def partial_entries(partial):
+    """(offset, length, entry) of every complete line of a .partial file."""
+    if not os.path.exists(partial):
+        return
+    with open(partial, "rb") as f:
+        offset = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                return
+            yield offset, len(line), entry
+            offset += len(line)
+
+
+def partial_snapshots(folder):
+    """Final paths of the snapshots in `folder` still being written, oldest first."""
+    if not os.path.isdir(folder):
+        return []
+    return [
+        os.path.join(folder, name[: -len(PARTIAL_SUFFIX)])
+        for name in sorted(os.listdir(folder))
+        if name.endswith(PARTIAL_SUFFIX) and is_snapshot_file(name[: -len(PARTIAL_SUFFIX)])
+    ]
+
+
+def unwrap(data):
+    """The {hostname: data} mapping of a loaded envelope or legacy file."""
+    if isinstance(data, dict) and data.get("format") == SNAPSHOT_FORMAT_NAME:
+        if data.get("version", 0) > MANIFEST_FORMAT_VERSION:
+            raise ValueError(
+                f"Snapshot format version {data.get('version')} is newer than supported"
+            )
+        return data.get("fabrics", {})
+    return data
+
+
+def load_manifest(path):
+    """{hostname: {key: value or blob reference}} of a manifest snapshot."""
+    with open(path, "r") as f:
+        return unwrap(json.load(f))
+
+
+def section_digests(path):
+    """{hostname: {key: digest}} of a manifest's blob sections; {} for other formats."""
+    if not is_manifest(path):
+        return {}
+    return {
+        hostname: {
+            key: value[BLOB_REF] for key, value in data.items() if _is_ref(value)
+        }
+        for hostname, data in load_manifest(path).items()
+    }
+
+
+def load_snapshot(path):
+    """Load any snapshot file, old or new format, as {hostname: data}."""
+    if is_manifest(path):
+        folder = blob_folder(path)
+        return {
+            hostname: {
+                key: get_blob(folder, value[BLOB_REF]) if _is_ref(value) else value
+                for key, value in data.items()
+            }
+            for hostname, data in load_manifest(path).items()
+        }
+    encoding, compression = _split_suffix(path)
+    if encoding == "msgpack":
+        if msgpack is None:
+            raise RuntimeError(f"msgpack is required to read {path}")
+        with _open(path, "rb", compression) as f:
+            return unwrap(msgpack.unpack(f, raw=False, strict_map_key=False))
+    with _open(path, "rb", compression) as f:
+        return unwrap(json.loads(f.read()))
+
+
+def read_range(path, offset, length):
+    """`length` bytes from `offset` of a JSON snapshot's uncompressed stream."""
+    _, compression = _split_suffix(path)
+    with _open(path, "rb", compression) as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+def referenced_blobs(folder):
+    """Digests referenced by any manifest in a snapshot folder, finished or not."""
+    referenced = set()
+    for name in snapshot_files(folder):
+        if is_manifest(name):
+            for sections in section_digests(os.path.join(folder, name)).values():
+                referenced.update(sections.values())
+    for path in partial_snapshots(folder):
+        for _, _, entry in partial_entries(path + PARTIAL_SUFFIX):
+            referenced.update(
+                value[BLOB_REF] for value in entry["data"].values() if _is_ref(value)
+            )
+    return referenced
+
+
+def gc_blobs(folder):
+    """Delete blobs no manifest in `folder` refers to; returns (count, bytes) freed."""
+    store = os.path.join(folder, BLOB_DIR)
+    if not os.path.isdir(store):
+        return 0, 0
+    referenced = referenced_blobs(folder)
+    cutoff = time.time() - GC_GRACE_SECONDS
+    removed = freed = 0
+    for prefix in os.listdir(store):
+        sub = os.path.join(store, prefix)
+        for name in os.listdir(sub):
+            digest = name.split(".", 1)[0]
+            path = os.path.join(sub, name)
+            if digest in referenced or os.path.getmtime(path) > cutoff:
+                continue
+            freed += os.path.getsize(path)
+            os.remove(path)
+            removed += 1
+        if not os.listdir(sub):
+            os.rmdir(sub)
+    return removed, freed
+
+
+def delete_snapshot(path):
+    """Delete a snapshot file and garbage-collect the blobs only it used."""
+    os.remove(path)
+    return gc_blobs(os.path.dirname(path))
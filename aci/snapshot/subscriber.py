@@ -0,0 +1,239 @@
+# Event-driven fault/endpoint tracking through APIC query subscriptions.
+#
+# Instead of re-pulling faultInst and fvCEp, a FabricSubscriber opens the
+# APIC websocket event channel, runs each class query once with
+# subscription=yes and then applies the created/modified/deleted events it
+# receives to an in-memory copy of those classes.
+#
+# This is a library API; no menu entry uses it yet. start_subscriptions()
+# and live_snapshot() are the entry points for a long-running watcher.
+# The channel follows the client's scheme: wss:// for an APIC, ws:// for
+# a plain-HTTP stand-in (APICClient(..., scheme="http")).
+
+import json
+import logging
+import socket
+import ssl
+import threading
+from aci.api.aci_client import SNAPSHOT_PROPERTIES, get_client, get_epgs, project_mo
+from aci.lib.utils import load_devices, apic_login
+from aci.snapshot.schema import SCHEMA_VERSION, fault_record
+from aci.snapshot.snapshotter import endpoint_records
+from rich.console import Console
+
+try:
+    import websocket  # websocket-client
+except ImportError:
+    websocket = None
+
+console = Console()
+
+# APIC drops a subscription that is not refreshed within 60 seconds.
+SUBSCRIPTION_REFRESH_SECONDS = 30
+
+# State key -> (class, query params) subscribed on every fabric.
+SUBSCRIBED_QUERIES = {
+    "faults": ("faultInst", {"query-target-filter": 'eq(faultInst.severity,"critical")'}),
+    "endpoints": ("fvCEp", {}),
+    "endpoint_ips": ("fvIp", {}),
+}
+CLASS_KEYS = {class_name: key for key, (class_name, _) in SUBSCRIBED_QUERIES.items()}
+
+
+def _fault_in_scope(attrs):
+    return attrs.get("severity") == "critical"
+
+
+class FabricSubscriber:
+    """Live fault/endpoint state for one fabric, kept current from APIC events."""
+
+    def __init__(self, client, refresh_interval=SUBSCRIPTION_REFRESH_SECONDS):
+        self.client = client
+        self.refresh_interval = refresh_interval
+        self.state = {key: {} for key in SUBSCRIBED_QUERIES}
+        self.subscription_ids = {}
+        self.epg_map = {}
+
+        self._lock = threading.Lock()
+        self._pending = []
+        self._loaded = False
+        self._stop = threading.Event()
+        self._ws = None
+        self._threads = []
+
+    def ws_url(self):
+        """Websocket event channel URL for the client's current token."""
+        token = self.client.token()
+        base = self.client.base_url
+        scheme = "wss" if base.startswith("https") else "ws"
+        return f"{scheme}://{base.split('://', 1)[1]}/socket{token}"
+
+    def start(self):
+        if websocket is None:
+            raise RuntimeError(
+                "Subscription mode needs websocket-client (pip install websocket-client)"
+            )
+
+        # The event channel must be open before subscribing, otherwise the
+        # APIC has nowhere to deliver events for the subscription.
+        self._ws = websocket.create_connection(
+            self.ws_url(), sslopt={"cert_reqs": ssl.CERT_NONE}
+        )
+        self._spawn(self._read_events)
+
+        for epg in get_epgs(self.client):
+            attr = epg.get("fvAEPg", {}).get("attributes", {})
+            if attr.get("dn"):
+                self.epg_map[attr["dn"]] = attr.get("descr", "")
+
+        for key, (class_name, params) in SUBSCRIBED_QUERIES.items():
+            query = dict(params)
+            query["subscription"] = "yes"
+            # Subscriptions belong to the websocket session on the inventory
+            # APIC, so they are never spread over other cluster members.
+            data = self.client.get_json(
+                f"/api/node/class/{class_name}.json", params=query, spread=False
+            )
+            self.subscription_ids[data.get("subscriptionId")] = key
+            with self._lock:
+                for mo in data.get("imdata", []):
+                    self._store(key, mo)
+
+        # Events that raced the initial queries are applied on top of them.
+        with self._lock:
+            self._loaded = True
+            pending, self._pending = self._pending, []
+        for message in pending:
+            self.apply_event(message)
+
+        self._spawn(self._refresh_subscriptions)
+        console.print(
+            f"[green]✓ Subscribed to faults and endpoints on {self.client.apic_ip}.[/green]"
+        )
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._ws is not None:
+            # shutdown() rather than close(): the reader thread is blocked in
+            # recv() and would race the close handshake. Closing the socket
+            # alone does not wake that recv(); shutting it down does.
+            try:
+                if self._ws.sock is not None:
+                    self._ws.sock.shutdown(socket.SHUT_RDWR)
+                self._ws.shutdown()
+            except Exception:
+                pass
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def _spawn(self, target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _read_events(self):
+        while not self._stop.is_set():
+            try:
+                raw = self._ws.recv()
+            except Exception as e:
+                if not self._stop.is_set():
+                    logging.error(f"Event channel to {self.client.apic_ip} closed: {e}")
+                return
+            if not raw:
+                continue
+            try:
+                self.apply_event(json.loads(raw))
+            except ValueError:
+                logging.warning(f"Ignoring malformed event from {self.client.apic_ip}")
+
+    def _refresh_subscriptions(self):
+        while not self._stop.wait(self.refresh_interval):
+            for sub_id in list(self.subscription_ids):
+                try:
+                    self.client.get_json(
+                        "/api/subscriptionRefresh.json",
+                        params={"id": sub_id},
+                        spread=False,
+                    )
+                except Exception as e:
+                    logging.error(
+                        f"Failed to refresh subscription {sub_id} on {self.client.apic_ip}: {e}"
+                    )
+
+    def apply_event(self, message):
+        """Apply one websocket event message to the in-memory state."""
+        with self._lock:
+            if not self._loaded:
+                self._pending.append(message)
+                return
+            for mo in message.get("imdata", []):
+                class_name = next(iter(mo), None)
+                key = CLASS_KEYS.get(class_name)
+                if key is None:
+                    continue
+                attrs = mo[class_name].get("attributes", {})
+                dn = attrs.get("dn")
+                if not dn:
+                    continue
+
+                if attrs.get("status") == "deleted":
+                    self.state[key].pop(dn, None)
+                    continue
+                # Modification events only carry the changed attributes.
+                merged = dict(self.state[key].get(dn, {}))
+                merged.update(attrs)
+                self._store(key, {class_name: {"attributes": merged}})
+
+    def _store(self, key, mo):
+        class_name = next(iter(mo))
+        attrs = project_mo(mo)[class_name]["attributes"]
+        keep = SNAPSHOT_PROPERTIES.get(class_name, ())
+        if "dn" not in keep:
+            attrs["dn"] = mo[class_name]["attributes"].get("dn", "")
+        if key == "faults" and not _fault_in_scope(attrs):
+            self.state[key].pop(attrs["dn"], None)
+            return
+        self.state[key][attrs["dn"]] = attrs
+
+    def snapshot(self):
+        """Return the current state in the take_snapshot schema, without querying."""
+        with self._lock:
+            faults = [fault_record({"faultInst": {"attributes": a}}) for a in self.state["faults"].values()]
+            ips_by_cep = {}
+            for dn, attrs in self.state["endpoint_ips"].items():
+                ips_by_cep.setdefault(dn.rsplit("/ip-[", 1)[0], []).append(
+                    {"fvIp": {"attributes": {"addr": attrs.get("addr", "")}}}
+                )
+            endpoints = []
+            for dn, attrs in sorted(self.state["endpoints"].items()):
+                cep = {"fvCEp": {"attributes": attrs, "children": ips_by_cep.get(dn, [])}}
+                endpoints.extend(endpoint_records(cep, self.epg_map))
+
+        return {
+            "schema": SCHEMA_VERSION,
+            "faults": sorted(faults, key=lambda f: f["dn"]),
+            "endpoints": endpoints,
+        }
+
+
+def start_subscriptions(devices=None):
+    """Log in to every inventory APIC and start a subscriber for each fabric."""
+    subscribers = {}
+    for device in devices if devices is not None else load_devices():
+        hostname = device.get("hostname", "")
+        apic_ip = device.get("ip", "")
+        cookies = apic_login(apic_ip, device.get("username", ""), device.get("password", ""))
+        if not cookies:
+            console.print(f"[red]Skipping {hostname}: login failed[/red]")
+            continue
+        try:
+            subscribers[hostname] = FabricSubscriber(get_client(apic_ip, cookies)).start()
+        except Exception as e:
+            console.print(f"[red]❌ Could not subscribe to {hostname}: {e}[/red]")
+    return subscribers
+
+
+def live_snapshot(subscribers):
+    """Combined snapshot of every subscribed fabric, keyed by hostname."""
+    return {hostname: sub.snapshot() for hostname, sub in subscribers.items()}
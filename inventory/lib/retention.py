@@ -0,0 +1,69 @@
+# inventory/lib/retention.py
+#
+# Snapshot retention rules shared by the ACI and legacy snapshot folders.
+# Every snapshot is kept for keep_all_days. After that, only the newest
+# snapshot of each hour is kept up to hourly_days, then the newest of each
+# day up to daily_days (None keeps daily ones forever); the rest are
+# deleted. A bucket is represented by its newest preferred snapshot (a
+# full one rather than a quick counters-only one) when it has any. Kept
+# snapshots older than compact_after_days are compacted to their summary
+# form by the caller.
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+RetentionPolicy = namedtuple(
+    "RetentionPolicy", "keep_all_days hourly_days daily_days compact_after_days"
+)
+DEFAULT_RETENTION = RetentionPolicy(
+    keep_all_days=7, hourly_days=30, daily_days=365, compact_after_days=30
+)
+
+RetentionPlan = namedtuple("RetentionPlan", "keep compact delete")
+
+
+def plan_retention(snapshots, policy=DEFAULT_RETENTION, now=None, preferred=()):
+    """Decide what happens to each snapshot under `policy`.
+
+    `snapshots` is an iterable of (name, datetime taken). Names in
+    `preferred` represent their hour/day ahead of newer ones. Returns a
+    RetentionPlan of name lists: keep as is, compact, delete.
+    """
+    now = datetime.now() if now is None else now
+    preferred = set(preferred)
+    keep, compact, delete = [], [], []
+    snapshots = sorted(snapshots, key=lambda item: item[1], reverse=True)
+
+    def bucket_of(taken):
+        age = now - taken
+        if age < timedelta(days=policy.keep_all_days):
+            return None
+        if age < timedelta(days=policy.hourly_days):
+            return taken.replace(minute=0, second=0, microsecond=0)
+        return taken.date()
+
+    representatives = {}
+    for name, taken in snapshots:
+        bucket = bucket_of(taken)
+        if bucket is None:
+            continue
+        current = representatives.get(bucket)
+        if current is None or (name in preferred and current not in preferred):
+            representatives[bucket] = name
+
+    for name, taken in snapshots:
+        age = now - taken
+        if age < timedelta(days=policy.keep_all_days):
+            keep.append(name)
+            continue
+        if policy.daily_days is not None and age >= timedelta(days=policy.daily_days):
+            delete.append(name)
+            continue
+        if representatives[bucket_of(taken)] != name:
+            delete.append(name)
+            continue
+        if age >= timedelta(days=policy.compact_after_days):
+            compact.append(name)
+        else:
+            keep.append(name)
+    return RetentionPlan(keep, compact, delete)
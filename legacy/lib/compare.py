@@ -33,6 +33,29 @@ def _autosize_columns(ws, padding=2, min_width=12, max_width=80):
         ws.column_dimensions[col].width = max(min(w + padding, max_width), min_width)
 
 
+def _is_compacted(data):
+    return isinstance(data, dict) and bool(data.get("compacted"))
+
+
+def _not_compared(host, category, kind, before, after):
+    """Result entry of a host whose snapshots could not be diffed."""
+    return {
+        "item_changes": {
+            category: [{"type": kind, "item": host, "before": before, "after": after}]
+        },
+        "added_items": {
+            "mac_address_table_added": [],
+            "routing_table_added": [],
+            "arp_table_added": [],
+        },
+        "removed_items": {
+            "mac_address_table_removed": [],
+            "routing_table_removed": [],
+            "arp_table_removed": [],
+        },
+    }
+
+
 def compare_snapshots(devices, file1, file2):
     # Prefer hostnames from snapshot JSON instead of inventory.
     with (
@@ -54,24 +77,25 @@ def compare_snapshots(devices, file1, file2):
 
         if before is None or after is None:
             # Mark missing snapshot data in the Excel output.
-            result[host] = {}
-            result[host]["item_changes"] = {}
-            result[host]["item_changes"]["snapshot_missing"] = []
-            result[host]["added_items"] = {}
-            result[host]["added_items"]["mac_address_table_added"] = []
-            result[host]["added_items"]["routing_table_added"] = []
-            result[host]["added_items"]["arp_table_added"] = []
-            result[host]["removed_items"] = {}
-            result[host]["removed_items"]["mac_address_table_removed"] = []
-            result[host]["removed_items"]["routing_table_removed"] = []
-            result[host]["removed_items"]["arp_table_removed"] = []
-            result[host]["item_changes"]["snapshot_missing"].append(
-                {
-                    "type": "missing snapshot",
-                    "item": host,
-                    "before": "present" if before is not None else "missing",
-                    "after": "present" if after is not None else "missing",
-                }
+            result[host] = _not_compared(
+                host,
+                "snapshot_missing",
+                "missing snapshot",
+                "present" if before is not None else "missing",
+                "present" if after is not None else "missing",
+            )
+            no_changes = False
+            continue
+
+        if _is_compacted(before) or _is_compacted(after):
+            # Compacted snapshots (see legacy.lib.snapshot.apply_retention)
+            # only keep a summary; diffing one would report "no changes".
+            result[host] = _not_compared(
+                host,
+                "snapshot_compacted",
+                "compacted snapshot, not compared",
+                "compacted" if _is_compacted(before) else "full",
+                "compacted" if _is_compacted(after) else "full",
             )
             no_changes = False
             continue
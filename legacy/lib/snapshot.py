@@ -14,6 +14,7 @@ from legacy.lib.utils import (
     connect_to_device,
 )
 from legacy.customer_context import get_customer_name
+from inventory.lib.retention import DEFAULT_RETENTION, plan_retention
 from openpyxl import Workbook
 from openpyxl.styles import Alignment
 from openpyxl.utils import get_column_letter
@@ -803,6 +804,77 @@ def health_check(customer_name, data, base_dir, progress_callback=None):
     return health_check_path
 
 
+# Retention rules of the legacy snapshot folders; None keeps everything.
+SNAPSHOT_RETENTION = DEFAULT_RETENTION
+SNAPSHOT_TIMESTAMP_FORMAT = "%Y-%m-%d_%H-%M-%S"
+# Tables dropped from a compacted snapshot; only their sizes are kept.
+SNAPSHOT_TABLES = (
+    "interfaces",
+    "mac_address_table",
+    "routing_table",
+    "arp_table",
+    "logs",
+    "parsed_logs",
+)
+
+
+def compact_device_data(data):
+    """Summary form of one device's snapshot: health check, CRC total, table sizes."""
+    if not data or data.get("compacted"):
+        return data
+    crc_total = 0
+    for intf in data.get("interfaces") or []:
+        try:
+            crc_total += int(str(intf.get("crc", "")).strip())
+        except (AttributeError, ValueError):
+            continue
+    return {
+        "compacted": True,
+        "health_check": data.get("health_check", {}),
+        "crc_total": crc_total,
+        "records": {
+            key: len(data[key]) for key in SNAPSHOT_TABLES if isinstance(data.get(key), list)
+        },
+    }
+
+
+def apply_retention(snapshot_dir, customer_name, policy=SNAPSHOT_RETENTION, now=None):
+    """Compact and prune old snapshots in `snapshot_dir`; returns (compacted, deleted)."""
+    if policy is None or not os.path.isdir(snapshot_dir):
+        return 0, 0
+    prefix = f"{customer_name}_snapshot_"
+    snapshots = []
+    for name in os.listdir(snapshot_dir):
+        if not (name.startswith(prefix) and name.endswith(".json")):
+            continue
+        try:
+            taken = datetime.strptime(name[len(prefix) : -len(".json")], SNAPSHOT_TIMESTAMP_FORMAT)
+        except ValueError:
+            continue
+        snapshots.append((name, taken))
+    plan = plan_retention(snapshots, policy, now)
+
+    compacted = 0
+    for name in plan.compact:
+        path = os.path.join(snapshot_dir, name)
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            console.print(f"[yellow]Could not read {path} for compaction: {e}[/yellow]")
+            continue
+        if all(not dev or dev.get("compacted") for dev in data.values()):
+            continue
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({host: compact_device_data(dev) for host, dev in data.items()}, f, indent=2)
+        os.replace(tmp, path)
+        compacted += 1
+    for name in plan.delete:
+        os.remove(os.path.join(snapshot_dir, name))
+    return compacted, len(plan.delete)
+
+
 def take_snapshot(base_dir=None, progress_callback=None):
     customer_name = get_customer_name()
     devices = load_devices()
@@ -817,7 +889,7 @@ def take_snapshot(base_dir=None, progress_callback=None):
     snapshot_dir = os.path.join(path, "snapshot")
     os.makedirs(snapshot_dir, exist_ok=True)
 
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    timestamp = datetime.now().strftime(SNAPSHOT_TIMESTAMP_FORMAT)
     snapshot_path = os.path.join(
         snapshot_dir, f"{customer_name}_snapshot_{timestamp}.json"
     )
@@ -843,4 +915,15 @@ def take_snapshot(base_dir=None, progress_callback=None):
     health_path = health_check(
         customer_name, result, path, progress_callback=progress_callback
     )
+
+    compacted, deleted = apply_retention(snapshot_dir, customer_name)
+    if compacted or deleted:
+        msg = f"Retention: {compacted} old snapshots compacted, {deleted} deleted"
+        if progress_callback:
+            try:
+                progress_callback(msg)
+            except Exception:
+                pass
+        else:
+            print(msg)
     return snapshot_path, health_path
\ No newline at end of file
@@ -0,0 +1,80 @@
+# AIMD behaviour of the per-controller concurrency limiter.
+
+import time
+import unittest
+
+from aci.api.governor import (
+    SLOW_DECREASE,
+    SLOW_FACTOR,
+    THROTTLE_DECREASE,
+    AdaptiveLimiter,
+    parse_retry_after,
+)
+
+
+class AdaptiveLimiterTest(unittest.TestCase):
+    def request(self, limiter, **release):
+        self.assertTrue(limiter.acquire(timeout=1))
+        limiter.release(**release)
+
+    def test_increase_on_usual_latency(self):
+        limiter = AdaptiveLimiter(initial=4, max_limit=16)
+        # About one slot per round of `limit` requests.
+        for _ in range(5):
+            self.request(limiter, latency=0.1, key="q")
+        self.assertEqual(limiter.metrics()["limit"], 5)
+        for _ in range(500):
+            self.request(limiter, latency=0.1, key="q")
+        self.assertEqual(limiter.metrics()["limit"], 16)
+
+    def test_decrease_on_slow_response(self):
+        limiter = AdaptiveLimiter(initial=10)
+        self.request(limiter, latency=0.1, key="q")
+        before = limiter.limit
+        self.request(limiter, latency=0.1 * SLOW_FACTOR * 2, key="q")
+        self.assertAlmostEqual(limiter.limit, before * SLOW_DECREASE)
+        # Baselines are per kind of query: a slow kind is not slow on its own.
+        before = limiter.limit
+        self.request(limiter, latency=5.0, key="other")
+        self.assertGreater(limiter.limit, before)
+
+    def test_throttle_halves_and_pauses(self):
+        limiter = AdaptiveLimiter(initial=8, min_limit=1)
+        self.request(limiter, throttled=True, retry_after=0.3)
+        metrics = limiter.metrics()
+        self.assertEqual(metrics["limit"], int(8 * THROTTLE_DECREASE))
+        self.assertEqual(metrics["throttled"], 1)
+
+        # No slot is handed out during the Retry-After pause...
+        self.assertFalse(limiter.acquire(timeout=0.05))
+        self.assertEqual(limiter.metrics()["in_flight"], 0)
+        # ...and one is once it has passed.
+        started = time.monotonic()
+        self.assertTrue(limiter.acquire(timeout=2))
+        self.assertGreaterEqual(time.monotonic() - started, 0.15)
+        limiter.release()
+
+    def test_never_below_min_limit(self):
+        limiter = AdaptiveLimiter(initial=4, min_limit=2)
+        for _ in range(5):
+            self.request(limiter, throttled=True, retry_after=0)
+        self.assertEqual(limiter.metrics()["limit"], 2)
+
+    def test_acquire_times_out_when_full(self):
+        limiter = AdaptiveLimiter(initial=1)
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire(timeout=0.05))
+        metrics = limiter.metrics()
+        self.assertEqual((metrics["in_flight"], metrics["queue_depth"]), (1, 0))
+        self.assertEqual(metrics["peak_queue_depth"], 1)
+        limiter.release()
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("2"), 2.0)
+        self.assertEqual(parse_retry_after("-3"), 0.0)
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 1.0)
+        self.assertEqual(parse_retry_after(None), 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
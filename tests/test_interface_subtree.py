@@ -0,0 +1,65 @@
+# Splitting the consolidated l1PhysIf subtree into the per-class snapshot keys.
+
+import unittest
+
+from aci.api.aci_client import INTERFACE_COUNTER_KEYS, split_interface_subtree
+
+PORT = "topology/pod-1/node-101/sys/phys-[eth1/1]"
+
+
+def mo(class_name, children=None, **attrs):
+    body = {"attributes": attrs}
+    if children is not None:
+        body["children"] = children
+    return {class_name: body}
+
+
+class SplitInterfaceSubtreeTest(unittest.TestCase):
+    def test_children_get_their_dn_rebuilt(self):
+        split = split_interface_subtree(
+            [
+                mo(
+                    "l1PhysIf",
+                    [
+                        mo("ethpmPhysIf", rn="phys", operSt="up"),
+                        mo("rmonEtherStats", rn="dbgEtherStats", cRCAlignErrors="3"),
+                        mo("rmonEgrCounters", rn="dbgEgrCounters", bufferdroppkts="0"),
+                        mo("rmonIfOut", rn="dbgIfOut", errors="1"),
+                    ],
+                    dn=PORT,
+                    id="eth1/1",
+                ),
+            ]
+        )
+        self.assertEqual(set(split), set(INTERFACE_COUNTER_KEYS.values()))
+        self.assertEqual(split["interfaces"], [mo("l1PhysIf", dn=PORT, id="eth1/1")])
+        self.assertEqual(split["interface_errors"], [mo("ethpmPhysIf", dn=f"{PORT}/phys", operSt="up")])
+        self.assertEqual(
+            split["crc_errors"], [mo("rmonEtherStats", dn=f"{PORT}/dbgEtherStats", cRCAlignErrors="3")]
+        )
+        self.assertEqual(
+            split["drop_errors"], [mo("rmonEgrCounters", dn=f"{PORT}/dbgEgrCounters", bufferdroppkts="0")]
+        )
+        self.assertEqual(split["output_errors"], [mo("rmonIfOut", dn=f"{PORT}/dbgIfOut", errors="1")])
+
+    def test_child_dn_is_kept_when_present(self):
+        split = split_interface_subtree(
+            [mo("l1PhysIf", [mo("rmonIfOut", dn="x/dbgIfOut", rn="dbgIfOut", errors="0")], dn=PORT)]
+        )
+        self.assertEqual(split["output_errors"], [mo("rmonIfOut", dn="x/dbgIfOut", errors="0")])
+
+    def test_unknown_children_and_childless_ports(self):
+        split = split_interface_subtree(
+            [
+                mo("l1PhysIf", [mo("rmonDot3Stats", rn="dbgDot3Stats", fCSErrors="9")], dn=PORT),
+                mo("l1PhysIf", dn="topology/pod-1/node-101/sys/phys-[eth1/2]"),
+            ]
+        )
+        self.assertEqual(len(split["interfaces"]), 2)
+        self.assertEqual(
+            [key for key, records in split.items() if records], ["interfaces"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+# Retention planning shared by the ACI and legacy snapshot folders.
+
+import unittest
+from datetime import datetime, timedelta
+
+from inventory.lib.retention import DEFAULT_RETENTION, RetentionPolicy, plan_retention
+
+NOW = datetime(2026, 10, 17, 12, 0)
+
+
+def ago(days, hours=0, minutes=0):
+    return NOW - timedelta(days=days, hours=hours, minutes=minutes)
+
+
+class PlanRetentionTest(unittest.TestCase):
+    def plan(self, snapshots, policy=DEFAULT_RETENTION, preferred=()):
+        plan = plan_retention(snapshots, policy, NOW, preferred)
+        return sorted(plan.keep), sorted(plan.compact), sorted(plan.delete)
+
+    def test_recent_snapshots_are_all_kept(self):
+        snapshots = [(f"s{i}", ago(1, minutes=i)) for i in range(5)]
+        self.assertEqual(self.plan(snapshots), ([f"s{i}" for i in range(5)], [], []))
+
+    def test_hourly_buckets_keep_the_newest(self):
+        snapshots = [
+            ("h10a", ago(10, hours=2, minutes=50)),  # 09:10
+            ("h10b", ago(10, hours=2, minutes=20)),  # 09:40
+            ("h11", ago(10, hours=1, minutes=30)),  # 10:30
+        ]
+        self.assertEqual(self.plan(snapshots), (["h10b", "h11"], [], ["h10a"]))
+
+    def test_daily_buckets_are_compacted(self):
+        snapshots = [
+            ("d1-early", ago(40, hours=5)),
+            ("d1-late", ago(40, hours=1)),
+            ("d2", ago(41, hours=1)),
+        ]
+        self.assertEqual(self.plan(snapshots), ([], ["d1-late", "d2"], ["d1-early"]))
+
+    def test_past_daily_days_are_deleted(self):
+        snapshots = [("old", ago(400)), ("kept", ago(2))]
+        self.assertEqual(self.plan(snapshots), (["kept"], [], ["old"]))
+        forever = DEFAULT_RETENTION._replace(daily_days=None)
+        self.assertEqual(self.plan(snapshots, forever), (["kept"], ["old"], []))
+
+    def test_preferred_snapshot_represents_its_bucket(self):
+        snapshots = [
+            ("full", ago(10, hours=2, minutes=55)),  # 09:05
+            ("counters", ago(10, hours=2, minutes=20)),  # 09:40
+        ]
+        self.assertEqual(self.plan(snapshots), (["counters"], [], ["full"]))
+        self.assertEqual(
+            self.plan(snapshots, preferred={"full"}), (["full"], [], ["counters"])
+        )
+
+    def test_newest_preferred_wins_in_daily_buckets(self):
+        snapshots = [
+            ("full-a", ago(40, hours=6)),
+            ("full-b", ago(40, hours=4)),
+            ("counters", ago(40, hours=1)),
+        ]
+        self.assertEqual(
+            self.plan(snapshots, preferred={"full-a", "full-b"}),
+            ([], ["full-b"], ["counters", "full-a"]),
+        )
+
+    def test_custom_policy(self):
+        policy = RetentionPolicy(keep_all_days=1, hourly_days=2, daily_days=5, compact_after_days=3)
+        snapshots = [
+            ("keep", ago(0, hours=2)),
+            ("hourly", ago(1, hours=2)),
+            ("daily", ago(4)),
+            ("gone", ago(6)),
+        ]
+        self.assertEqual(self.plan(snapshots, policy), (["hourly", "keep"], ["daily"], ["gone"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
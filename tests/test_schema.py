@@ -0,0 +1,110 @@
+# Upgrading version 1 snapshot data (raw imdata wrappers) to schema records.
+
+import unittest
+
+from aci.snapshot.schema import SCHEMA_VERSION, normalize_section, route_dn, upgrade
+
+PORT = "topology/pod-1/node-101/sys/phys-[eth1/1]"
+ROUTE = "topology/pod-1/node-101/sys/uribv4/dom-tn:vrf/db-rt/rt-[10.0.0.0/24]"
+
+
+def mo(class_name, **attrs):
+    return {class_name: {"attributes": attrs}}
+
+
+V1 = {
+    "fabric_health": 95,
+    "faults": [
+        mo(
+            "faultInst",
+            dn="topology/pod-1/node-101/fault-F1",
+            code="F1",
+            created="2026-10-01",
+            severity="critical",
+            descr="d",
+        ),
+        mo("faultInst", code="F2"),
+    ],
+    "interfaces": [mo("l1PhysIf", dn=PORT, id="eth1/1", descr="uplink", switchingSt="enabled")],
+    "interface_errors": [mo("ethpmPhysIf", dn=f"{PORT}/phys", operSt="up", operStQual="none")],
+    "crc_errors": [
+        mo("rmonEtherStats", dn=f"{PORT}/dbgEtherStats", cRCAlignErrors="7"),
+        # Aggregate counters have no physical port to compare against.
+        mo("rmonEtherStats", dn="topology/pod-1/node-101/sys/aggr-[po1]/dbgEtherStats", cRCAlignErrors="1"),
+    ],
+    "drop_errors": [mo("rmonEgrCounters", dn=f"{PORT}/dbgEgrCounters", bufferdroppkts="")],
+    "output_errors": [mo("rmonIfOut", dn=f"{PORT}/dbgIfOut", errors="2")],
+    "urib_routes": [mo("uribv4Route", dn=ROUTE), mo("uribv4Route", dn="odd/route")],
+    "path_ep": [
+        {
+            "fabricPathEp": {
+                "attributes": {"dn": "topology/pod-1/paths-101/pathep-[eth1/1]"},
+                "children": [mo("fabricRsPathToIf", tDn="x")],
+            }
+        }
+    ],
+    "pc_aggr": [
+        {
+            "pcAggrIf": {
+                "attributes": {"dn": "topology/pod-1/node-101/sys/aggr-[po1]", "id": "po1", "name": "pc1"},
+                "children": [mo("pcRsMbrIfs", tDn=PORT)],
+            }
+        }
+    ],
+    "endpoints": [{"mac": "00:00:00:00:00:01", "ip": "10.0.0.1"}],
+}
+
+
+class UpgradeTest(unittest.TestCase):
+    def test_v1_sections_become_records(self):
+        data = upgrade(V1)
+        self.assertEqual(data["schema"], SCHEMA_VERSION)
+        self.assertEqual(data["fabric_health"], 95)
+        self.assertEqual(
+            data["faults"],
+            [
+                {
+                    "dn": "topology/pod-1/node-101/fault-F1",
+                    "code": "F1",
+                    "created": "2026-10-01",
+                    "severity": "critical",
+                    "descr": "d",
+                }
+            ],
+        )
+        self.assertEqual(
+            data["interfaces"],
+            [{"node": 101, "port": "eth1/1", "descr": "uplink", "switching": "enabled"}],
+        )
+        self.assertEqual(
+            data["interface_errors"], [{"node": 101, "port": "eth1/1", "oper": "up", "qual": "none"}]
+        )
+        self.assertEqual(data["crc_errors"], [{"node": 101, "port": "eth1/1", "crc": 7}])
+        self.assertEqual(data["drop_errors"], [{"node": 101, "port": "eth1/1", "drops": 0}])
+        self.assertEqual(data["output_errors"], [{"node": 101, "port": "eth1/1", "errors": 2}])
+        self.assertEqual(
+            data["urib_routes"],
+            [{"pod": 1, "node": 101, "vrf": "tn:vrf", "prefix": "10.0.0.0/24"}, {"dn": "odd/route"}],
+        )
+        self.assertEqual([route_dn(record) for record in data["urib_routes"]], [ROUTE, "odd/route"])
+        self.assertEqual(
+            data["path_ep"], [{"pod": 1, "node": "101", "port": "eth1/1", "targets": ["x"]}]
+        )
+        self.assertEqual(
+            data["pc_aggr"], [{"node": 101, "port": "po1", "name": "pc1", "members": [PORT]}]
+        )
+        # Already records in version 1.
+        self.assertEqual(data["endpoints"], V1["endpoints"])
+
+    def test_current_schema_is_left_alone(self):
+        data = upgrade(V1)
+        self.assertIs(upgrade(data), data)
+        self.assertEqual(upgrade({}), {})
+        self.assertIsNone(upgrade(None))
+
+    def test_unknown_sections_are_kept_as_collected(self):
+        self.assertEqual(normalize_section("vendor_extra", [mo("x", a="1")]), [mo("x", a="1")])
+
+
+if __name__ == "__main__":
+    unittest.main()
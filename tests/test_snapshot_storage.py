@@ -0,0 +1,155 @@
+# Snapshot storage: blob store and its GC, resumable writer, and catalog
+# section offsets as used by SnapshotReader.
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from aci.snapshot import catalog, storage
+from aci.snapshot.reader import SnapshotReader
+from aci.snapshot.schema import SCHEMA_VERSION
+
+
+def fabric(health, faults):
+    return {
+        "schema": SCHEMA_VERSION,
+        "fabric_health": health,
+        "faults": [
+            {"dn": f"topology/pod-1/node-101/fault-{code}", "code": code, "severity": "critical"}
+            for code in faults
+        ],
+        "urib_routes": [{"dn": "topology/pod-1/node-101/sys/uribv4/dom-t:v/db-rt/rt-[10.0.0.0/24]"}],
+    }
+
+
+class SnapshotStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def blobs(self):
+        store = os.path.join(self.folder, storage.BLOB_DIR)
+        return {
+            name.split(".", 1)[0]
+            for prefix in os.listdir(store)
+            for name in os.listdir(os.path.join(store, prefix))
+        }
+
+    def age(self, digests, seconds):
+        then = time.time() - seconds
+        for digest in digests:
+            os.utime(storage.blob_path(os.path.join(self.folder, storage.BLOB_DIR), digest), (then, then))
+
+    def test_unchanged_sections_are_stored_once(self):
+        first = self.path("C_snapshot_2026-10-01T10-00.manifest.json")
+        second = self.path("C_snapshot_2026-10-01T11-00.manifest.json")
+        storage.write_snapshot(first, {"apic1": fabric(90, ["F1"])})
+        storage.write_snapshot(second, {"apic1": fabric(95, ["F1", "F2"])})
+
+        before = storage.section_digests(first)["apic1"]
+        after = storage.section_digests(second)["apic1"]
+        self.assertEqual(before["urib_routes"], after["urib_routes"])
+        self.assertNotEqual(before["faults"], after["faults"])
+        self.assertEqual(len(self.blobs()), 3)
+        self.assertEqual(storage.load_snapshot(second), {"apic1": fabric(95, ["F1", "F2"])})
+
+    def test_gc_keeps_referenced_and_recent_blobs(self):
+        old = self.path("C_snapshot_2026-10-01T10-00.manifest.json")
+        new = self.path("C_snapshot_2026-10-01T11-00.manifest.json")
+        storage.write_snapshot(old, {"apic1": fabric(90, ["F1"])})
+        storage.write_snapshot(new, {"apic1": fabric(95, ["F2"])})
+        only_old = storage.section_digests(old)["apic1"]["faults"]
+        shared = storage.section_digests(old)["apic1"]["urib_routes"]
+
+        os.remove(old)
+        # Unreferenced but within the grace period: kept.
+        self.assertEqual(storage.gc_blobs(self.folder)[0], 0)
+        self.assertIn(only_old, self.blobs())
+
+        self.age(self.blobs(), storage.GC_GRACE_SECONDS + 60)
+        removed, freed = storage.gc_blobs(self.folder)
+        self.assertEqual(removed, 1)
+        self.assertGreater(freed, 0)
+        self.assertNotIn(only_old, self.blobs())
+        self.assertIn(shared, self.blobs())
+
+    def test_gc_keeps_blobs_of_partial_snapshots(self):
+        path = self.path("C_snapshot_2026-10-01T12-00.manifest.json")
+        writer = storage.SnapshotWriter(path)
+        writer.add("apic1", fabric(90, ["F7"]))
+        self.age(self.blobs(), storage.GC_GRACE_SECONDS + 60)
+
+        self.assertEqual(storage.gc_blobs(self.folder), (0, 0))
+        writer.finish()
+        self.assertEqual(storage.load_snapshot(path), {"apic1": fabric(90, ["F7"])})
+
+    def test_writer_resumes_after_interruption(self):
+        path = self.path("C_snapshot_2026-10-01T12-00.json.gz")
+        writer = storage.SnapshotWriter(path)
+        writer.add("apic1", fabric(90, ["F1"]), {"valid": True})
+        writer.add("apic2", fabric(80, ["F2"]), {"valid": False})
+        # A crash in the middle of the third fabric's line.
+        with open(writer.partial, "ab") as f:
+            f.write(b'{"hostname":"apic3","summary":null,"data":{"fab')
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(storage.partial_snapshots(self.folder), [path])
+
+        resumed = storage.SnapshotWriter(path)
+        self.assertEqual(resumed.captured(), {"apic1": {"valid": True}, "apic2": {"valid": False}})
+        resumed.add("apic3", fabric(70, ["F3"]), {"valid": True})
+        final, layout, summaries = resumed.finish(order=["apic3", "apic2", "apic1"])
+
+        self.assertEqual(final, path)
+        self.assertFalse(os.path.exists(resumed.partial))
+        self.assertEqual(list(summaries), ["apic3", "apic2", "apic1"])
+        data = storage.load_snapshot(path)
+        self.assertEqual(list(data), ["apic3", "apic2", "apic1"])
+        self.assertEqual(data["apic3"], fabric(70, ["F3"]))
+        self.assertIn(("apic1", "faults"), layout)
+
+    def test_catalog_offsets_read_back_through_reader(self):
+        path = self.path("C_snapshot_2026-10-01T12-00.json.gz")
+        fabrics = {"apic1": fabric(90, ["F1"]), "apic2": fabric(80, ["F2", "F3"])}
+        layout = {}
+        storage.write_snapshot(path, fabrics, layout)
+        catalog.add_snapshot(
+            path, {hostname: catalog.summarize(data) for hostname, data in fabrics.items()}, layout
+        )
+
+        offsets = catalog.stream_offsets(path)
+        self.assertEqual(list(offsets), ["apic1", "apic2"])
+        offset, length = offsets["apic2"]["faults"]
+        self.assertEqual(
+            json.loads(storage.read_range(path, offset, length)), fabrics["apic2"]["faults"]
+        )
+
+        reader = SnapshotReader(path)
+        self.assertIsNone(reader._data)
+        self.assertEqual(reader.fabrics(), ["apic1", "apic2"])
+        for hostname, data in fabrics.items():
+            self.assertEqual(dict(reader.fabric(hostname)), data)
+        self.assertEqual(dict(reader.fabric("apic9")), {})
+
+    def test_stale_offsets_are_not_used(self):
+        path = self.path("C_snapshot_2026-10-01T12-00.json.gz")
+        layout = {}
+        storage.write_snapshot(path, {"apic1": fabric(90, ["F1"])}, layout)
+        catalog.add_snapshot(path, {"apic1": catalog.summarize(fabric(90, ["F1"]))}, layout)
+        # Rewritten behind the catalog's back: the recorded offsets no longer apply.
+        storage.write_snapshot(path, {"apic1": fabric(95, ["F1", "F2", "F3"])})
+        os.utime(path, (time.time() + 5, time.time() + 5))
+
+        self.assertIsNone(catalog.stream_offsets(path))
+        self.assertEqual(dict(SnapshotReader(path).fabric("apic1")), fabric(95, ["F1", "F2", "F3"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+# Incremental imdata decoding of APIC responses split into arbitrary chunks.
+
+import json
+import unittest
+
+from aci.api.stream import iter_imdata
+
+IMDATA = [
+    {"fvCEp": {"attributes": {"dn": "uni/tn-t/ap-a/epg-e/cep-00:00:00:00:00:01", "descr": "café"}}},
+    {"fvCEp": {"attributes": {"dn": "uni/tn-t/ap-a/epg-e/cep-00:00:00:00:00:02", "descr": "[x], {y}"}}},
+    {"fvCEp": {"attributes": {"dn": "uni/tn-t/ap-a/epg-e/cep-00:00:00:00:00:03"}, "children": []}},
+]
+
+
+def chunked(body, size):
+    data = body.encode()
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+class IterImdataTest(unittest.TestCase):
+    def test_every_chunk_size(self):
+        body = json.dumps({"totalCount": "3", "imdata": IMDATA}, ensure_ascii=False)
+        # Size 1 also splits the multi-byte "é" across chunks.
+        for size in (1, 2, 3, 7, 64, len(body)):
+            with self.subTest(size=size):
+                self.assertEqual(list(iter_imdata(chunked(body, size))), IMDATA)
+
+    def test_imdata_key_placed_late(self):
+        body = json.dumps(
+            {"totalCount": "3", "padding": "x" * 5000, "imdata": IMDATA}, ensure_ascii=False
+        )
+        for size in (5, 4096):
+            with self.subTest(size=size):
+                self.assertEqual(list(iter_imdata(chunked(body, size))), IMDATA)
+
+    def test_key_split_across_chunks(self):
+        body = '{"totalCount": "1", "imdata": [{"a": {"attributes": {}}}]}'
+        split = body.index("imdata") + 3
+        chunks = [body[:split].encode(), body[split:].encode()]
+        self.assertEqual(list(iter_imdata(chunks)), [{"a": {"attributes": {}}}])
+
+    def test_empty_and_missing_imdata(self):
+        self.assertEqual(list(iter_imdata([b'{"totalCount": "0", "imdata": []}'])), [])
+        self.assertEqual(list(iter_imdata([b'{"totalCount": "0"}'])), [])
+
+    def test_truncated_array(self):
+        body = json.dumps({"imdata": IMDATA})[:-20]
+        with self.assertRaises(ValueError):
+            list(iter_imdata(chunked(body, 16)))
+
+
+if __name__ == "__main__":
+    unittest.main()
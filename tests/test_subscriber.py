@@ -0,0 +1,184 @@
+# FabricSubscriber against a local APIC stand-in.
+#
+# The stand-in serves the REST class queries over plain HTTP and the event
+# channel as a websocket on the same port (/socket<token>), like an APIC
+# does over HTTPS. On connect it replays recorded events, which reach the
+# subscriber while it is still loading the subscribed classes.
+
+import base64
+import hashlib
+import json
+import struct
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from aci.api import cache
+from aci.api.aci_client import APICClient
+from aci.snapshot.subscriber import FabricSubscriber
+
+TOKEN = "test-token"
+WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+CEP_DN = "uni/tn-t/ap-a/epg-e/cep-00:00:00:00:00:01"
+
+
+def mo(class_name, **attrs):
+    return {class_name: {"attributes": attrs}}
+
+
+CLASSES = {
+    "fvAEPg": [mo("fvAEPg", dn="uni/tn-t/ap-a/epg-e", descr="EPG E")],
+    "faultInst": [
+        mo("faultInst", dn="topology/pod-1/node-101/fault-F1", code="F1", severity="critical"),
+        mo("faultInst", dn="topology/pod-1/node-101/fault-F2", code="F2", severity="critical"),
+    ],
+    "fvCEp": [
+        mo(
+            "fvCEp",
+            dn=CEP_DN,
+            mac="00:00:00:00:00:01",
+            encap="vlan-10",
+            fabricPathDn="topology/pod-1/paths-101/pathep-[eth1/1]",
+        )
+    ],
+    "fvIp": [mo("fvIp", dn=f"{CEP_DN}/ip-[10.0.0.1]", addr="10.0.0.1")],
+}
+
+# Events as the APIC sends them: F1 cleared, F2 downgraded, F9 raised and
+# a second IP learned on the endpoint.
+RECORDED_EVENTS = [
+    {
+        "subscriptionId": ["1"],
+        "imdata": [
+            mo("faultInst", dn="topology/pod-1/node-101/fault-F1", status="deleted"),
+            mo("faultInst", dn="topology/pod-1/node-101/fault-F2", status="modified", severity="major"),
+            mo(
+                "faultInst",
+                dn="topology/pod-1/node-102/fault-F9",
+                status="created",
+                code="F9",
+                severity="critical",
+            ),
+        ],
+    },
+    {
+        "subscriptionId": ["3"],
+        "imdata": [mo("fvIp", dn=f"{CEP_DN}/ip-[10.0.0.2]", addr="10.0.0.2", status="created")],
+    },
+]
+
+
+class StandInAPIC(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    subscriptions = []
+    refreshes = []
+    closing = threading.Event()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == f"/socket{TOKEN}":
+            return self.event_channel()
+        query = parse_qs(url.query)
+        if url.path == "/api/subscriptionRefresh.json":
+            self.refreshes.append(query["id"][0])
+            return self.reply({"imdata": []})
+        class_name = url.path.rsplit("/", 1)[-1].split(".")[0]
+        body = {"totalCount": str(len(CLASSES[class_name])), "imdata": CLASSES[class_name]}
+        if query.get("subscription") == ["yes"]:
+            self.subscriptions.append(class_name)
+            body["subscriptionId"] = str(len(self.subscriptions))
+        self.reply(body)
+
+    def reply(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def event_channel(self):
+        key = self.headers["Sec-WebSocket-Key"].encode()
+        self.send_response(101)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header(
+            "Sec-WebSocket-Accept", base64.b64encode(hashlib.sha1(key + WS_GUID).digest()).decode()
+        )
+        self.end_headers()
+        for event in RECORDED_EVENTS:
+            payload = json.dumps(event).encode()
+            if len(payload) < 126:
+                header = bytes([0x81, len(payload)])
+            else:
+                header = bytes([0x81, 126]) + struct.pack(">H", len(payload))
+            self.wfile.write(header + payload)
+        self.wfile.flush()
+        self.closing.wait(10)
+        self.close_connection = True
+
+
+class FabricSubscriberTest(unittest.TestCase):
+    def setUp(self):
+        self.caching = cache.RESPONSE_CACHE
+        cache.RESPONSE_CACHE = False
+        StandInAPIC.subscriptions = []
+        StandInAPIC.refreshes = []
+        StandInAPIC.closing = threading.Event()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInAPIC)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        host, port = self.server.server_address
+        self.client = APICClient(f"{host}:{port}", cookies={"APIC-cookie": TOKEN}, scheme="http")
+        self.subscriber = FabricSubscriber(self.client, refresh_interval=0.1)
+
+    def tearDown(self):
+        self.subscriber.stop()
+        StandInAPIC.closing.set()
+        self.server.shutdown()
+        self.server.server_close()
+        self.client.close()
+        cache.RESPONSE_CACHE = self.caching
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            snapshot = self.subscriber.snapshot()
+            if condition(snapshot):
+                return snapshot
+            time.sleep(0.05)
+        self.fail(f"State never converged: {self.subscriber.snapshot()}")
+
+    def test_ws_url_follows_client_scheme(self):
+        host, port = self.server.server_address
+        self.assertEqual(self.subscriber.ws_url(), f"ws://{host}:{port}/socket{TOKEN}")
+
+    def test_replayed_events_update_state(self):
+        self.subscriber.start()
+        self.assertEqual(StandInAPIC.subscriptions, ["faultInst", "fvCEp", "fvIp"])
+
+        snapshot = self.wait_for(lambda s: len(s["endpoints"]) == 2)
+        self.assertEqual(
+            [fault["dn"] for fault in snapshot["faults"]],
+            ["topology/pod-1/node-102/fault-F9"],
+        )
+        self.assertEqual(
+            sorted((ep["ip"], ep["node"], ep["interface"], ep["epg_descr"]) for ep in snapshot["endpoints"]),
+            [("10.0.0.1", "101", "eth1/1", "EPG E"), ("10.0.0.2", "101", "eth1/1", "EPG E")],
+        )
+
+        # Subscriptions are kept alive while the subscriber runs.
+        deadline = time.monotonic() + 5
+        while len(set(StandInAPIC.refreshes)) < 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(set(StandInAPIC.refreshes), {"1", "2", "3"})
+
+
+if __name__ == "__main__":
+    unittest.main()